@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class AssembleConfig(AppConfig):
     name = 'assemble'
+
+    def ready(self):
+        # connects the receivers that record history, whether or not anything imports it
+        from . import history
@@ -0,0 +1,272 @@
+import io
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.core.handlers.base import BaseHandler
+from django.db import close_old_connections
+from django.http import HttpResponse,JsonResponse,HttpResponseNotAllowed
+from django.urls import resolve,Resolver404
+from . import history,realtime
+from .forms import ComponentEditForm,ProjectTaskCreateForm
+from .boards import get_board_payload
+from .models import Project,ProjectComponent,get_project_changes
+from .profiles import get_profile
+from .routers import read_from_replica
+from .views import _task_state,_board_client,_since_version
+
+
+"""
+Async versions of the small JSON endpoints the project board calls most often.
+
+Django 3.0 only runs sync views, under ASGI each one holds a thread from the moment the request comes in
+until the response has gone out. async_application sits in front of Django in core/asgi.py and answers
+the URLs in ASYNC_VIEWS itself: the request is read and the response written on the event loop, and only
+the database work, together with settings.MIDDLEWARE, runs in the thread pool with one hop per request.
+
+The views behave like their sync versions in views.py, which still answer under WSGI, except that they
+only touch tasks in projects the user works on. History is queued in the request whatever HISTORY_WRITE_MODE
+is and written after the response has been sent, see serve. What is still queued when the server shuts down
+is written before it is told shutdown is complete, see lifespan.
+"""
+
+
+def database_sync_to_async(function):
+    """
+    Runs a function that uses the database in the thread pool, with the connection housekeeping
+    Django does at the start and end of a request.
+    """
+    def run(*args,**kwargs):
+        close_old_connections()
+        try:
+            return function(*args,**kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run,thread_sensitive=False)
+
+
+def _error(message,status):
+    return JsonResponse({"error":message},status=status)
+
+
+class MiddlewareHandler(BaseHandler):
+    """
+    Runs a view through settings.MIDDLEWARE the way Django's own handler does, without resolving the URL again.
+    The view's arguments are taken from request.view_arguments.
+    """
+
+    def __init__(self,view):
+        super().__init__()
+        self.view = view
+        self.load_middleware()
+
+    def _get_response(self,request):
+        args,kwargs = request.view_arguments
+        # CsrfViewMiddleware checks the token here
+        for middleware_method in self._view_middleware:
+            response = middleware_method(request,self.view,args,kwargs)
+            if response:
+                return response
+        return self.view(request,*args,**kwargs)
+
+
+def database_view(function):
+    """
+    Turns the database part of a view into a coroutine run in the thread pool. The request goes through the
+    middleware in the same hop, so it is authenticated, its reads are routed and its changes are put on the user
+    like any other request's, and the user has to be signed in. The history it records is left for serve to write.
+    """
+    handler = MiddlewareHandler(login_required(function))
+
+    @database_sync_to_async
+    def run(request,*args,**kwargs):
+        request.view_arguments = (args,kwargs)
+        token = history.defer_writes()
+        try:
+            return handler.get_response(request)
+        finally:
+            history.reset_deferred_writes(token)
+    return run
+
+
+def _get_task(request,pk):
+    if not str(pk).isdigit():
+        return None
+    return (ProjectComponent.objects.filter(pk=pk,project__user=get_profile(request))
+            .select_related('project').first())
+
+
+@database_view
+def _toggle_task(request,pk):
+    task = _get_task(request,pk)
+    if task is None:
+        return _error("Task does not exist.",404)
+    task.completed = not task.completed
+    task.save()
+    realtime.publish_tasks(task.project_id,[_task_state(task)],_board_client(request))
+    return JsonResponse({'name':task.name})
+
+async def finish_task_ajax(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return await _toggle_task(request,request.GET.get('pk'))
+
+
+@database_view
+def _rename_task(request,contents):
+    component = _get_task(request,contents.pop('pk',None))
+    if component is None:
+        return _error("Task does not exist.",404)
+    form = ComponentEditForm(contents,instance=component)
+    if not form.is_valid():
+        return JsonResponse({"errors":form.errors},status=400)
+    form.save()
+    realtime.publish_tasks(component.project_id,[_task_state(component)],_board_client(request))
+    return JsonResponse({'name':form.instance.name})
+
+async def edit_task_ajax(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    return await _rename_task(request,request.POST.dict())
+
+
+@database_view
+def _delete_task(request,pk):
+    task = _get_task(request,pk)
+    if task is None:
+        return _error("Task does not exist.",404)
+    state = _task_state(task,deleted=True)
+    task.delete()
+    realtime.publish_tasks(task.project_id,[state],_board_client(request))
+    return JsonResponse({'name':task.name})
+
+async def delete_task_ajax(request):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return await _delete_task(request,request.GET.get('pk'))
+
+
+@database_view
+def _add_task(request,contents):
+    component = _get_task(request,contents.pop('pk',None))
+    if component is None:
+        return _error("Component does not exist.",404)
+    form = ProjectTaskCreateForm(contents)
+    if not form.is_valid():
+        return JsonResponse({"errors":form.errors},status=400)
+    new_task = form.save(commit=False)
+    new_task.task = component
+    new_task.project = component.project
+    new_task.save()
+    realtime.publish_tasks(new_task.project_id,[_task_state(new_task)],_board_client(request))
+    return JsonResponse({"id":new_task.id,"name":new_task.name})
+
+async def add_task_ajax(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    return await _add_task(request,request.POST.dict())
+
+
+@database_view
+@read_from_replica
+def _project_tasks(request,project_slug):
+    project = Project.objects.filter(user=get_profile(request),slug=project_slug).first()
+    if project is None:
+        return _error("Project does not exist.",404)
+    return HttpResponse(get_board_payload(project),content_type='application/json')
+
+async def project_detail_ajax(request,project_slug):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return await _project_tasks(request,project_slug)
+
+
+@database_view
+@read_from_replica
+def _project_changes(request,project_slug):
+    project = Project.objects.filter(user=get_profile(request),slug=project_slug).first()
+    if project is None:
+        return _error("Project does not exist.",404)
+    return JsonResponse(get_project_changes(project,_since_version(request)))
+
+async def project_changes_ajax(request,project_slug):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return await _project_changes(request,project_slug)
+
+
+ASYNC_VIEWS = {
+    'finish-task-ajax':finish_task_ajax,
+    'edit-task-ajax':edit_task_ajax,
+    'delete-task-ajax':delete_task_ajax,
+    'create-task-ajax':add_task_ajax,
+    'project-detail-ajax':project_detail_ajax,
+    'project-changes-ajax':project_changes_ajax,
+}
+
+
+async def _read_body(receive):
+    body = io.BytesIO()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.write(message.get('body',b''))
+        if not message.get('more_body',False):
+            body.seek(0)
+            return body
+
+
+async def _send_response(response,send):
+    headers = [(name.lower().encode('latin1'),value.encode('latin1')) for name,value in response.items()]
+    headers += [(b'set-cookie',cookie.output(header='').strip().encode('latin1')) for cookie in response.cookies.values()]
+    await send({'type':'http.response.start','status':response.status_code,'headers':headers})
+    await send({'type':'http.response.body','body':response.content})
+
+
+async def serve(scope,receive,send,view,kwargs):
+    body = await _read_body(receive)
+    if body is None:
+        return
+    response = await view(ASGIRequest(scope,body),**kwargs)
+    await _send_response(response,send)
+    # the client has its response, queued history can be written now without holding it up
+    if history.writer.pending():
+        await database_sync_to_async(history.flush)()
+
+
+async def lifespan(receive,send):
+    """
+    Answers the ASGI server's startup and shutdown messages, which Django 3.0 turns away.
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type':'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await history.flush_history_on_shutdown()
+            except Exception as error:
+                await send({'type':'lifespan.shutdown.failed','message':str(error)})
+            else:
+                await send({'type':'lifespan.shutdown.complete'})
+            return
+
+
+def async_application(application):
+    """
+    Wraps an ASGI application and answers the URLs in ASYNC_VIEWS with their async views, and the lifespan messages.
+
+    :param application: The ASGI application every other request goes to.
+    """
+    async def app(scope,receive,send):
+        if scope['type'] == 'lifespan':
+            return await lifespan(receive,send)
+        if scope['type'] == 'http':
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name in ASYNC_VIEWS:
+                return await serve(scope,receive,send,ASYNC_VIEWS[match.url_name],match.kwargs)
+        return await application(scope,receive,send)
+    return app
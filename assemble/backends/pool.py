@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+import time
+from django.db.utils import OperationalError
+
+
+"""
+A bounded pool of database connections, shared by the threads of one process.
+
+Django 3.0 opens a connection the first time a request uses the database and closes it when the request
+ends. The postgresql_pool backend (see postgresql_pool/base.py) takes its connections from a pool instead
+and gives them back when Django closes them, so a request pays for a checkout rather than a TCP connect,
+TLS and authentication round trip.
+
+    checkout - takes the most recently returned idle connection, opens a new one while fewer than max_size
+        are open, or waits up to timeout seconds for one to come back and raises PoolTimeout after that.
+        A connection idle for longer than check_idle seconds is pinged before it is handed out, one that
+        fails the check is dropped and the next one is tried.
+    checkin - cleans the connection up for the next user, connections that can't be cleaned up and ones
+        older than max_lifetime seconds are closed instead.
+
+Each process only ever holds max_size connections, so the server sees at most workers * max_size of them.
+A pool made before a fork (gunicorn --preload) is left to the parent, the child starts its own.
+
+stats() reports how many checkouts had to wait and for how long, a checkout that waits longer than
+slow_wait seconds is logged.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+
+    def __init__(self,connect,check,reset,close,max_size=10,max_lifetime=3600,timeout=10,check_idle=30,slow_wait=0.1):
+        """
+        :param connect: Opens a new connection.
+        :param check: Returns whether a connection still works.
+        :param reset: Gets a returned connection ready for reuse, returns False if it can't.
+        :param close: Closes a connection, errors are ignored.
+        """
+        self.connect = connect
+        self.check = check
+        self.reset = reset
+        self.close = close
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.slow_wait = slow_wait
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (connection,opened at,returned at), the most recently returned last
+        self._idle = []
+        # opened at, by id of the connections that are checked out
+        self._opened = {}
+        self._size = 0
+        self._closed = False
+        self._stats = {'checkouts':0,'waits':0,'wait_time':0.0,'max_wait':0.0,'timeouts':0,
+                       'opened':0,'recycled':0,'failed_checks':0,'discarded':0}
+
+    def checkout(self):
+        start = time.monotonic()
+        waited = False
+        while True:
+            connection,opened_at,returned_at,open_new = None,None,None,False
+            with self._condition:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection came free in {self.timeout} seconds, "
+                                          f"all {self.max_size} are in use.")
+                    waited = True
+                    self._condition.wait(remaining)
+                if self._idle:
+                    connection,opened_at,returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    open_new = True
+            if open_new:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                opened_at = time.monotonic()
+                self._count('opened')
+            elif time.monotonic() - opened_at >= self.max_lifetime:
+                self._count('recycled')
+                self._drop(connection)
+                continue
+            elif time.monotonic() - returned_at >= self.check_idle and not self.check(connection):
+                self._count('failed_checks')
+                self._drop(connection)
+                continue
+            self._checked_out(connection,opened_at,time.monotonic() - start if waited else None)
+            return connection
+
+    def checkin(self,connection):
+        with self._condition:
+            opened_at = self._opened.pop(id(connection),None)
+        if opened_at is None:
+            # not one of ours, e.g. handed out by the pool of the parent process
+            self.close(connection)
+            return
+        if self._closed:
+            self._drop(connection)
+        elif time.monotonic() - opened_at >= self.max_lifetime:
+            self._count('recycled')
+            self._drop(connection)
+        elif not self.reset(connection):
+            self._drop(connection)
+        else:
+            with self._condition:
+                self._idle.append((connection,opened_at,time.monotonic()))
+                self._condition.notify()
+
+    def discard(self,connection):
+        """
+        Closes a checked out connection instead of giving it back.
+        """
+        with self._condition:
+            known = self._opened.pop(id(connection),None) is not None
+        if known:
+            self._count('discarded')
+            self._drop(connection)
+        else:
+            self.close(connection)
+
+    def close_all(self):
+        """
+        Closes the idle connections, checked out ones are closed when they come back.
+        """
+        with self._condition:
+            idle,self._idle = self._idle,[]
+            self._closed = True
+        for connection,_,_ in idle:
+            self._drop(connection)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats,size=self._size,idle=len(self._idle),max_size=self.max_size)
+        stats['average_wait'] = stats['wait_time'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+    def _checked_out(self,connection,opened_at,wait):
+        with self._condition:
+            self._opened[id(connection)] = opened_at
+            self._stats['checkouts'] += 1
+            if wait is not None:
+                self._stats['waits'] += 1
+                self._stats['wait_time'] += wait
+                self._stats['max_wait'] = max(self._stats['max_wait'],wait)
+        if wait is not None and wait >= self.slow_wait:
+            logger.warning("Waited %.3f seconds for a database connection, all %d were in use.",wait,self.max_size)
+
+    def _drop(self,connection):
+        self.close(connection)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _count(self,name):
+        with self._condition:
+            self._stats[name] += 1
@@ -0,0 +1,131 @@
+import os
+import threading
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper,Database
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgresDatabaseCreation
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from ..pool import ConnectionPool
+
+
+"""
+The postgresql backend with its connections kept in a ConnectionPool, see assemble/backends/pool.py.
+
+Set up in core/settings.py when DB_POOL_SIZE isn't 0, the pool's settings are in DATABASES['default']['POOL']:
+    MAX_SIZE - connections one process holds at most.
+    MAX_LIFETIME - seconds before a connection is closed and replaced, so server side memory doesn't grow for good.
+    TIMEOUT - seconds a request waits for a free connection before it fails.
+    CHECK_IDLE - seconds a connection can sit idle before it is pinged on checkout, 0 pings every time.
+
+CONN_MAX_AGE should stay 0: Django "closes" the connection at the end of every request, which gives it back.
+"""
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _connect(conn_params,options):
+    connection = Database.connect(**conn_params)
+    # what the postgresql backend does on connect, the pool hands the connection to many wrappers later
+    if 'isolation_level' in options and options['isolation_level'] != connection.isolation_level:
+        connection.set_session(isolation_level=options['isolation_level'])
+    return connection
+
+
+def _check(connection):
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+def _reset(connection):
+    if connection.closed:
+        return False
+    try:
+        if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        # Django sets autocommit on checkout anyway, a connection left without it would hold a transaction open
+        connection.autocommit = True
+    except Database.Error:
+        return False
+    return connection.get_transaction_status() == TRANSACTION_STATUS_IDLE
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Database.Error:
+        pass
+
+
+def get_pool(settings_dict,conn_params):
+    """
+    :return: This process's pool for the database the connection parameters point at.
+    """
+    key = (settings_dict['NAME'],tuple(sorted((name,str(value)) for name,value in conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            pool_settings = settings_dict.get('POOL',{})
+            options = dict(settings_dict['OPTIONS'])
+            pool = _pools[key] = ConnectionPool(
+                lambda: _connect(conn_params,options),_check,_reset,_close,
+                max_size=pool_settings.get('MAX_SIZE',10),
+                max_lifetime=pool_settings.get('MAX_LIFETIME',3600),
+                timeout=pool_settings.get('TIMEOUT',10),
+                check_idle=pool_settings.get('CHECK_IDLE',30),
+            )
+        return pool
+
+
+def close_pools(database_name=None):
+    """
+    Closes the idle connections of every pool, or only of the pools of one database.
+    """
+    with _pools_lock:
+        closing = [key for key in _pools if database_name is None or key[0] == database_name]
+        pools = [_pools.pop(key) for key in closing]
+    for pool in pools:
+        pool.close_all()
+
+
+def pool_stats():
+    """
+    :return: The stats of this process's pools by database name.
+    """
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {key[0]:pool.stats() for key,pool in pools}
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+
+    def _destroy_test_db(self,test_database_name,verbosity):
+        # a database can't be dropped while pooled connections are still open to it
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name,verbosity)
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self,conn_params):
+        self.pool = get_pool(self.settings_dict,conn_params)
+        connection = self.pool.checkout()
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level',connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps the connection object until the atomic block exits, it can't go to someone else
+                self.pool.discard(self.connection)
+            else:
+                self.pool.checkin(self.connection)
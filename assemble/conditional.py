@@ -0,0 +1,68 @@
+import hashlib
+from django.conf import settings
+from django.utils.cache import get_conditional_response,patch_cache_control,patch_vary_headers
+from django.utils.http import http_date
+from .models import Profile
+
+
+"""
+Conditional GET for the pages that show a project or a profile.
+
+Every project carries Project.version and every profile Profile.version, change stamps the mutation
+paths move (see the receivers next to the models). A page's ETag is made from the stamps it depends on,
+together with who is asking and the csrf cookie their page's forms carry, so a browser that still has
+the page is answered with a 304 after one cheap lookup, before any of the page's queries run and before
+the template is rendered. Last-Modified comes from Project.last_activity and is only sent along, it doesn't
+move on every change (membership for one), so If-Modified-Since is never answered with a 304 on its own.
+
+    etag = page_etag(request,project.version)
+    response = not_modified(request,etag)
+    if response is None:
+        response = render(...)
+    return with_validators(response,etag,project.last_activity)
+
+Friend suggestions on the profile page aren't part of its stamp, they come from an index that is
+rebuilt every SUGGESTION_INDEX_MAX_AGE seconds anyway.
+"""
+
+
+def page_etag(request,*stamps):
+    """
+    :param stamps: Whatever the page's content depends on, usually version numbers.
+    :return: A quoted ETag for the page at this URL as this user sees it.
+    """
+    parts = [request.user.pk,request.user.get_username(),request.COOKIES.get(settings.CSRF_COOKIE_NAME,''),
+             request.get_full_path(),*stamps]
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def get_profile_stamp(profile):
+    """
+    The stamp of everything the profile and project list pages show, the profile's version. It moves when
+    the profile's projects, friends or friend requests change and whenever one of its projects changes,
+    see bump_member_versions.
+
+    :return: The version, read from the row, the profile may have come from the cache.
+    """
+    return Profile.objects.filter(pk=profile.pk).values_list('version',flat=True).get()
+
+
+def not_modified(request,etag):
+    """
+    :return: A 304 response if the browser's copy of the page is current, otherwise None.
+    """
+    if request.method not in ('GET','HEAD'):
+        return None
+    return get_conditional_response(request,etag=etag)
+
+
+def with_validators(response,etag,last_modified=None):
+    if response.status_code not in (200,304):
+        return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # the page is someone's own, browsers keep it but ask every time whether it is still current
+    patch_cache_control(response,private=True,no_cache=True)
+    patch_vary_headers(response,('Cookie',))
+    return response
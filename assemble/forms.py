@@ -7,6 +7,8 @@ from django.contrib import messages
 from django.contrib.auth.forms import UsernameField
 from django.utils.translation import gettext, gettext_lazy as _
 from .models import Project,ProjectComponent,Profile,UserFeedback
+from .importers import PARSERS,ImportTooLarge
+from django.conf import settings
 from django import forms
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Layout,Field
@@ -92,12 +94,10 @@ class ProjectCreateForm(forms.ModelForm):
 
     # when creating this class
     def __init__(self,*args,**kwargs):
-        # remove the user from key word arguments
-        user = kwargs.pop('user')
+        # remove the profile of the user creating the project from key word arguments
+        is_me = kwargs.pop('profile')
         # call the init function to get the key word arguments
         super(ProjectCreateForm,self).__init__(*args,**kwargs)
-        # get the profile of the user
-        is_me = Profile.objects.get(user=user)
         # create a user field with the options of users friends only
         self.fields['user'].queryset = is_me.friends.all()
         self.fields['user'].widget = forms.widgets.CheckboxSelectMultiple()
@@ -118,11 +118,10 @@ class ProjectEditForm(forms.ModelForm):
         fields = ['name','description','user']
 
 
-    def __init__(self,user,*args,**kwargs):
+    def __init__(self,profile,*args,**kwargs):
         # call the init function to get the key word arguments
         super(ProjectEditForm,self).__init__(*args,**kwargs)
-        # get the profile of the user
-        is_me = Profile.objects.get(user=user)
+        is_me = profile
         # create a user field with the options of users friends only
         self.fields['user'].queryset = is_me.friends.all()
         self.fields['user'].widget = forms.widgets.CheckboxSelectMultiple()
@@ -143,6 +142,48 @@ class ProjectTaskCreateForm(forms.ModelForm):
 
 
 
+class ProjectImportForm(forms.Form):
+    """
+    Allows a user to paste or upload a plan and create all of its components and tasks at once.
+
+    Arguments:
+        forms {[type]} -- [description]
+    """
+    FORMAT_CHOICES = (
+        ('outline','Indented outline or markdown checklist'),
+        ('csv','CSV (one column per level)'),
+    )
+    format = forms.ChoiceField(choices=FORMAT_CHOICES)
+    content = forms.CharField(widget=forms.Textarea(attrs={'rows':15}),required=False,
+                              help_text="Indent tasks under their component. Use [ ] and [x] to mark tasks as done.")
+    file = forms.FileField(required=False,help_text="Or upload a file instead of pasting.")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        text = cleaned_data.get('content') or ''
+        upload = cleaned_data.get('file')
+        if upload:
+            max_size = settings.IMPORT_MAX_UPLOAD_SIZE
+            if upload.size > max_size:
+                raise forms.ValidationError(f"Uploads are limited to {max_size // 1024} KB.",code='too_large')
+            try:
+                text = upload.read().decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise forms.ValidationError("The uploaded file has to be UTF-8 text.")
+        if not text.strip():
+            raise forms.ValidationError("Paste your plan or upload a file to import.")
+        if cleaned_data.get('format') in PARSERS:
+            try:
+                cleaned_data['items'] = PARSERS[cleaned_data['format']](text)
+            except ImportTooLarge as error:
+                raise forms.ValidationError(str(error),code='too_large')
+            except ValueError as error:
+                raise forms.ValidationError(str(error))
+            if not cleaned_data['items']:
+                raise forms.ValidationError("There was nothing to import.")
+        return cleaned_data
+
+
 class ComponentEditForm(forms.ModelForm):
     """
     Allows a user to edit components/tasks of a project.
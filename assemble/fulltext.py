@@ -0,0 +1,237 @@
+import re
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+
+"""
+Full-text index of project names and descriptions and component/task names.
+
+The index is one table, assemble_searchindex, with a row per project and per component. On SQLite it is
+an FTS5 virtual table, on Postgres a table with a weighted tsvector column and a GIN index. Both are used
+through the same functions, which take plain values so this module doesn't depend on the models:
+models.py calls them whenever projects and components are saved, created in bulk, moved or deleted.
+
+Row ids are derived from the object, components are id * 2 and projects id * 2 + 1, so a row can be
+replaced or deleted without looking it up first. Searches are limited to a set of projects and the
+newest SEARCH_MAX_CANDIDATES matches are ranked (bm25 / ts_rank, names weigh more than descriptions),
+which keeps a search on a common word cheap however many tasks there are. One more candidate is read than
+is ranked, so a search can tell it left older matches out.
+"""
+
+TABLE = 'assemble_searchindex'
+SEARCH_MAX_CANDIDATES = 1000
+CHUNK_SIZE = 500
+TOKEN = re.compile(r"\w+",re.UNICODE)
+
+
+def component_rowid(pk):
+    return pk * 2
+
+def project_rowid(pk):
+    return pk * 2 + 1
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+class SQLiteIndex:
+
+    def create(self,cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+            "title, body, scope, kind UNINDEXED, object_id UNINDEXED, project_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+        )
+
+    def drop(self,cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def upsert(self,cursor,rows):
+        cursor.executemany(
+            f"INSERT OR REPLACE INTO {TABLE}(rowid,kind,object_id,project_id,title,body,scope) VALUES (%s,%s,%s,%s,%s,%s,%s)",
+            [(*row,f"p{row[3]}") for row in rows],
+        )
+
+    def delete(self,cursor,rowids):
+        for i in range(0,len(rowids),CHUNK_SIZE):
+            chunk = rowids[i:i + CHUNK_SIZE]
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN ({','.join(['%s'] * len(chunk))})",chunk)
+
+    def delete_project(self,cursor,project_id):
+        # the project id is indexed as a "p<id>" token in the scope column, the unindexed column would need a scan
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN (SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)",
+                       [f"scope : p{int(project_id)}"])
+
+    def delete_subtree(self,cursor,path):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN "
+                       "(SELECT id * 2 FROM assemble_projectcomponent WHERE path LIKE %s)",[f"{path}%"])
+
+    def search(self,cursor,tokens,project_ids,limit,offset):
+        terms = ' '.join(f'"{token}"' for token in tokens[:-1])
+        terms = f'{terms} "{tokens[-1]}"*'.strip()
+        scope = ' OR '.join(f"p{int(pk)}" for pk in project_ids)
+        cursor.execute(
+            "SELECT kind,object_id,project_id,score,matched FROM ("
+            "SELECT *,count(*) OVER () AS matched,row_number() OVER (ORDER BY rowid DESC) AS newest FROM ("
+            f"SELECT rowid,kind,object_id,project_id,bm25({TABLE},10.0,1.0,0.0) AS score FROM {TABLE} "
+            f"WHERE {TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s"
+            ")) WHERE newest <= %s ORDER BY score,rowid DESC LIMIT %s OFFSET %s",
+            [f"{{title body}} : ({terms}) AND scope : ({scope})",SEARCH_MAX_CANDIDATES + 1,SEARCH_MAX_CANDIDATES,
+             limit,offset],
+        )
+        # bm25 is lower for better matches
+        return [(kind,object_id,project_id,-score,matched) for kind,object_id,project_id,score,matched in cursor.fetchall()]
+
+
+class PostgresIndex:
+    document = "setweight(to_tsvector('simple',%s),'A') || setweight(to_tsvector('simple',%s),'B')"
+
+    def create(self,cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} (rowid bigint PRIMARY KEY, kind varchar(20) NOT NULL, "
+            "object_id integer NOT NULL, project_id integer NOT NULL, title text NOT NULL, body text NOT NULL, "
+            "document tsvector NOT NULL)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING gin(document)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_project ON {TABLE} (project_id)")
+
+    def drop(self,cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    def upsert(self,cursor,rows):
+        cursor.executemany(
+            f"INSERT INTO {TABLE}(rowid,kind,object_id,project_id,title,body,document) "
+            f"VALUES (%s,%s,%s,%s,%s,%s,{self.document}) ON CONFLICT (rowid) DO UPDATE SET "
+            "kind=EXCLUDED.kind,object_id=EXCLUDED.object_id,project_id=EXCLUDED.project_id,"
+            "title=EXCLUDED.title,body=EXCLUDED.body,document=EXCLUDED.document",
+            [(*row,row[4],row[5]) for row in rows],
+        )
+
+    def delete(self,cursor,rowids):
+        for i in range(0,len(rowids),CHUNK_SIZE):
+            cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = ANY(%s)",[list(rowids[i:i + CHUNK_SIZE])])
+
+    def delete_project(self,cursor,project_id):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE project_id = %s",[project_id])
+
+    def delete_subtree(self,cursor,path):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid IN "
+                       "(SELECT id * 2 FROM assemble_projectcomponent WHERE path LIKE %s)",[f"{path}%"])
+
+    def search(self,cursor,tokens,project_ids,limit,offset):
+        query = ' & '.join(tokens[:-1] + [f"{tokens[-1]}:*"])
+        cursor.execute(
+            "SELECT kind,object_id,project_id,score,matched FROM ("
+            "SELECT *,count(*) OVER () AS matched,row_number() OVER (ORDER BY rowid DESC) AS newest FROM ("
+            "SELECT rowid,kind,object_id,project_id,ts_rank(document,query) AS score "
+            f"FROM {TABLE},to_tsquery('simple',%s) query "
+            "WHERE project_id = ANY(%s) AND document @@ query ORDER BY rowid DESC LIMIT %s"
+            ") candidates) numbered WHERE newest <= %s ORDER BY score DESC,rowid DESC LIMIT %s OFFSET %s",
+            [query,list(project_ids),SEARCH_MAX_CANDIDATES + 1,SEARCH_MAX_CANDIDATES,limit,offset],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite':SQLiteIndex(),
+    'postgresql':PostgresIndex(),
+}
+
+def get_index(using=None):
+    using = using or connection
+    if using.vendor not in BACKENDS:
+        raise ImproperlyConfigured(f"Full-text search isn't available on {using.vendor}.")
+    return BACKENDS[using.vendor]
+
+
+def create_index(using=None):
+    with (using or connection).cursor() as cursor:
+        get_index(using).create(cursor)
+
+def drop_index(using=None):
+    with (using or connection).cursor() as cursor:
+        get_index(using).drop(cursor)
+
+def index_projects(projects):
+    """
+    Adds or replaces the index rows of projects.
+
+    :param projects: A list of objects with pk, name and description.
+    """
+    rows = [(project_rowid(p.pk),'project',p.pk,p.pk,p.name,p.description or '') for p in projects]
+    if rows:
+        with connection.cursor() as cursor:
+            get_index().upsert(cursor,rows)
+
+def index_components(components):
+    """
+    Adds or replaces the index rows of components and tasks.
+
+    :param components: A list of objects with pk, name and project_id.
+    """
+    rows = [(component_rowid(c.pk),'component',c.pk,c.project_id,c.name,'') for c in components]
+    if rows:
+        with connection.cursor() as cursor:
+            get_index().upsert(cursor,rows)
+
+def remove_project(project_id):
+    """
+    Removes a project and every one of its components and tasks from the index.
+    """
+    with connection.cursor() as cursor:
+        get_index().delete_project(cursor,project_id)
+
+def remove_components(component_ids):
+    with connection.cursor() as cursor:
+        get_index().delete(cursor,[component_rowid(pk) for pk in component_ids])
+
+def remove_subtree(path):
+    """
+    Removes the component with this materialized path and everything below it, call it before deleting the rows.
+    """
+    with connection.cursor() as cursor:
+        get_index().delete_subtree(cursor,path)
+
+def rebuild_index(using=None):
+    """
+    Empties the index and fills it again from the project and component tables.
+
+    :return: The number of rows indexed.
+    """
+    using = using or connection
+    index = get_index(using)
+    count = 0
+    with using.cursor() as cursor:
+        index.drop(cursor)
+        index.create(cursor)
+        for kind,rowid,query in (
+            ('project',project_rowid,"SELECT id,id,name,description FROM assemble_project ORDER BY id"),
+            ('component',component_rowid,"SELECT id,project_id,name,'' FROM assemble_projectcomponent ORDER BY id"),
+        ):
+            cursor.execute(query)
+            rows = cursor.fetchall()
+            for i in range(0,len(rows),CHUNK_SIZE):
+                index.upsert(cursor,[(rowid(pk),kind,pk,project_id,name,body or '')
+                                     for pk,project_id,name,body in rows[i:i + CHUNK_SIZE]])
+            count += len(rows)
+    return count
+
+def search(text,project_ids,limit,offset=0,using=None):
+    """
+    :param text: What the user typed, every word has to match and the last one may be the start of a word.
+    :param project_ids: The projects to search in.
+    :param using: The connection to search through, default if not given.
+    :return: A (list of (kind,object_id,project_id,score) tuples,whether older matches were left out) tuple,
+        best match first. kind is "project" or "component".
+    """
+    tokens = tokenize(text)
+    project_ids = list(project_ids)
+    if not tokens or not project_ids:
+        return [],False
+    using = using or connection
+    with using.cursor() as cursor:
+        rows = get_index(using).search(cursor,tokens,project_ids,limit,offset)
+    # every row carries how many candidates there were, read up to one more than are ranked
+    truncated = bool(rows) and rows[0][4] > SEARCH_MAX_CANDIDATES
+    return [row[:4] for row in rows],truncated
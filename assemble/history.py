@@ -0,0 +1,658 @@
+import asyncio
+import atexit
+import base64
+import contextvars
+import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import request_finished
+from django.db import close_old_connections,connection,models,transaction
+from django.db.models import Q,Count,F,Case,When,Value
+from django.db.models.signals import pre_save,post_save,post_delete,m2m_changed
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Project,ProjectComponent,Profile,ProjectHistory,components_saved,deleting_projects
+
+
+"""
+Writes ProjectHistory rows, the audit trail of projects, their components and tasks, and profiles.
+
+Changes are captured from the models' signals, whatever made them: a view, the admin, the shell or a command.
+    Project, ProjectComponent and Profile - created, deleted, and edited when one of TRACKED_FIELDS changes.
+        Completing a task or taking it back is recorded as "updated to true" or "updated to false".
+    Project members and Profile friends - added and removed.
+bulk_create_components and bulk_update_components send components_saved instead of post_save, an import is
+recorded as one change. Deleting a project records that, not every component that goes with it.
+The change is put on the user of the request it was made in, see HistoryUserMiddleware, and on nobody outside
+of a request.
+
+HISTORY_WRITE_MODE decides how:
+    sync - every event is inserted straight away, like ProjectHistory.objects.create.
+    buffered - events are queued in memory and inserted with one bulk_create after the response has been sent,
+        when HISTORY_BUFFER_SIZE events are waiting or when the oldest one is HISTORY_FLUSH_INTERVAL seconds old.
+    spill - buffered, and every queued event is also appended to a file in HISTORY_SPILL_DIR until it is flushed.
+        Files left behind by a process that died are picked up by the next flush.
+
+Events recorded inside a transaction are only queued once it commits, a rolled back change leaves no history.
+
+HISTORY_GRANULARITY decides per model whether a change is stored as an event, as an event with a JSON snapshot
+of the whole row, or not at all.
+"""
+
+logger = logging.getLogger(__name__)
+
+MODES = ('sync','buffered','spill')
+GRANULARITIES = ('none','event','row')
+HISTORY_PAGE_SIZE = 50
+# the fields whose changes are recorded, by model label. The others are bookkeeping, like counters and versions.
+TRACKED_FIELDS = {
+    'assemble.Project':('name','description'),
+    'assemble.ProjectComponent':('name','completed'),
+    'assemble.Profile':('slug',),
+}
+# longest value previous_field and updated_field hold
+VALUE_LENGTH = 200
+
+
+class HistoryWriter:
+
+    def __init__(self):
+        self._events = []
+        self._oldest = None
+        self._lock = threading.RLock()
+        self._spill_recovered = False
+
+    @property
+    def mode(self):
+        mode = getattr(settings,'HISTORY_WRITE_MODE','sync')
+        if mode not in MODES:
+            raise ValueError(f"HISTORY_WRITE_MODE has to be one of {', '.join(MODES)}, not {mode!r}.")
+        return mode
+
+    @property
+    def spill_path(self):
+        return os.path.join(settings.HISTORY_SPILL_DIR,f"history-{os.getpid()}.jsonl")
+
+    def record(self,project,status,user,previous_field='',updated_field='',component=None):
+        """
+        :param project: The project, or its id, the change happened in.
+        :param status: One of the statuses ProjectHistory knows how to display, e.g. "created" or "edited".
+        :param user: The username of the person who made the change.
+        :param previous_field: The name of the component or task before the change.
+        :param updated_field: The new value, if there is one.
+        :param component: The component or task that was changed, None for changes to the project itself.
+        """
+        self._write([self._event(project,status,user,previous_field,updated_field,component)])
+
+    def record_many(self,project,user,changes):
+        """
+        Records several changes made by one user in one project, in sync mode they are inserted together.
+
+        :param changes: A list of (status,previous_field,updated_field,component) tuples.
+        """
+        self._write([self._event(project,status,user,previous_field,updated_field,component)
+                     for status,previous_field,updated_field,component in changes])
+
+    def _event(self,project,status,user,previous_field,updated_field,component=None,instance=None,field=''):
+        """
+        :param instance: The row that changed, defaults to the component or else the project.
+        """
+        if instance is None:
+            instance = component if component is not None else project
+        granularity = get_granularity(instance)
+        if granularity == 'none':
+            return None
+        if isinstance(instance,models.Model):
+            model,object_id = instance._meta.label,instance.pk
+        else:
+            model,object_id = Project._meta.label,instance
+        return {
+            'project_id':getattr(project,'pk',project),
+            'component_id':getattr(component,'pk',None),
+            'status':status,
+            'user':user,
+            'previous_field':str(previous_field)[:VALUE_LENGTH],
+            'updated_field':str(updated_field)[:VALUE_LENGTH],
+            'snapshot':snapshot(instance) if granularity == 'row' else '',
+            'model':model,
+            'object_id':object_id,
+            'field':field,
+            'date_changed':timezone.now(),
+        }
+
+    def _write(self,events):
+        events = [event for event in events if event is not None]
+        if not events:
+            return
+        if self.mode == 'sync' and not _deferred.get():
+            ProjectHistory.objects.bulk_create([ProjectHistory(**event) for event in events])
+            touch_projects(events)
+        elif connection.in_atomic_block:
+            transaction.on_commit(lambda: self._enqueue(events))
+        else:
+            self._enqueue(events)
+
+    def _enqueue(self,events):
+        with self._lock:
+            if self.mode == 'spill':
+                if not self._spill_recovered:
+                    self._recover_spill_files()
+                self._spill(events)
+            self._events.extend(events)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (len(self._events) >= settings.HISTORY_BUFFER_SIZE or
+                   time.monotonic() - self._oldest >= settings.HISTORY_FLUSH_INTERVAL)
+        if due:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """
+        Inserts every queued event with one bulk_create.
+
+        :return: The number of history rows written.
+        """
+        with self._lock:
+            if self.mode == 'spill' and not self._spill_recovered:
+                self._recover_spill_files()
+            events,self._events,self._oldest = self._events,[],None
+        if not events:
+            return 0
+        try:
+            # the project may have been deleted since the event was queued
+            project_ids = {event['project_id'] for event in events} - {None}
+            existing = set(Project.objects.filter(id__in=project_ids).values_list('id',flat=True))
+            rows = [ProjectHistory(**event) for event in events
+                    if event['project_id'] is None or event['project_id'] in existing]
+            ProjectHistory.objects.bulk_create(rows,batch_size=500)
+            touch_projects(events)
+        except Exception:
+            with self._lock:
+                self._events = events + self._events
+                self._oldest = self._oldest or time.monotonic()
+            raise
+        with self._lock:
+            if self.mode == 'spill':
+                # only the events queued while we were writing are left to keep on disk
+                self._spill(self._events,truncate=True)
+        return len(rows)
+
+    def _spill(self,events,truncate=False):
+        os.makedirs(settings.HISTORY_SPILL_DIR,exist_ok=True)
+        with open(self.spill_path,'w' if truncate else 'a') as spill:
+            for event in events:
+                spill.write(json.dumps(dict(event,date_changed=event['date_changed'].isoformat())) + '\n')
+            spill.flush()
+
+    def _recover_spill_files(self):
+        self._spill_recovered = True
+        recovered = []
+        for path in glob.glob(os.path.join(settings.HISTORY_SPILL_DIR,'history-*.jsonl')):
+            pid = int(os.path.basename(path)[len('history-'):-len('.jsonl')])
+            if pid != os.getpid() and _process_alive(pid):
+                continue
+            with open(path) as spill:
+                for line in spill:
+                    if line.strip():
+                        event = json.loads(line)
+                        event['date_changed'] = parse_datetime(event['date_changed'])
+                        recovered.append(event)
+            os.remove(path)
+        if recovered:
+            self._events = recovered + self._events
+            self._spill(self._events,truncate=True)
+
+
+def touch_projects(events):
+    """
+    Moves Project.last_activity forward to the newest of the events and Project.history_version up,
+    one UPDATE per project.
+    """
+    latest = {}
+    for event in events:
+        project_id = event['project_id']
+        if project_id is None:
+            continue
+        if project_id not in latest or event['date_changed'] > latest[project_id]:
+            latest[project_id] = event['date_changed']
+    for project_id,date_changed in latest.items():
+        Project.objects.filter(pk=project_id).update(
+            history_version=F('history_version') + 1,
+            # events may be written after newer ones, last_activity never goes back
+            last_activity=Case(When(last_activity__lt=date_changed,then=Value(date_changed)),default=F('last_activity')),
+        )
+
+def get_granularity(instance):
+    """
+    :param instance: A model object or class, or the id of a project.
+    :return: How changes to the instance's model are recorded, see HISTORY_GRANULARITY.
+    """
+    if isinstance(instance,type) and issubclass(instance,models.Model):
+        model = instance
+    else:
+        model = instance if isinstance(instance,models.Model) else Project
+    granularity = getattr(settings,'HISTORY_GRANULARITY',{}).get(model._meta.label,'event')
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"HISTORY_GRANULARITY values have to be one of {', '.join(GRANULARITIES)}, not {granularity!r}.")
+    return granularity
+
+def snapshot(instance):
+    """
+    :return: The instance's whole row as JSON, or '' if only an id was given.
+    """
+    if not isinstance(instance,models.Model):
+        return ''
+    row = {field.attname:field.value_from_object(instance) for field in instance._meta.concrete_fields}
+    return json.dumps(row,cls=DjangoJSONEncoder)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+writer = HistoryWriter()
+
+def record(project,status,user,previous_field='',updated_field='',component=None):
+    writer.record(project,status,user,previous_field,updated_field,component)
+
+def record_many(project,user,changes):
+    writer.record_many(project,user,changes)
+
+def flush():
+    return writer.flush()
+
+
+############################################
+### CAPTURE
+############################################
+
+_request = contextvars.ContextVar('history_request',default=None)
+
+def set_request(request):
+    """
+    Puts the changes made from here on on the request's user, until reset_request is called with the token.
+    """
+    return _request.set(request)
+
+def reset_request(token):
+    _request.reset(token)
+
+_deferred = contextvars.ContextVar('history_deferred',default=False)
+
+def defer_writes():
+    """
+    Queues the changes made from here on like buffered mode does, whatever HISTORY_WRITE_MODE is, until
+    reset_deferred_writes is called with the token. The caller flushes them, see async_views.serve.
+    """
+    return _deferred.set(True)
+
+def reset_deferred_writes(token):
+    _deferred.reset(token)
+
+def current_user():
+    """
+    :return: The username of the signed in user of the request being handled, or None.
+    """
+    user = getattr(_request.get(),'user',None)
+    return user.username if user is not None and user.is_authenticated else None
+
+
+class HistoryUserMiddleware:
+    """
+    Lets the signal receivers below know whose changes they are recording, needs to come after
+    AuthenticationMiddleware.
+    """
+
+    def __init__(self,get_response):
+        self.get_response = get_response
+
+    def __call__(self,request):
+        token = set_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            reset_request(token)
+
+
+def _display_name(instance):
+    return instance.user.username if isinstance(instance,Profile) else instance.name
+
+def _change(instance,status,previous_field='',updated_field='',field='',user=None):
+    """
+    :return: The event of a change to a Project, ProjectComponent or Profile, or None if its model isn't recorded.
+    """
+    if isinstance(instance,ProjectComponent):
+        project,component = instance.project_id,instance
+    elif isinstance(instance,Project):
+        # a deleted project's history is purged with it, its deletion is kept apart from it
+        project,component = (None if status == "deleted" else instance.pk),None
+    else:
+        project,component = None,None
+    return writer._event(project,status,user or current_user(),previous_field,updated_field,component,
+                         instance=instance,field=field)
+
+def _edits(instance):
+    """
+    :return: The events of every tracked field of a saved instance that changed since it was loaded.
+    """
+    loaded = getattr(instance,'_loaded_values',None) or {}
+    events = []
+    for name in TRACKED_FIELDS[instance._meta.label]:
+        attname = instance._meta.get_field(name).attname
+        if attname not in loaded:
+            # deferred, or never loaded
+            continue
+        old,new = loaded[attname],getattr(instance,attname)
+        if old == new:
+            continue
+        if name == 'completed':
+            events.append(_change(instance,"updated to true" if new else "updated to false",
+                                  previous_field=_display_name(instance),updated_field=new))
+        else:
+            events.append(_change(instance,"edited",previous_field=old,updated_field=new,field=name))
+        loaded[attname] = new
+    return events
+
+def load_tracked_values_receiver(sender,instance,raw=False,**kwargs):
+    # an instance that wasn't loaded from the database, e.g. Project(pk=1,...).save(), is compared with the row
+    if raw or instance._state.adding or hasattr(instance,'_loaded_values'):
+        return
+    fields = [sender._meta.get_field(name).attname for name in TRACKED_FIELDS[sender._meta.label]]
+    instance._loaded_values = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+
+def record_save_receiver(sender,instance,created,raw=False,**kwargs):
+    if raw:
+        return
+    if created:
+        writer._write([_change(instance,"created",previous_field=_display_name(instance))])
+        instance._loaded_values = {sender._meta.get_field(name).attname:getattr(instance,sender._meta.get_field(name).attname)
+                                   for name in TRACKED_FIELDS[sender._meta.label]}
+    else:
+        writer._write(_edits(instance))
+
+def record_delete_receiver(sender,instance,**kwargs):
+    # the components of a project being deleted go along with it and aren't recorded one by one
+    if sender is ProjectComponent and instance.project_id in deleting_projects():
+        return
+    writer._write([_change(instance,"deleted",previous_field=_display_name(instance))])
+
+def record_bulk_save_receiver(sender,instances,created,imported=False,**kwargs):
+    if imported:
+        counts = {}
+        for instance in instances:
+            counts[instance.project_id] = counts.get(instance.project_id,0) + 1
+        user = current_user()
+        events = [writer._event(project_id,"imported",user,f"{count} components and tasks",'')
+                  for project_id,count in counts.items()]
+    elif created:
+        events = [_change(instance,"created",previous_field=instance.name) for instance in instances]
+    else:
+        events = [event for instance in instances for event in _edits(instance)]
+    writer._write(events)
+
+def _usernames(profile_ids):
+    return dict(Profile.objects.filter(pk__in=profile_ids).values_list('pk','user__username'))
+
+def record_members_receiver(sender,instance,action,reverse,pk_set,**kwargs):
+    # reverse is True when the change was made from the profile's side, e.g. profile.project_set.add(project)
+    if action == 'pre_clear':
+        # who is on the other side is only known before the clear
+        if reverse:
+            pk_set = set(Project.objects.filter(user=instance).values_list('pk',flat=True))
+        else:
+            pk_set = set(instance.user.values_list('pk',flat=True))
+    elif action not in ('post_add','post_remove'):
+        return
+    if not pk_set:
+        return
+    status = "member added" if action == 'post_add' else "member removed"
+    user = current_user()
+    if reverse:
+        pairs = [(project_id,instance.user.username) for project_id in pk_set]
+    else:
+        pairs = [(instance.pk,username) for username in _usernames(pk_set).values()]
+    writer._write([writer._event(project_id,status,user,username,'') for project_id,username in pairs])
+
+def record_friends_receiver(sender,instance,action,pk_set,**kwargs):
+    if action == 'pre_clear':
+        pk_set = set(instance.friends.values_list('pk',flat=True))
+    elif action not in ('post_add','post_remove'):
+        return
+    if not pk_set:
+        return
+    status = "friend added" if action == 'post_add' else "friend removed"
+    user = current_user()
+    writer._write([writer._event(None,status,user,instance.user.username,username,instance=instance)
+                   for username in _usernames(pk_set).values()])
+
+for model in (Project,ProjectComponent,Profile):
+    pre_save.connect(load_tracked_values_receiver,sender=model)
+    post_save.connect(record_save_receiver,sender=model)
+    post_delete.connect(record_delete_receiver,sender=model)
+components_saved.connect(record_bulk_save_receiver,sender=ProjectComponent)
+m2m_changed.connect(record_members_receiver,sender=Project.user.through)
+m2m_changed.connect(record_friends_receiver,sender=Profile.friends.through)
+
+
+def encode_cursor(record):
+    value = f"{record.date_changed.isoformat()}|{record.id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    :raises ValueError: If the cursor wasn't made by encode_cursor.
+    """
+    try:
+        date_changed,pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        date_changed = parse_datetime(date_changed)
+    except (ValueError,UnicodeError):
+        raise ValueError("Invalid history cursor.")
+    if date_changed is None or not pk.isdigit():
+        raise ValueError("Invalid history cursor.")
+    return date_changed,int(pk)
+
+def get_history_page(project_id,cursor=None,page_size=HISTORY_PAGE_SIZE,component_id=None):
+    """
+    Returns one page of a project's history, newest first. Pages are found by seeking past the last row
+    of the previous page on the (project,date_changed,id) index, so every page costs the same.
+
+    :param project_id: The id of the project.
+    :param cursor: The cursor of the previous page, None for the first page.
+    :param component_id: Only return the history of this component or task, using the (component,date_changed,id) index.
+    :return: A (list of ProjectHistory,cursor of the next page or None) tuple.
+    """
+    records = ProjectHistory.objects.filter(project_id=project_id)
+    if component_id is not None:
+        records = records.filter(component_id=component_id)
+    if cursor:
+        date_changed,pk = decode_cursor(cursor)
+        records = records.filter(Q(date_changed__lt=date_changed) | Q(date_changed=date_changed,id__lt=pk))
+    records = list(records.order_by('-date_changed','-id')[:page_size + 1])
+    next_cursor = encode_cursor(records[page_size - 1]) if len(records) > page_size else None
+    return records[:page_size],next_cursor
+
+
+############################################
+### RETENTION
+############################################
+
+TOGGLE_STATUSES = ("updated to true","updated to false")
+HISTORY_CHUNK_SIZE = 1000
+
+def _delete_in_chunks(ids,chunk_size):
+    for i in range(0,len(ids),chunk_size):
+        ProjectHistory.objects.filter(id__in=ids[i:i + chunk_size]).delete()
+
+def _history_changed(project_ids):
+    # the history pages of these projects aren't what browsers were sent any more
+    Project.objects.filter(pk__in=project_ids).update(history_version=F('history_version') + 1)
+
+def collapse_toggles(project_id=None,chunk_size=HISTORY_CHUNK_SIZE):
+    """
+    Keeps only the last entry of every uninterrupted run of completed/uncompleted toggles on the same task.
+    Any other change to the task (an edit, a delete...) ends the run. Tasks are told apart by component_id,
+    only entries written before it was recorded fall back to the task's name.
+
+    :param project_id: Only collapse this project's history, None for every project.
+    :return: The number of history rows deleted.
+    """
+    records = ProjectHistory.objects.all()
+    if project_id is not None:
+        records = records.filter(project_id=project_id)
+    runs = {}
+    redundant = []
+    changed = set()
+    deleted = 0
+    rows = records.order_by('date_changed','id').values_list('id','project_id','component_id','status','previous_field')
+    for pk,project,component,status,name in rows.iterator():
+        key = (project,'component',component) if component is not None else (project,'name',name)
+        if status not in TOGGLE_STATUSES:
+            runs.pop(key,None)
+            continue
+        if key in runs:
+            redundant.append(runs[key])
+            changed.add(project)
+        runs[key] = pk
+        if len(redundant) >= chunk_size:
+            _delete_in_chunks(redundant,chunk_size)
+            deleted += len(redundant)
+            redundant = []
+    _delete_in_chunks(redundant,chunk_size)
+    _history_changed(changed)
+    return deleted + len(redundant)
+
+def rollup_history(older_than_days=None,chunk_size=HISTORY_CHUNK_SIZE):
+    """
+    Replaces every entry older than older_than_days with one summary entry per project and day,
+    holding how many changes were made and by whom. Summaries from earlier runs are merged in.
+
+    :param older_than_days: Defaults to settings.HISTORY_ROLLUP_AFTER_DAYS.
+    :return: The number of history rows that were rolled up.
+    """
+    if older_than_days is None:
+        older_than_days = settings.HISTORY_ROLLUP_AFTER_DAYS
+    cutoff = timezone.now() - datetime.timedelta(days=older_than_days)
+    # whole days only, so a day is never split between a summary and live entries
+    cutoff = timezone.make_aware(datetime.datetime.combine(timezone.localdate(cutoff),datetime.time.min))
+    # changes outside of a project are few and kept as they are
+    old = ProjectHistory.objects.filter(date_changed__lt=cutoff,project__isnull=False)
+    rolled_up = 0
+    for project_id in old.exclude(status="summary").values_list('project_id',flat=True).distinct():
+        records = old.filter(project_id=project_id).annotate(day=TruncDate('date_changed'))
+        counts = {}
+        users = {}
+        for day,count in records.exclude(status="summary").values_list('day').annotate(count=Count('id')):
+            counts[day] = counts.get(day,0) + count
+        for day,count,user in records.filter(status="summary").values_list('day','updated_field','user'):
+            counts[day] = counts.get(day,0) + int(count)
+            users.setdefault(day,set()).update(user.split(', '))
+        for day,user in records.exclude(status="summary").values_list('day','user').distinct():
+            users.setdefault(day,set()).add(user or 'unknown')
+        with transaction.atomic():
+            ids = list(records.values_list('id',flat=True))
+            _delete_in_chunks(ids,chunk_size)
+            ProjectHistory.objects.bulk_create([ProjectHistory(
+                project_id=project_id,
+                status="summary",
+                updated_field=str(count),
+                user=', '.join(sorted(users[day]))[:ProjectHistory._meta.get_field('user').max_length],
+                date_changed=timezone.make_aware(datetime.datetime.combine(day,datetime.time.min)),
+            ) for day,count in counts.items()])
+            _history_changed([project_id])
+        rolled_up += len(ids)
+    return rolled_up
+
+def purge_deleted_project_history(chunk_size=HISTORY_CHUNK_SIZE):
+    """
+    Deletes the history left behind by deleted projects, chunk_size rows at a time.
+
+    :return: The number of history rows deleted.
+    """
+    orphans = ProjectHistory.objects.filter(project__isnull=False).exclude(project_id__in=Project.objects.values('id'))
+    deleted = 0
+    while True:
+        ids = list(orphans.values_list('id',flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        ProjectHistory.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+def compact_history(older_than_days=None,chunk_size=HISTORY_CHUNK_SIZE):
+    """
+    Runs every retention step, meant to be called on a schedule.
+
+    :return: A dictionary with the number of rows each step removed.
+    """
+    return {
+        'purged':purge_deleted_project_history(chunk_size),
+        'collapsed':collapse_toggles(chunk_size=chunk_size),
+        'rolled_up':rollup_history(older_than_days,chunk_size),
+    }
+
+
+def _flush_in_thread():
+    try:
+        writer.flush()
+    finally:
+        # Django's own receiver has already run, the connection the flush used is closed the same way
+        close_old_connections()
+
+# flushes running in the thread pool, waited for when the ASGI server shuts down
+_flushes = set()
+
+def _flush_done(future):
+    _flushes.discard(future)
+    if not future.cancelled() and future.exception() is not None:
+        # nobody awaits the flush, this is the only place its failure shows up
+        logger.error("Writing queued history failed.",exc_info=future.exception())
+
+def flush_history_receiver(sender,**kwargs):
+    if not writer.pending():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _flush_in_thread()
+    else:
+        # under ASGI request_finished is sent from the event loop, where the database can't be used
+        future = loop.run_in_executor(None,_flush_in_thread)
+        _flushes.add(future)
+        future.add_done_callback(_flush_done)
+
+async def flush_history_on_shutdown():
+    """
+    Waits for the flushes still running and writes what is left in the buffer, see lifespan in async_views.py.
+    """
+    if _flushes:
+        await asyncio.gather(*_flushes,return_exceptions=True)
+    if writer.pending():
+        await asyncio.get_running_loop().run_in_executor(None,_flush_in_thread)
+
+def flush_history_at_exit():
+    try:
+        flush_history_receiver(None)
+    except Exception:
+        # nothing left to report to, spilled events are picked up again by the next process
+        pass
+
+# request_finished is sent once the response has been handed to the client, so the bulk insert
+# is no longer part of the request's latency
+request_finished.connect(flush_history_receiver)
+atexit.register(flush_history_at_exit)
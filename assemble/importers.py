@@ -0,0 +1,146 @@
+import csv
+import io
+import re
+from collections import namedtuple
+from .models import ProjectComponent,bulk_create_components
+
+
+"""
+Turns pasted plans into components and tasks.
+
+Outline / markdown checklist
+    Every line is an item, indentation decides which item it belongs under.
+    List markers (-, *, +, 1.) are dropped and "[ ]" / "[x]" set the completed field.
+
+CSV
+    The first row is a header. Every column is a level of the hierarchy from left to right,
+    so a row of "Snake,Move the snake" creates the component Snake with the task Move the snake.
+    If the last header is "completed" or "done" that column marks the item as finished.
+
+Uploads bigger than IMPORT_MAX_UPLOAD_SIZE bytes are turned away before they are read (see ProjectImportForm),
+and parsing stops with ImportTooLarge after IMPORT_MAX_ROWS lines, blank ones included, or IMPORT_MAX_ITEMS items.
+"""
+
+# parent is the index of the parent item in the same list, items always come after their parent
+ImportItem = namedtuple('ImportItem',['name','completed','parent'])
+
+IMPORT_MAX_ITEMS = 5000
+IMPORT_MAX_ROWS = 10000
+LIST_MARKER = re.compile(r"^(?:[-*+]|\d+[.)])\s+")
+CHECKBOX = re.compile(r"^\[([ xX])\]\s*")
+COMPLETED_HEADERS = ('completed','done')
+COMPLETED_VALUES = ('1','x','y','yes','true','done','completed')
+NAME_MAX_LENGTH = ProjectComponent._meta.get_field('name').max_length
+
+
+class ImportTooLarge(ValueError):
+    pass
+
+
+def _check_name(name,line_number):
+    if len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f"Line {line_number}: names can't be longer than {NAME_MAX_LENGTH} characters.")
+
+
+def _check_size(items):
+    if len(items) > IMPORT_MAX_ITEMS:
+        raise ImportTooLarge(f"Imports are limited to {IMPORT_MAX_ITEMS} items.")
+
+
+def _check_rows(line_number):
+    if line_number > IMPORT_MAX_ROWS:
+        raise ImportTooLarge(f"Imports are limited to {IMPORT_MAX_ROWS} lines.")
+
+
+def parse_outline(text):
+    """
+    :param text: An indented outline or markdown checklist.
+    :return: A list of ImportItems.
+    """
+    items = []
+    # (indentation,index) of the items the next line could belong to
+    stack = []
+    for line_number,line in enumerate(text.splitlines(),1):
+        _check_rows(line_number)
+        line = line.expandtabs(4)
+        name = line.strip()
+        if not name:
+            continue
+        indent = len(line) - len(line.lstrip())
+        name = LIST_MARKER.sub('',name,count=1)
+        completed = False
+        checkbox = CHECKBOX.match(name)
+        if checkbox:
+            completed = checkbox.group(1) in 'xX'
+            name = name[checkbox.end():]
+        name = name.strip()
+        if not name:
+            continue
+        _check_name(name,line_number)
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        items.append(ImportItem(name,completed,stack[-1][1] if stack else None))
+        stack.append((indent,len(items) - 1))
+        _check_size(items)
+    return items
+
+
+def parse_csv(text):
+    """
+    :param text: CSV with a header row and one column per level of the hierarchy.
+    :return: A list of ImportItems, rows that repeat a component reuse it.
+    """
+    # read a row at a time, a file of blank or repeated rows stops at IMPORT_MAX_ROWS rather than being read whole
+    rows = csv.reader(io.StringIO(text.strip()))
+    header = next(rows,None)
+    if header is None:
+        return []
+    has_completed = header[-1].strip().lower() in COMPLETED_HEADERS
+    levels = len(header) - 1 if has_completed else len(header)
+    items = []
+    indexes = {}
+    for line_number,row in enumerate(rows,2):
+        _check_rows(line_number)
+        names = [cell.strip() for cell in row[:levels]]
+        while names and not names[-1]:
+            names.pop()
+        if not names:
+            continue
+        completed = has_completed and len(row) > levels and row[levels].strip().lower() in COMPLETED_VALUES
+        for depth,name in enumerate(names):
+            if not name:
+                raise ValueError(f"Line {line_number}: a row can't skip a level.")
+            _check_name(name,line_number)
+            path = tuple(names[:depth + 1])
+            if path not in indexes:
+                parent = indexes[path[:-1]] if depth else None
+                items.append(ImportItem(name,completed and depth == len(names) - 1,parent))
+                indexes[path] = len(items) - 1
+        _check_size(items)
+    return items
+
+
+PARSERS = {
+    'outline':parse_outline,
+    'csv':parse_csv,
+}
+
+
+def import_items(project,items):
+    """
+    Creates the whole tree of items in the project with bulk inserts, history records it as one import.
+
+    :param project: The project the items are added to.
+    :param items: A list of ImportItems from one of the parsers.
+    :return: The list of created components.
+    """
+    components = []
+    for item in items:
+        components.append(ProjectComponent(
+            name=item.name,
+            completed=item.completed,
+            task=components[item.parent] if item.parent is not None else None,
+            project=project,
+        ))
+    bulk_create_components(components,imported=True)
+    return components
@@ -0,0 +1,68 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.signals import post_save,post_delete
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import add_never_cache_headers,patch_vary_headers
+from django.utils.safestring import mark_safe
+from .models import ProjectIndex,ProjectComponentIndex
+
+
+"""
+The demo board on the landing page, rendered ahead of time and kept in Django's cache.
+
+The board only depends on ProjectIndex and ProjectComponentIndex, so it is rendered once without a request
+and every visitor gets the same html with no queries for it. Saving or deleting the demo data, in admin or
+anywhere else, drops the cached board and renders it again once the change commits, so the next visitor
+doesn't have to.
+
+The rest of the page is rendered per request, it holds the visitor's csrf token, their messages and, for
+signed in users, who they are.
+"""
+
+LANDING_BOARD_KEY = 'assemble:landing-board'
+
+
+def render_landing_board():
+    """
+    :return: The demo board's html.
+    """
+    tasks = Prefetch('component',queryset=ProjectComponentIndex.objects.order_by('id'))
+    project_components = ProjectComponentIndex.objects.filter(project__id=1).filter(task=None).prefetch_related(tasks)
+    return render_to_string('assemble/landing_board.html',{'project_components':project_components})
+
+
+def get_landing_board():
+    board = cache.get(LANDING_BOARD_KEY)
+    if board is None:
+        # a cold cache after a restart, the receivers below keep it filled after that
+        board = render_landing_board()
+        cache.set(LANDING_BOARD_KEY,board,None)
+    return mark_safe(board)
+
+
+def landing_page_response(request):
+    """
+    :return: The landing page around the cached demo board.
+    """
+    response = render(request,'assemble/index.html',{'landing_board':get_landing_board()})
+    # the page holds the visitor's csrf token, it mustn't be kept for anyone else
+    add_never_cache_headers(response)
+    patch_vary_headers(response,('Cookie',))
+    return response
+
+
+def rebuild_landing_board():
+    cache.set(LANDING_BOARD_KEY,render_landing_board(),None)
+
+
+def clear_landing_page_receiver(sender,*args,**kwargs):
+    # dropped now so this transaction sees its own change, rendered again once it commits
+    cache.delete(LANDING_BOARD_KEY)
+    transaction.on_commit(rebuild_landing_board)
+
+post_save.connect(clear_landing_page_receiver,sender=ProjectIndex)
+post_delete.connect(clear_landing_page_receiver,sender=ProjectIndex)
+post_save.connect(clear_landing_page_receiver,sender=ProjectComponentIndex)
+post_delete.connect(clear_landing_page_receiver,sender=ProjectComponentIndex)
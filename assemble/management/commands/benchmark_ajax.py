@@ -0,0 +1,127 @@
+import asyncio
+import time
+import uuid
+from urllib.parse import urlencode
+from django.contrib.auth import SESSION_KEY,BACKEND_SESSION_KEY,HASH_SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.http import HttpRequest
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from importlib import import_module
+from assemble.async_views import async_application
+from assemble.models import Project,ProjectComponent
+
+
+ENDPOINTS = ('detail','toggle','rename')
+
+
+class Command(BaseCommand):
+    help = ("Compares requests per second and latency of the sync and async AJAX endpoints under concurrent load. "
+            "The ASGI applications are called in process, so the numbers leave out the server and the network. "
+            "A throwaway user and project are made for it and deleted afterwards.")
+
+    def add_arguments(self,parser):
+        parser.add_argument('--requests',type=int,default=500,help="Requests per endpoint and application.")
+        parser.add_argument('--concurrency',type=int,default=20,help="Requests in flight at once.")
+        parser.add_argument('--tasks',type=int,default=50,help="Tasks on the benchmark board.")
+        parser.add_argument('--endpoint',choices=ENDPOINTS,action='append',help="Only run these endpoints.")
+
+    def handle(self,*args,**options):
+        user,project,tasks = self.make_board(options['tasks'])
+        try:
+            cookies,csrf_token = self.sign_in(user)
+            django_application = get_asgi_application()
+            applications = (('sync',django_application),('async',async_application(django_application)))
+            self.stdout.write(f"{'endpoint':<10}{'views':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+            for endpoint in options['endpoint'] or ENDPOINTS:
+                requests = [self.make_request(endpoint,i,project,tasks,cookies,csrf_token) for i in range(options['requests'])]
+                for name,application in applications:
+                    elapsed,latencies,errors = asyncio.run(self.load(application,requests,options['concurrency']))
+                    latencies.sort()
+                    self.stdout.write(f"{endpoint:<10}{name:<8}{len(requests) / elapsed:>10.1f}"
+                                      f"{latencies[len(latencies) // 2] * 1000:>10.2f}"
+                                      f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:>10.2f}{errors:>8}")
+        finally:
+            project.delete()
+            user.delete()
+
+    def make_board(self,task_count):
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+        project = Project.objects.create(name="benchmark",description="",owner=user.profile)
+        project.user.add(user.profile)
+        component = ProjectComponent.objects.create(name="benchmark",project=project)
+        tasks = [ProjectComponent.objects.create(name=f"task {i}",project=project,task=component) for i in range(task_count)]
+        return user,project,tasks
+
+    def sign_in(self,user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        request = HttpRequest()
+        csrf_token = get_token(request)
+        cookies = f"{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={request.META['CSRF_COOKIE']}"
+        return cookies,csrf_token
+
+    def make_request(self,endpoint,i,project,tasks,cookies,csrf_token):
+        """
+        :return: A (scope,body) tuple.
+        """
+        task = tasks[i % len(tasks)]
+        method,body,headers = 'GET',b'',[(b'host',b'localhost'),(b'cookie',cookies.encode())]
+        if endpoint == 'detail':
+            path,query = reverse('project-detail-ajax',args=[project.slug]),''
+        elif endpoint == 'toggle':
+            path,query = reverse('finish-task-ajax'),urlencode({'pk':task.pk})
+        else:
+            path,query,method = reverse('edit-task-ajax'),'','POST'
+            body = urlencode({'pk':task.pk,'name':f"task {i}"}).encode()
+            headers += [(b'content-type',b'application/x-www-form-urlencoded'),(b'x-csrftoken',csrf_token.encode())]
+        scope = {'type':'http','method':method,'path':path,'query_string':query.encode(),'headers':headers,
+                 'root_path':'','scheme':'http','server':('localhost',80)}
+        return scope,body
+
+    async def load(self,application,requests,concurrency):
+        """
+        :return: A (seconds taken,list of latencies in seconds,number of failed requests) tuple.
+        """
+        latencies,errors = [],0
+        waiting = iter(requests)
+
+        async def client():
+            nonlocal errors
+            for scope,body in waiting:
+                status = await self.call(application,scope,body,latencies)
+                errors += status >= 400
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return time.perf_counter() - start,latencies,errors
+
+    async def call(self,application,scope,body,latencies):
+        sent = []
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                # the request is never cut off, a second read waits for good
+                await asyncio.Future()
+            received = True
+            return {'type':'http.request','body':body,'more_body':False}
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body',False):
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        try:
+            await application(dict(scope),receive,send)
+        except Exception:
+            return 500
+        return sent[0]['status']
@@ -0,0 +1,63 @@
+import time
+import uuid
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory,override_settings
+from django.urls import reverse
+from assemble.models import Project,ProjectComponent,bulk_create_components
+from assemble.views import project_detail_view
+
+
+class Command(BaseCommand):
+    help = ("Measures how long project_detail_view takes to render a large board without the card cache, "
+            "with every card cached and with one task changed between renders. "
+            "A throwaway user and project are made for it and deleted afterwards.")
+
+    def add_arguments(self,parser):
+        parser.add_argument('--renders',type=int,default=20,help="Renders per case.")
+        parser.add_argument('--components',type=int,default=20,help="Components on the benchmark board.")
+        parser.add_argument('--tasks',type=int,default=50,help="Tasks per component.")
+
+    def handle(self,*args,**options):
+        user,project,tasks = self.make_board(options['components'],options['tasks'])
+        try:
+            request = RequestFactory().get(reverse('project-detail',args=[project.slug]))
+            request.user = user
+            self.stdout.write(f"{options['components']} components with {options['tasks']} tasks each")
+            self.stdout.write(f"{'case':<14}{'mean ms':>10}{'p50 ms':>10}")
+            with override_settings(BOARD_CACHE_TIMEOUT=0):
+                self.report("uncached",[self.render(request,project) for _ in range(options['renders'])])
+            cache.clear()
+            self.render(request,project)
+            self.report("cached",[self.render(request,project) for _ in range(options['renders'])])
+            self.report("one change",[self.render(request,project,tasks[i % len(tasks)]) for i in range(options['renders'])])
+        finally:
+            project.delete()
+            user.delete()
+
+    def make_board(self,component_count,task_count):
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+        project = Project.objects.create(name="benchmark",description="",owner=user.profile)
+        project.user.add(user.profile)
+        with transaction.atomic():
+            components = bulk_create_components([ProjectComponent(name=f"component {i}",project=project) for i in range(component_count)])
+            tasks = bulk_create_components([ProjectComponent(name=f"task {i}",project=project,task=component)
+                                            for component in components for i in range(task_count)])
+        return user,project,tasks
+
+    def render(self,request,project,changed_task=None):
+        """
+        :return: Seconds the view took, not counting the change made before it.
+        """
+        if changed_task is not None:
+            changed_task.completed = not changed_task.completed
+            changed_task.save()
+        start = time.perf_counter()
+        project_detail_view(request,project.slug)
+        return time.perf_counter() - start
+
+    def report(self,case,timings):
+        timings.sort()
+        self.stdout.write(f"{case:<14}{sum(timings) / len(timings) * 1000:>10.2f}{timings[len(timings) // 2] * 1000:>10.2f}")
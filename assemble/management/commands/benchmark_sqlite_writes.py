@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from assemble.backends.sqlite_wal.base import DatabaseWrapper as WALDatabaseWrapper
+
+
+BACKENDS = {'sqlite3':SQLiteDatabaseWrapper,'sqlite_wal':WALDatabaseWrapper}
+
+
+def run_writer(backend,settings_dict,transactions,results):
+    """
+    Toggles tasks and records history the way finish_task_ajax does, each in its own transaction.
+    """
+    wrapper = BACKENDS[backend](settings_dict,alias='benchmark')
+    committed = failed = 0
+    for i in range(transactions):
+        try:
+            wrapper.ensure_connection()
+            wrapper._start_transaction_under_autocommit()
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT completed FROM task WHERE id = %s",[i % 50])
+                completed = cursor.fetchone()[0]
+                cursor.execute("UPDATE task SET completed = %s WHERE id = %s",[not completed,i % 50])
+                cursor.execute("INSERT INTO history (task_id,status) VALUES (%s,%s)",[i % 50,"updated"])
+            wrapper.commit()
+            committed += 1
+        except Exception:
+            failed += 1
+            try:
+                wrapper.rollback()
+            except Exception:
+                wrapper.close()
+    wrapper.close()
+    results.put(('write',committed,failed))
+
+
+def run_reader(backend,settings_dict,transactions,atomic,results):
+    """
+    Reads a task's history the way the history page does, in a transaction of its own when atomic is True.
+    """
+    wrapper = BACKENDS[backend](settings_dict,alias='benchmark')
+    read = failed = 0
+    for i in range(transactions):
+        try:
+            wrapper.ensure_connection()
+            if atomic:
+                wrapper._start_transaction_under_autocommit()
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM history WHERE task_id = %s",[i % 50])
+                cursor.fetchone()
+            if atomic:
+                wrapper.commit()
+            read += 1
+        except Exception:
+            failed += 1
+            try:
+                wrapper.rollback()
+            except Exception:
+                wrapper.close()
+    wrapper.close()
+    results.put(('read',read,failed))
+
+
+class Command(BaseCommand):
+    help = ("Compares write throughput of the plain sqlite3 backend and sqlite_wal with several processes "
+            "writing to one database file at once, while other processes read in transactions of their own (atomic) "
+            "or outside of one (autocommit). A throwaway database in a temporary directory is used.")
+
+    def add_arguments(self,parser):
+        parser.add_argument('--processes',type=int,default=4,help="Processes writing at once, like gunicorn workers.")
+        parser.add_argument('--readers',type=int,default=2,help="Processes reading at the same time.")
+        parser.add_argument('--transactions',type=int,default=200,help="Transactions per process.")
+        parser.add_argument('--timeout',type=float,default=5.0,help="Busy timeout in seconds.")
+
+    def handle(self,*args,**options):
+        self.stdout.write(f"{'backend':<12}{'reads':<12}{'commits/s':>12}{'reads/s':>12}{'failed':>10}")
+        for backend in BACKENDS:
+            for atomic in (True,False):
+                with tempfile.TemporaryDirectory() as directory:
+                    settings_dict = dict(connections['default'].settings_dict,NAME=os.path.join(directory,'db.sqlite3'),
+                                         OPTIONS={'timeout':options['timeout']},SQLITE={})
+                    self.make_tables(backend,settings_dict)
+                    counts = self.load(backend,settings_dict,options['processes'],options['readers'],
+                                       options['transactions'],atomic)
+                    self.stdout.write(f"{backend:<12}{'atomic' if atomic else 'autocommit':<12}"
+                                      f"{counts['write'] / counts['write_seconds']:>12.1f}"
+                                      f"{counts['read'] / counts['read_seconds'] if counts['read'] else 0:>12.1f}"
+                                      f"{counts['failed']:>10}")
+
+    def make_tables(self,backend,settings_dict):
+        wrapper = BACKENDS[backend](settings_dict,alias='benchmark')
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE task (id integer PRIMARY KEY,completed bool)")
+            cursor.execute("CREATE TABLE history (id integer PRIMARY KEY,task_id integer,status text)")
+            for i in range(50):
+                cursor.execute("INSERT INTO task VALUES (%s,0)",[i])
+        wrapper.close()
+
+    def load(self,backend,settings_dict,writer_count,reader_count,transactions,atomic):
+        """
+        :return: A dictionary with the transactions written, read and failed, and the seconds until the last
+            writer and the last reader were done.
+        """
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=run_writer,args=(backend,settings_dict,transactions,results))
+                     for _ in range(writer_count)]
+        processes += [multiprocessing.Process(target=run_reader,args=(backend,settings_dict,transactions,atomic,results))
+                      for _ in range(reader_count)]
+        counts = {'write':0,'read':0,'failed':0,'write_seconds':0,'read_seconds':0}
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for _ in processes:
+            kind,done,failed = results.get()
+            counts[kind] += done
+            counts['failed'] += failed
+            counts[f'{kind}_seconds'] = time.perf_counter() - start
+        for process in processes:
+            process.join()
+        return counts
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from assemble.boards import board_cache_stats,reset_board_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Shows how often project boards were served from the board cache."
+
+    def add_arguments(self,parser):
+        parser.add_argument('--reset',action='store_true',help="Set the counters back to zero afterwards.")
+
+    def handle(self,*args,**options):
+        stats = board_cache_stats()
+        hit_rate = "-" if stats["hit_rate"] is None else f"{stats['hit_rate']:.1%}"
+        self.stdout.write(f"hits: {stats['hits']}  misses: {stats['misses']}  hit rate: {hit_rate}")
+        if options['reset']:
+            reset_board_cache_stats()
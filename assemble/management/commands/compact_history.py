@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from assemble import history
+
+
+class Command(BaseCommand):
+    help = ("Keeps ProjectHistory small: purges the history of deleted projects, collapses runs of completed "
+            "toggles on the same task and rolls old entries up into one summary per project and day.")
+
+    def add_arguments(self,parser):
+        parser.add_argument('--older-than-days',type=int,default=None,
+                            help="Roll up entries older than this many days (default: HISTORY_ROLLUP_AFTER_DAYS).")
+        parser.add_argument('--chunk-size',type=int,default=history.HISTORY_CHUNK_SIZE,
+                            help="How many rows to delete per query.")
+        parser.add_argument('--skip-purge',action='store_true')
+        parser.add_argument('--skip-collapse',action='store_true')
+        parser.add_argument('--skip-rollup',action='store_true')
+
+    def handle(self,*args,**options):
+        chunk_size = options['chunk_size']
+        if not options['skip_purge']:
+            purged = history.purge_deleted_project_history(chunk_size)
+            self.stdout.write(f"Purged {purged} entries of deleted projects.")
+        if not options['skip_collapse']:
+            collapsed = history.collapse_toggles(chunk_size=chunk_size)
+            self.stdout.write(f"Collapsed {collapsed} redundant toggle entries.")
+        if not options['skip_rollup']:
+            rolled_up = history.rollup_history(options['older_than_days'],chunk_size)
+            self.stdout.write(f"Rolled up {rolled_up} old entries into daily summaries.")
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from assemble.models import rebuild_progress
+
+
+class Command(BaseCommand):
+    help = "Recounts the task counters of every component and project, repairing any that have drifted."
+
+    def add_arguments(self,parser):
+        parser.add_argument('project_ids',nargs='*',type=int,help="Only rebuild these projects.")
+
+    def handle(self,*args,**options):
+        repaired = rebuild_progress(options['project_ids'] or None)
+        self.stdout.write(f"Repaired the counters of {repaired} components and projects.")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from assemble.fulltext import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text index of projects, components and tasks from scratch."
+
+    def handle(self,*args,**options):
+        count = rebuild_index()
+        self.stdout.write(f"Indexed {count} projects, components and tasks.")
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand,CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = ("Copies the default SQLite database into the SQLite files of DATABASE_REPLICAS, so a second file can "
+            "stand in for a read replica locally. Runs once, or every --interval seconds until stopped.")
+
+    def add_arguments(self,parser):
+        parser.add_argument('--interval',type=float,default=0,
+                            help="Seconds between copies, the replica lags by up to this much. 0 copies once.")
+
+    def handle(self,*args,**options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set DATABASE_REPLICA_URLS.")
+        for alias in ['default'] + settings.DATABASE_REPLICAS:
+            if connections[alias].vendor != 'sqlite' or connections[alias].is_in_memory_db():
+                raise CommandError(f"{alias} isn't an SQLite database file.")
+        source = connections['default'].settings_dict['NAME']
+        replicas = [connections[alias].settings_dict['NAME'] for alias in settings.DATABASE_REPLICAS]
+        while True:
+            start = time.perf_counter()
+            for replica in replicas:
+                self.copy(source,replica)
+            self.stdout.write(f"copied to {len(replicas)} replica(s) in {(time.perf_counter() - start) * 1000:.0f} ms")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def copy(self,source_name,replica_name):
+        """
+        Copies with SQLite's backup API, which reads a consistent snapshot of the source while it is written to
+        and holds the replica's write lock while it replaces its pages, so readers never see half a copy.
+        """
+        source = sqlite3.connect(source_name)
+        replica = sqlite3.connect(replica_name,timeout=30)
+        try:
+            source.backup(replica)
+        finally:
+            replica.close()
+            source.close()
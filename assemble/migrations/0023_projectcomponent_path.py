@@ -0,0 +1,40 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    ProjectComponent = apps.get_model('assemble', 'ProjectComponent')
+    components = {component.id: component for component in ProjectComponent.objects.only('id', 'task_id')}
+
+    def path_of(component):
+        if not component.path:
+            parent = components.get(component.task_id)
+            component.path = f"{path_of(parent) if parent else ''}{component.id}/"
+            component.depth = component.path.count('/') - 1
+        return component.path
+
+    for component in components.values():
+        path_of(component)
+    ProjectComponent.objects.bulk_update(components.values(), ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0022_auto_20200405_1118'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectcomponent',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projectcomponent',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0023_projectcomponent_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=100)),
+                ('base', models.CharField(max_length=100)),
+                ('next_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('scope', 'base')},
+            },
+        ),
+    ]
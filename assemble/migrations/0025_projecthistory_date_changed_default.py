@@ -0,0 +1,19 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0024_slugcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projecthistory',
+            name='date_changed',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
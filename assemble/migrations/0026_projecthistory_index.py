@@ -0,0 +1,17 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0025_projecthistory_date_changed_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projecthistory',
+            index=models.Index(fields=['project', '-date_changed', '-id'], name='history_project_date_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0026_projecthistory_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='projecthistory',
+            name='project',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='assemble.Project'),
+        ),
+    ]
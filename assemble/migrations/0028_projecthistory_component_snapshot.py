@@ -0,0 +1,28 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0027_projecthistory_project_no_cascade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projecthistory',
+            name='component',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='history', to='assemble.ProjectComponent'),
+        ),
+        migrations.AddField(
+            model_name='projecthistory',
+            name='snapshot',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name='projecthistory',
+            index=models.Index(fields=['component', '-date_changed', '-id'], name='history_component_date_idx'),
+        ),
+    ]
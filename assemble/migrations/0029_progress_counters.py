@@ -0,0 +1,56 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+def count_tasks(apps, schema_editor):
+    Project = apps.get_model('assemble', 'Project')
+    ProjectComponent = apps.get_model('assemble', 'ProjectComponent')
+    components = {component.id: component for component in ProjectComponent.objects.only('id', 'path', 'completed', 'project_id', 'task_id')}
+    projects = {project.id: project for project in Project.objects.only('id')}
+    for component in components.values():
+        for pk in component.path.split('/')[:-2]:
+            parent = components.get(int(pk))
+            if parent:
+                parent.task_count += 1
+                parent.completed_task_count += component.completed
+        project = projects.get(component.project_id)
+        # top level components aren't tasks
+        if project and component.task_id:
+            project.task_count += 1
+            project.completed_task_count += component.completed
+    for project in projects.values():
+        project.completed = bool(project.task_count) and project.task_count == project.completed_task_count
+    ProjectComponent.objects.bulk_update(components.values(), ['task_count', 'completed_task_count'], batch_size=500)
+    Project.objects.bulk_update(projects.values(), ['task_count', 'completed_task_count', 'completed'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0028_projecthistory_component_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='completed_task_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projectcomponent',
+            name='completed_task_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projectcomponent',
+            name='task_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_tasks, migrations.RunPython.noop),
+    ]
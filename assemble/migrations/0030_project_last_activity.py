@@ -0,0 +1,37 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import Max
+import django.utils.timezone
+
+
+def set_last_activity(apps, schema_editor):
+    Project = apps.get_model('assemble', 'Project')
+    ProjectHistory = apps.get_model('assemble', 'ProjectHistory')
+    latest = ProjectHistory.objects.values('project_id').annotate(latest=Max('date_changed')).order_by()
+    for row in latest:
+        Project.objects.filter(pk=row['project_id']).update(last_activity=row['latest'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0029_progress_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(set_last_activity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['-last_activity', '-id'], name='project_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['name', 'id'], name='project_name_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_usernames(apps, schema_editor):
+    Profile = apps.get_model('assemble', 'Profile')
+    UsernameTrigram = apps.get_model('assemble', 'UsernameTrigram')
+    profiles = list(Profile.objects.select_related('user'))
+    rows = []
+    for profile in profiles:
+        name = profile.user.username.lower()
+        profile.search_name = name
+        rows.extend(UsernameTrigram(profile_id=profile.id, trigram=trigram)
+                    for trigram in {name[i:i + 3] for i in range(len(name) - 2)})
+    Profile.objects.bulk_update(profiles, ['search_name'], batch_size=500)
+    UsernameTrigram.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0030_project_last_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.CreateModel(
+            name='UsernameTrigram',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='assemble.Profile')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='usernametrigram',
+            index=models.Index(fields=['trigram', 'profile'], name='username_trigram_idx'),
+        ),
+        migrations.RunPython(index_usernames, migrations.RunPython.noop),
+    ]
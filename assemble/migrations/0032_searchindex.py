@@ -0,0 +1,63 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+
+# the index as it was when this migration was written, kept here so later changes to assemble.fulltext
+# don't change what the migration does. row ids are id * 2 for components and id * 2 + 1 for projects
+SEARCH_INDEX_SQL = {
+    'sqlite': {
+        'create': [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS assemble_searchindex USING fts5("
+            "title, body, scope, kind UNINDEXED, object_id UNINDEXED, project_id UNINDEXED, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')",
+            "INSERT INTO assemble_searchindex(rowid, kind, object_id, project_id, title, body, scope) "
+            "SELECT id * 2 + 1, 'project', id, id, name, COALESCE(description, ''), 'p' || id FROM assemble_project",
+            "INSERT INTO assemble_searchindex(rowid, kind, object_id, project_id, title, body, scope) "
+            "SELECT id * 2, 'component', id, project_id, name, '', 'p' || project_id FROM assemble_projectcomponent",
+        ],
+        'drop': [
+            "DROP TABLE IF EXISTS assemble_searchindex",
+        ],
+    },
+    'postgresql': {
+        'create': [
+            "CREATE TABLE IF NOT EXISTS assemble_searchindex (rowid bigint PRIMARY KEY, kind varchar(20) NOT NULL, "
+            "object_id integer NOT NULL, project_id integer NOT NULL, title text NOT NULL, body text NOT NULL, "
+            "document tsvector NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS assemble_searchindex_document ON assemble_searchindex USING gin(document)",
+            "CREATE INDEX IF NOT EXISTS assemble_searchindex_project ON assemble_searchindex (project_id)",
+            "INSERT INTO assemble_searchindex(rowid, kind, object_id, project_id, title, body, document) "
+            "SELECT id * 2 + 1, 'project', id, id, name, COALESCE(description, ''), "
+            "setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', COALESCE(description, '')), 'B') "
+            "FROM assemble_project",
+            "INSERT INTO assemble_searchindex(rowid, kind, object_id, project_id, title, body, document) "
+            "SELECT id * 2, 'component', id, project_id, name, '', "
+            "setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', ''), 'B') "
+            "FROM assemble_projectcomponent",
+        ],
+        'drop': [
+            "DROP TABLE IF EXISTS assemble_searchindex",
+        ],
+    },
+}
+
+
+def run_search_index_sql(step):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor not in SEARCH_INDEX_SQL:
+            raise ImproperlyConfigured(f"Full-text search isn't available on {vendor}.")
+        for sql in SEARCH_INDEX_SQL[vendor][step]:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0031_username_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_search_index_sql('create'), run_search_index_sql('drop')),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.0.3 on 2026-10-18 19:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0032_searchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletedComponent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('component_id', models.IntegerField()),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='projectcomponent',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='projectcomponent',
+            index=models.Index(fields=['project', 'version'], name='component_version_idx'),
+        ),
+        migrations.AddField(
+            model_name='deletedcomponent',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deleted_components', to='assemble.Project'),
+        ),
+        migrations.AddIndex(
+            model_name='deletedcomponent',
+            index=models.Index(fields=['project', 'version'], name='deleted_component_version_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0033_project_change_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.0.3 on 2026-10-19 10:12
+
+from django.db import migrations
+from django.db.models import Count, Q
+
+
+def recount_projects(apps, schema_editor):
+    # 0029 counted top level components as tasks of their project, only components with a parent are
+    Project = apps.get_model('assemble', 'Project')
+    projects = list(Project.objects.annotate(
+        tasks=Count('projectcomponent', filter=Q(projectcomponent__task__isnull=False)),
+        completed_tasks=Count('projectcomponent', filter=Q(projectcomponent__task__isnull=False, projectcomponent__completed=True)),
+    ))
+    for project in projects:
+        project.task_count = project.tasks
+        project.completed_task_count = project.completed_tasks
+        project.completed = bool(project.tasks) and project.tasks == project.completed_tasks
+    Project.objects.bulk_update(projects, ['task_count', 'completed_task_count', 'completed'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0034_profile_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_projects, migrations.RunPython.noop),
+    ]
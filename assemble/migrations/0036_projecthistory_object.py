@@ -0,0 +1,47 @@
+# Generated by Django 3.0.3 on 2026-10-18 20:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import F
+
+
+def fill_objects(apps, schema_editor):
+    # rows written so far were about a component or task, or about the project when they have none
+    ProjectHistory = apps.get_model('assemble', 'ProjectHistory')
+    ProjectHistory.objects.filter(component__isnull=False).update(model='assemble.ProjectComponent', object_id=F('component_id'))
+    ProjectHistory.objects.filter(component__isnull=True).update(model='assemble.Project', object_id=F('project_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0035_recount_project_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projecthistory',
+            name='field',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='projecthistory',
+            name='model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='projecthistory',
+            name='object_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='projecthistory',
+            name='project',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='assemble.Project'),
+        ),
+        migrations.AddIndex(
+            model_name='projecthistory',
+            index=models.Index(fields=['model', 'object_id'], name='history_object_idx'),
+        ),
+        migrations.RunPython(fill_objects, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.3 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assemble', '0036_projecthistory_object'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='history_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
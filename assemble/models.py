@@ -1,8 +1,19 @@
-from django.db import models
+import base64
+import contextvars
+import re
+from collections import Counter
+from django.db import models,transaction
+from django.db.models import F,Q,Value,Case,When,Prefetch,Count
+from django.db.models.functions import Concat,Substr
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.text import slugify
 from django.urls import reverse
 from django.db.models.signals import post_save,pre_save,pre_delete,post_delete,m2m_changed
+from django.dispatch import Signal
+from . import fulltext
 
 
 """
@@ -20,6 +31,91 @@ Profile
 
 """
 
+class SlugCounter(models.Model):
+    """
+    Remembers the next free suffix for a base slug so unique slugs can be handed out without
+    checking slug-1, slug-2, ... one query at a time. Used through allocate_slugs.
+    """
+    scope = models.CharField(max_length=100) # label of the model the slugs belong to
+    base = models.CharField(max_length=100)
+    next_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('scope','base')
+
+    def __str__(self):
+        return f"{self.scope}: {self.base} ({self.next_number})"
+
+# slugify collapses runs of hyphens, so a "--" separated suffix can never clash with another name's slug
+SLUG_SUFFIX_SEPARATOR = '--'
+SLUG_BASE_MAX_LENGTH = 90
+SLUG_QUERY_CHUNK_SIZE = 200
+
+def _lock_slug_counters(scope,bases):
+    counters = {}
+    bases = list(bases)
+    for i in range(0,len(bases),SLUG_QUERY_CHUNK_SIZE):
+        chunk = bases[i:i + SLUG_QUERY_CHUNK_SIZE]
+        for counter in SlugCounter.objects.select_for_update().filter(scope=scope,base__in=chunk):
+            counters[counter.base] = counter
+    return counters
+
+def _next_free_slug_numbers(model,bases):
+    # only needed the first time a base slug is seen, picks up slugs that were made before the counters existed
+    numbers = {base:0 for base in bases}
+    for i in range(0,len(bases),SLUG_QUERY_CHUNK_SIZE):
+        chunk = bases[i:i + SLUG_QUERY_CHUNK_SIZE]
+        query = Q()
+        for base in chunk:
+            query |= Q(slug=base) | Q(slug__startswith=f"{base}-")
+        for slug in model.objects.filter(query).values_list('slug',flat=True):
+            for base in chunk:
+                if slug == base:
+                    numbers[base] = max(numbers[base],1)
+                    continue
+                match = re.fullmatch(rf"{re.escape(base)}-{{1,2}}(\d+)",slug)
+                if match:
+                    numbers[base] = max(numbers[base],int(match.group(1)) + 1)
+    return numbers
+
+def allocate_slugs(model,bases):
+    """
+    Hands out a unique slug for every base slug in bases with a constant number of queries.
+    The counter rows stay locked until the surrounding transaction commits, so concurrent workers
+    can't be given the same slug.
+
+    :param model: The model class the slugs are for, it needs a slug field.
+    :param bases: A list of slugified names. Repeated names get consecutive suffixes.
+    :return: A list of unique slugs in the same order as bases.
+    """
+    scope = model._meta.label_lower
+    bases = [base[:SLUG_BASE_MAX_LENGTH] for base in bases]
+    wanted = list(Counter(bases))
+    with transaction.atomic():
+        counters = _lock_slug_counters(scope,wanted)
+        missing = [base for base in wanted if base not in counters]
+        if missing:
+            numbers = _next_free_slug_numbers(model,missing)
+            SlugCounter.objects.bulk_create([SlugCounter(scope=scope,base=base,next_number=numbers[base]) for base in missing],
+                                            ignore_conflicts=True)
+            counters.update(_lock_slug_counters(scope,missing))
+        slugs = []
+        for base in bases:
+            counter = counters[base]
+            number = counter.next_number
+            counter.next_number += 1
+            slugs.append(f"{base}{SLUG_SUFFIX_SEPARATOR}{number}" if number else base)
+        SlugCounter.objects.bulk_update(counters.values(),['next_number'],batch_size=SLUG_QUERY_CHUNK_SIZE)
+    return slugs
+
+def allocate_slug(model,base):
+    return allocate_slugs(model,[base])[0]
+
+
+# kept up to date by apply_progress_changes and the history writer, never written back by Project.save
+PROJECT_COUNTER_FIELDS = ('completed','task_count','completed_task_count','last_activity','history_version')
+
+
 class Project(models.Model):
     name = models.CharField(max_length=60)
     description = models.TextField(max_length=400)
@@ -30,33 +126,126 @@ class Project(models.Model):
     # because of that, the model is saved with a slug field that is empty at first
 
     slug = models.SlugField(max_length=100,unique=True,blank=True,null=True)
+    # set once every component and task of the project is completed, kept up to date with the counters below
     completed= models.BooleanField(default=False)
-
-
+    # how many components and tasks the project has and how many of them are completed,
+    # maintained by apply_progress_changes, rebuild_progress repairs them
+    task_count = models.PositiveIntegerField(default=0,editable=False)
+    completed_task_count = models.PositiveIntegerField(default=0,editable=False)
+    # when the newest history entry of the project was made, moved forward by the history writer
+    last_activity = models.DateTimeField(default=timezone.now,editable=False)
+    # goes up by one with every change to the project's components and tasks, see next_change_version
+    version = models.BigIntegerField(default=0,editable=False)
+    # goes up whenever the project's history is written or compacted, the history page's stamp
+    history_version = models.BigIntegerField(default=0,editable=False)
+
+    class Meta:
+        # the project list walks a user's projects in these orders, see get_project_page
+        indexes = [
+            models.Index(fields=['-last_activity','-id'],name='project_activity_idx'),
+            models.Index(fields=['name','id'],name='project_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls,db,field_names,values):
+        instance = super().from_db(db,field_names,values)
+        # what history compares a save against, see history.py
+        instance._loaded_values = dict(zip(field_names,values))
+        return instance
+
     def _get_unique_slug(self):
-        slug = slugify(self.name)
-        unique_slug = slug
-        num = 1
-        while Project.objects.filter(slug=unique_slug).exists():
-            unique_slug=f"{slug}-{num}"
-            num += 1
-        return unique_slug
+        return allocate_slug(Project,slugify(self.name))
 
     def save(self,*args,**kwargs):
         if not self.slug:
             self.slug=self._get_unique_slug()
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # the counters are moved with F() updates elsewhere, the values in memory may be behind the row
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in PROJECT_COUNTER_FIELDS]
         super().save(*args,**kwargs)
+        fulltext.index_projects([self])
+
+    def delete(self,*args,**kwargs):
+        # per thread and per task, and reset however the delete ends, a rolled back delete doesn't stay marked
+        token = _deleting_projects.set(_deleting_projects.get() | {self.pk})
+        try:
+            return super().delete(*args,**kwargs)
+        finally:
+            _deleting_projects.reset(token)
 
     def get_absolute_url(self):
         return reverse('project-detail',kwargs={'project_slug':self.slug})
 
+# the projects Project.delete is deleting right now, their components go along with them
+_deleting_projects = contextvars.ContextVar('deleting_projects',default=frozenset())
+
+def deleting_projects():
+    """
+    :return: The ids of the projects being deleted by Project.delete in this thread or task.
+    """
+    return _deleting_projects.get()
+
+def remove_project_from_search_receiver(sender,instance,*args,**kwargs):
+    # the rows of its components and tasks go too, they're deleted along with the project
+    fulltext.remove_project(instance.pk)
+
+post_delete.connect(remove_project_from_search_receiver,sender=Project)
+
+# changes to components and tasks move Project.version inside their own transaction, see next_change_version.
+# edits to the project itself and to its members move it here, so boards cached under the old version
+# (see boards.py) stop being served and catching up boards hear about it. Profiles are saved the same way,
+# their version is moved with F() updates by the member and friend receivers below.
+def bump_version_receiver(sender,instance,update_fields=None,*args,**kwargs):
+    # the version in memory may be behind the row, it is moved in the UPDATE rather than written back
+    if not instance._state.adding and (update_fields is None or 'version' in update_fields):
+        instance.version = F('version') + 1
+
+def load_version_receiver(sender,instance,created,update_fields=None,*args,**kwargs):
+    if not created and (update_fields is None or 'version' in update_fields):
+        instance.refresh_from_db(fields=['version'])
+        if sender is Project:
+            bump_member_versions([instance.pk])
+
+def bump_member_versions(project_ids):
+    """
+    Moves the version of every member of the projects, the profile and project list pages show their projects.
+    """
+    Profile.objects.filter(project__in=project_ids).update(version=F('version') + 1)
+
+def members_changed_version_receiver(sender,instance,action,reverse,pk_set,**kwargs):
+    # the members' profiles list the project, their version moves too, see conditional.py
+    # reverse is True when the change was made from the profile's side, e.g. profile.project_set.add(project)
+    if action == 'pre_clear':
+        # who is on the other side is only known before the clear
+        projects = Project.objects.filter(user=instance) if reverse else Project.objects.filter(pk=instance.pk)
+        profiles = Profile.objects.filter(pk=instance.pk) if reverse else Profile.objects.filter(project=instance)
+    elif action in ('post_add','post_remove'):
+        projects = Project.objects.filter(pk__in=pk_set) if reverse else Project.objects.filter(pk=instance.pk)
+        profiles = Profile.objects.filter(pk=instance.pk) if reverse else Profile.objects.filter(pk__in=pk_set)
+    else:
+        return
+    projects.update(version=F('version') + 1)
+    profiles.update(version=F('version') + 1)
+
+def deleted_project_version_receiver(sender,instance,*args,**kwargs):
+    Profile.objects.filter(project=instance).update(version=F('version') + 1)
+
+pre_save.connect(bump_version_receiver,sender=Project)
+post_save.connect(load_version_receiver,sender=Project)
+m2m_changed.connect(members_changed_version_receiver,sender=Project.user.through)
+pre_delete.connect(deleted_project_version_receiver,sender=Project)
+
 # can return all project components from a project using
 # test_project.projectcomponent_set.all() --> From parent to child with foreign key relationship
 
+# components and tasks live in the same table, a task is a component whose task field points at its parent.
+# path is a materialized path of primary keys from the top level component down to this one, e.g. "4/17/52/".
+# it lets us fetch, count and move a whole subtree with a single query no matter how deep it goes.
+
 class ProjectComponent(models.Model):
     name = models.CharField(max_length=200) # can change this
     slug = models.SlugField(max_length=100,unique=True,blank=True,null=True)
@@ -64,30 +253,179 @@ class ProjectComponent(models.Model):
     task = models.ForeignKey('self',null=True,default=None,related_name="component",
                              on_delete=models.CASCADE)
     project = models.ForeignKey(Project,on_delete=models.CASCADE)
+    path = models.CharField(max_length=500,blank=True,default='',db_index=True,editable=False)
+    depth = models.PositiveIntegerField(default=0,editable=False)
+    # how many tasks are below this component at any depth and how many of them are completed,
+    # maintained by apply_progress_changes, rebuild_progress repairs them
+    task_count = models.PositiveIntegerField(default=0,editable=False)
+    completed_task_count = models.PositiveIntegerField(default=0,editable=False)
+    # the project version this component was last created, changed or moved at
+    version = models.BigIntegerField(default=0,editable=False)
+
+    class Meta:
+        # get_project_changes looks up what changed in a project since a version
+        indexes = [
+            models.Index(fields=['project','version'],name='component_version_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls,db,field_names,values):
+        instance = super().from_db(db,field_names,values)
+        # remembered so save() knows whether the counters above this task and the search index have to change
+        instance._loaded_completed = instance.__dict__.get('completed')
+        instance._loaded_name = instance.__dict__.get('name')
+        # what history compares a save against, see history.py
+        instance._loaded_values = dict(zip(field_names,values))
+        return instance
+
 
     def _get_unique_slug(self):
-        slug = slugify(self.name)
-        unique_slug = slug
-        num = 1
-        while ProjectComponent.objects.filter(slug=unique_slug).exists():
-            unique_slug=f"{slug}-{num}"
-            num += 1
-        return unique_slug
+        return allocate_slug(ProjectComponent,slugify(self.name))
 
     def save(self,*args,**kwargs):
         if not self.slug:
             self.slug=self._get_unique_slug()
-        super().save(*args,**kwargs)
-
-
+        parent_changed = bool(self.path) and self._path_parent_id() != self.task_id
+        if parent_changed:
+            self._check_parent(self.task)
+        loaded_completed = getattr(self,'_loaded_completed',None)
+        with transaction.atomic():
+            self.version = next_change_version(self.project_id)
+            super().save(*args,**kwargs)
+            if not self.path:
+                self._set_path()
+                if self.task_id:
+                    apply_progress_changes([(self.project_id,self.path,1,int(self.completed))])
+                fulltext.index_components([self])
+            else:
+                if self.name != getattr(self,'_loaded_name',None):
+                    fulltext.index_components([self])
+                if loaded_completed is not None and loaded_completed != self.completed and self._path_parent_id():
+                    # counted where the task was, a move below takes the new value along with the subtree
+                    apply_progress_changes([(self.project_id,self.path,0,1 if self.completed else -1)])
+                if parent_changed:
+                    # the parent was changed directly on the instance, bring the subtree along with it
+                    self._move_subtree(self.task)
+        self._loaded_completed = self.completed
+        self._loaded_name = self.name
+
+    def delete(self,*args,**kwargs):
+        if not self.path:
+            return super().delete(*args,**kwargs)
+        # removes the component and everything below it in one pass instead of walking the task foreign keys
+        subtree = ProjectComponent.objects.filter(path__startswith=self.path)
+        with transaction.atomic():
+            total,completed = count_tasks(self.path,*self._count_subtree())
+            apply_progress_changes([(self.project_id,self.path,-total,-completed)])
+            fulltext.remove_subtree(self.path)
+            record_deletions(self.project_id,list(subtree.values_list('id',flat=True)))
+            return subtree.delete()
 
     def get_absolute_url(self):
         return reverse('project-detail',kwargs={'project_slug':self.project.slug})
 
+    def _path_parent_id(self):
+        ids = self.path.split('/')[:-1]
+        return int(ids[-2]) if len(ids) > 1 else None
+
+    def _set_path(self):
+        parent_path = self.task.path if self.task_id else ''
+        self.path = f"{parent_path}{self.pk}/"
+        self.depth = self.path.count('/') - 1
+        ProjectComponent.objects.filter(pk=self.pk).update(path=self.path,depth=self.depth)
+
+    def _check_parent(self,parent):
+        if parent is not None and parent.path.startswith(self.path):
+            raise ValueError("A component can't be moved underneath itself.")
+
+    def _count_subtree(self):
+        """
+        :return: A (rows,completed rows,1 if this component is completed else 0) tuple for the subtree, see count_tasks.
+        """
+        counts = ProjectComponent.objects.filter(path__startswith=self.path).aggregate(
+            rows=Count('id'),completed_rows=Count('id',filter=Q(completed=True)),
+            completed_root=Count('id',filter=Q(pk=self.pk,completed=True)))
+        return counts['rows'],counts['completed_rows'],counts['completed_root']
+
+    def _move_subtree(self,parent):
+        old_path = self.path
+        old_project_id = self.project_id
+        new_path = f"{parent.path if parent else ''}{self.pk}/"
+        counts = self._count_subtree()
+        depth_change = new_path.count('/') - old_path.count('/')
+        new_project_id = parent.project_id if parent is not None else old_project_id
+        if new_project_id != old_project_id:
+            # boards of the old project see the subtree go, boards of the new one see it arrive
+            record_deletions(old_project_id,list(self.get_descendants(include_self=True).values_list('id',flat=True)))
+        version = next_change_version(new_project_id)
+        changes = {
+            'path':Concat(Value(new_path),Substr('path',len(old_path) + 1)),
+            'depth':F('depth') + depth_change,
+            'task':Case(When(pk=self.pk,then=Value(parent.pk if parent else None)),default=F('task')),
+            'project':new_project_id,
+            'version':version,
+        }
+        ProjectComponent.objects.filter(path__startswith=old_path).update(**changes)
+        self.path = new_path
+        self.depth = new_path.count('/') - 1
+        self.task = parent
+        self.project_id = new_project_id
+        self.version = version
+        # the component itself turns into a task when it moves under another one and stops being one on the way up
+        old_total,old_completed = count_tasks(old_path,*counts)
+        total,completed = count_tasks(new_path,*counts)
+        apply_progress_changes([(old_project_id,old_path,-old_total,-old_completed),(self.project_id,new_path,total,completed)])
+        if self.project_id != old_project_id:
+            # index rows are scoped to their project
+            fulltext.index_components(ProjectComponent.objects.filter(path__startswith=new_path).only('id','name','project_id'))
+
+    def move_to(self,parent):
+        """
+        Moves this component and its whole subtree under parent with a single UPDATE.
+
+        :param parent: The new parent component, or None to make this a top level component.
+        """
+        self._check_parent(parent)
+        with transaction.atomic():
+            self._move_subtree(parent)
+
+    def get_descendants(self,include_self=False):
+        """
+        :return: A queryset of every component below this one, at any depth.
+        """
+        descendants = ProjectComponent.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+    def get_descendant_count(self):
+        return self.get_descendants().count()
+
+    def get_ancestors(self):
+        """
+        :return: A queryset of the components above this one, from the top level component down.
+        """
+        ids = [int(pk) for pk in self.path.split('/')[:-2]]
+        return ProjectComponent.objects.filter(pk__in=ids).order_by('depth')
+
+class DeletedComponent(models.Model):
+    """
+    Left behind by a deleted component or task so get_project_changes can tell boards it is gone.
+    Only the last CHANGES_MAX_VERSION_GAP versions of a project are kept.
+    """
+    project = models.ForeignKey(Project,on_delete=models.CASCADE,related_name='deleted_components')
+    component_id = models.IntegerField()
+    version = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['project','version'],name='deleted_component_version_idx'),
+        ]
+
+
 class ProjectIndex(models.Model):
     """ Models to be shown on the home page.
     """
@@ -108,18 +446,23 @@ class Profile(models.Model):
     user = models.OneToOneField(User,on_delete=models.CASCADE)
     slug = models.SlugField(blank=True)
     friends = models.ManyToManyField('Profile',blank=True)
+    # the lowercased username, prefix searches are a range scan on its index, see index_username
+    search_name = models.CharField(max_length=150,blank=True,default='',db_index=True,editable=False)
+    # moved whenever the profile's projects, friends or friend requests change, see conditional.py
+    version = models.BigIntegerField(default=0,editable=False)
 
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls,db,field_names,values):
+        instance = super().from_db(db,field_names,values)
+        # what history compares a save against, see history.py
+        instance._loaded_values = dict(zip(field_names,values))
+        return instance
+
     def _get_unique_slug(self):
-        slug = slugify(self.user.username)
-        unique_slug = slug
-        num = 1
-        while Profile.objects.filter(slug=unique_slug).exists():
-            unique_slug=f"{slug}-{num}"
-            num += 1
-        return unique_slug
+        return allocate_slug(Profile,slugify(self.user.username))
 
     def save(self,*args,**kwargs):
         if not self.slug:
@@ -136,6 +479,57 @@ def post_save_user_model_receiver(sender,instance,created,*args,**kwargs):
 #creates a profile for every user on sign up
 post_save.connect(post_save_user_model_receiver,sender=User)
 
+
+class UsernameTrigram(models.Model):
+    """
+    Every three letter run of a lowercased username, so the user search can match the middle of a name
+    with indexed lookups. Kept up to date by index_username.
+    """
+    profile = models.ForeignKey(Profile,on_delete=models.CASCADE,related_name='trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram','profile'],name='username_trigram_idx'),
+        ]
+
+def trigrams(name):
+    name = name.lower()
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+def index_username(user):
+    """
+    Refreshes the search_name and trigrams of the user's profile.
+
+    :param user: A User with a profile.
+    """
+    profile_ids = list(Profile.objects.filter(user=user).values_list('id',flat=True))
+    if not profile_ids:
+        return
+    Profile.objects.filter(id=profile_ids[0]).update(search_name=user.username.lower())
+    UsernameTrigram.objects.filter(profile_id=profile_ids[0]).delete()
+    UsernameTrigram.objects.bulk_create([UsernameTrigram(profile_id=profile_ids[0],trigram=trigram)
+                                         for trigram in trigrams(user.username)])
+
+def index_username_receiver(sender,instance,created,update_fields=None,*args,**kwargs):
+    # saves that only touch other fields, like last_login on every sign in, leave the index alone
+    if created or update_fields is None or 'username' in update_fields:
+        index_username(instance)
+
+# connected after post_save_user_model_receiver so the profile exists by the time it runs
+post_save.connect(index_username_receiver,sender=User)
+
+def profile_cache_key(user_id):
+    return f"assemble:profile:{user_id}"
+
+def clear_cached_profile_receiver(sender,instance,*args,**kwargs):
+    # keeps the user and profile cached by profiles.ProfileBackend from outliving a change to either
+    cache.delete(profile_cache_key(instance.user_id if sender is Profile else instance.pk))
+
+post_save.connect(clear_cached_profile_receiver,sender=User)
+post_delete.connect(clear_cached_profile_receiver,sender=User)
+post_save.connect(clear_cached_profile_receiver,sender=Profile)
+
 class FriendRequest(models.Model):
     to_user = models.ForeignKey(User,related_name = 'to_user',on_delete=models.CASCADE)
     from_user = models.ForeignKey(User,related_name ='from_user',on_delete=models.CASCADE)
@@ -144,6 +538,25 @@ class FriendRequest(models.Model):
     def __str__(self):
         return f"From {self.from_user} to {self.to_user}. Sent {self.timestamp}"
 
+def friend_request_version_receiver(sender,instance,*args,**kwargs):
+    Profile.objects.filter(user_id__in=[instance.to_user_id,instance.from_user_id]).update(version=F('version') + 1)
+
+post_save.connect(friend_request_version_receiver,sender=FriendRequest)
+post_delete.connect(friend_request_version_receiver,sender=FriendRequest)
+
+def friends_changed_version_receiver(sender,instance,action,pk_set,**kwargs):
+    if action == 'pre_clear':
+        profiles = Profile.objects.filter(Q(pk=instance.pk) | Q(friends=instance))
+    elif action in ('post_add','post_remove'):
+        profiles = Profile.objects.filter(pk__in={instance.pk,*pk_set})
+    else:
+        return
+    profiles.update(version=F('version') + 1)
+
+m2m_changed.connect(friends_changed_version_receiver,sender=Profile.friends.through)
+pre_save.connect(bump_version_receiver,sender=Profile)
+post_save.connect(load_version_receiver,sender=Profile)
+
 
 class UserFeedback(models.Model):
     title = models.CharField(max_length=100)
@@ -157,18 +570,38 @@ class ProjectHistory(models.Model):
     # if the history object is being created then the before field will be empty.
     previous_field = models.CharField(max_length=200,blank=True)
     updated_field = models.CharField(max_length=200,blank=True)
-    date_changed = models.DateTimeField(auto_now_add=True)
+    # set when the change happens, not when a buffered history writer gets around to inserting the row
+    date_changed = models.DateTimeField(default=timezone.now,editable=False)
     status = models.CharField(max_length=20,null=True)
     # might have to change the save method to include the profile
     user = models.CharField(max_length=100,null=True,blank=True)
-    project = models.ForeignKey(Project,on_delete=models.CASCADE)
-    list_string = None
-
-    #it works for creating!
-    def __init__(self,*args,**kwargs):
-        super(ProjectHistory,self).__init__(*args,**kwargs)
-        self.create_history_string()
-
+    # deleting a project leaves its history behind instead of deleting every row in the request,
+    # history.purge_deleted_project_history removes it later in chunks.
+    # Empty for changes outside of a project, like to a profile, and for the deletion of a project itself.
+    project = models.ForeignKey(Project,on_delete=models.DO_NOTHING,db_constraint=False,null=True,blank=True)
+    # the component or task the change was made to, kept after it is deleted so its history can still be read
+    component = models.ForeignKey(ProjectComponent,on_delete=models.DO_NOTHING,db_constraint=False,db_index=False,
+                                  null=True,blank=True,related_name='history')
+    # JSON of the whole row after the change, only for models recorded at "row" granularity
+    snapshot = models.TextField(blank=True)
+    # the label and primary key of the row that changed, e.g. "assemble.Profile" and its id
+    model = models.CharField(max_length=100,blank=True,default='')
+    object_id = models.PositiveIntegerField(null=True,blank=True)
+    # the field an edit changed, previous_field and updated_field hold its old and new value
+    field = models.CharField(max_length=50,blank=True,default='')
+
+    class Meta:
+        # the history page walks a project's rows newest first, see history.get_history_page
+        indexes = [
+            models.Index(fields=['project','-date_changed','-id'],name='history_project_date_idx'),
+            models.Index(fields=['component','-date_changed','-id'],name='history_component_date_idx'),
+            models.Index(fields=['model','object_id'],name='history_object_idx'),
+        ]
+
+    # the string is only built for rows that are actually displayed
+    @property
+    def list_string(self):
+        return self.create_history_string()
 
     # maybe add a method to return a string of the fields to display?
     # -- will need name of user
@@ -226,26 +659,335 @@ class ProjectHistory(models.Model):
     # the logic is the issue
 
     def __str__(self):
-        return self.list_string
+        return self.list_string or ''
 
     def create_history_string(self):
+        # changes made outside of a request, e.g. from the shell, have nobody to put them on
+        user = self.user or "unknown"
         if self.status == "deleted":
-            self.list_string= f"{self.previous_field} was {self.status} by {self.user}."
+            return f"{self.previous_field} was {self.status} by {user}."
+        elif self.status == "edited" and self.field not in ('','name'):
+            return f"The {self.field} was {self.status} from {self.previous_field} to {self.updated_field} by {user}."
         elif self.status == "edited":
-            self.list_string= f"{self.previous_field} was {self.status} to {self.updated_field} by {self.user}."
+            return f"{self.previous_field} was {self.status} to {self.updated_field} by {user}."
         elif self.status == "updated to true":
-            self.list_string = f"{self.previous_field} was updated to complete by {self.user}."
+            return f"{self.previous_field} was updated to complete by {user}."
         elif self.status == "updated to false":
-            self.list_string = f"{self.previous_field} was updated to uncompleted by {self.user}."
+            return f"{self.previous_field} was updated to uncompleted by {user}."
         elif self.status == "created":
-            self.list_string= f"{self.previous_field} was created by {self.user}."
+            return f"{self.previous_field} was created by {user}."
+        elif self.status == "imported":
+            return f"{self.previous_field} were imported by {user}."
+        elif self.status == "member added":
+            return f"{self.previous_field} was added to the project by {user}."
+        elif self.status == "member removed":
+            return f"{self.previous_field} was removed from the project by {user}."
+        elif self.status == "friend added":
+            return f"{self.updated_field} was added as a friend of {self.previous_field} by {user}."
+        elif self.status == "friend removed":
+            return f"{self.updated_field} was removed as a friend of {self.previous_field} by {user}."
+        elif self.status == "summary":
+            return f"{self.updated_field} changes were made this day by {user}."
 
 
 def get_list_of_project_component_history_records(project):
     """
     :param project:  A project model object that has been queried.
-    :return: A list of historical record queryset for each component
+    :return: A list with the ProjectHistory records of each component, newest first
+    """
+    records = Prefetch('history',queryset=ProjectHistory.objects.order_by('-date_changed','-id'))
+    return [component.history.all() for component in project.projectcomponent_set.prefetch_related(records)]
+
+
+# bulk queries don't send post_save, the helpers below send this instead so history (see history.py) still
+# records their changes. instances are the saved components, created is True for new rows and imported is True
+# when they came from an import, which is recorded as one change.
+components_saved = Signal()
+
+def bulk_create_components(components,progress_changes=(),version=None,imported=False):
+    """
+    Creates many components/tasks with a few queries per nesting level instead of a save per object.
+    Slugs are allocated up front and paths are filled in once the ids are known.
+    A component's task may be another unsaved component from the same list, parents are created first.
+    Call it inside a transaction.
+
+    :param components: A list of unsaved ProjectComponent objects.
+    :param progress_changes: Other changes for apply_progress_changes, applied together with the new components.
+    :param version: The change version the caller already moved the components' project to, if it did.
+    :param imported: Whether the components are an import, see components_saved.
+    :return: The same list, with ids, slugs and paths filled in.
+    """
+    if not components:
+        apply_progress_changes(progress_changes)
+        return components
+    versions = {}
+    for component in components:
+        if component.project_id not in versions:
+            versions[component.project_id] = version if version is not None else next_change_version(component.project_id)
+        component.version = versions[component.project_id]
+    unnamed = [component for component in components if not component.slug]
+    for component,slug in zip(unnamed,allocate_slugs(ProjectComponent,[slugify(c.name) for c in unnamed])):
+        component.slug = slug
+
+    pending = list(components)
+    while pending:
+        level = [component for component in pending if component.task is None or component.task.pk]
+        if not level:
+            raise ValueError("Components can't be their own parents.")
+        pending = [component for component in pending if not (component.task is None or component.task.pk)]
+        for component in level:
+            # the parent may have been unsaved when it was assigned, copy its id over now
+            component.task = component.task
+        ProjectComponent.objects.bulk_create(level)
+        if any(component.pk is None for component in level):
+            # not every backend returns ids from a bulk insert, the slugs are unique so look them up
+            ids = {}
+            slugs = [component.slug for component in level]
+            for i in range(0,len(slugs),SLUG_QUERY_CHUNK_SIZE):
+                ids.update(ProjectComponent.objects.filter(slug__in=slugs[i:i + SLUG_QUERY_CHUNK_SIZE]).values_list('slug','id'))
+            for component in level:
+                component.pk = ids[component.slug]
+                component._state.adding = False
+        for component in level:
+            component.path = f"{component.task.path if component.task else ''}{component.pk}/"
+            component.depth = component.path.count('/') - 1
+        ProjectComponent.objects.bulk_update(level,['path','depth'],batch_size=500)
+    apply_progress_changes(list(progress_changes) +
+                           [(component.project_id,component.path,1,int(component.completed)) for component in components
+                            if component.task_id])
+    fulltext.index_components(components)
+    components_saved.send(sender=ProjectComponent,instances=components,created=True,imported=imported)
+    return components
+
+def bulk_update_components(components,fields):
+    """
+    Saves fields of many loaded components with one bulk update.
+    """
+    ProjectComponent.objects.bulk_update(components,fields)
+    components_saved.send(sender=ProjectComponent,instances=components,created=False,imported=False)
+
+
+# a board further behind than this many versions gets a full snapshot, deletions older than that are forgotten
+CHANGES_MAX_VERSION_GAP = 1000
+# a board that would get more changed rows than this gets a full snapshot instead
+CHANGES_MAX_ROWS = 500
+
+def next_change_version(project_id):
+    """
+    Moves a project to its next change version. Call it in the transaction making the change and stamp the
+    changed rows with the result, boards never see the new version without the rows that go with it.
+
+    :return: The new version.
+    """
+    Project.objects.filter(pk=project_id).update(version=F('version') + 1)
+    bump_member_versions([project_id])
+    return Project.objects.filter(pk=project_id).values_list('version',flat=True).get()
+
+def record_deletions(project_id,component_ids,version=None):
+    """
+    Leaves a DeletedComponent behind for every component about to be deleted from a project.
+
+    :param version: The change version the caller already moved the project to, if it did.
+    """
+    if not component_ids:
+        return
+    if version is None:
+        version = next_change_version(project_id)
+    DeletedComponent.objects.bulk_create([DeletedComponent(project_id=project_id,component_id=pk,version=version)
+                                          for pk in component_ids],batch_size=500)
+    DeletedComponent.objects.filter(project_id=project_id,version__lte=version - CHANGES_MAX_VERSION_GAP).delete()
+
+def _component_state(component):
+    return {"id":component["id"],"name":component["name"],"completed":component["completed"],
+            "parent":component["task_id"],"depth":component["depth"]}
+
+def get_project_changes(project,since=None):
+    """
+    What a board that last saw the project at version `since` needs to catch up.
+
+    :param project: A Project.
+    :param since: The version the board has, None for a board that has nothing yet.
+    :return: A dictionary with the project's current version, its progress, the components and tasks
+             created or changed since then and the ids of the deleted ones. "full" is True when the board is
+             too far behind or doesn't know its version, components then holds all of them and the board
+             has to drop whatever else it has.
+    """
+    version = project.version
+    fields = ('id','name','completed','task_id','depth')
+    changed,deleted = None,[]
+    if since is not None and version - CHANGES_MAX_VERSION_GAP < since <= version:
+        changed = list(ProjectComponent.objects.filter(project=project,version__gt=since)
+                       .order_by('path').values(*fields)[:CHANGES_MAX_ROWS + 1])
+        deleted = list(DeletedComponent.objects.filter(project=project,version__gt=since)
+                       .values_list('component_id',flat=True)[:CHANGES_MAX_ROWS + 1])
+        if len(changed) + len(deleted) > CHANGES_MAX_ROWS:
+            changed,deleted = None,[]
+    full = changed is None
+    if full:
+        changed = ProjectComponent.objects.filter(project=project).order_by('path').values(*fields)
+    return {
+        "version":version,
+        "full":full,
+        "project":{"name":project.name,"completed":project.completed,
+                   "task_count":project.task_count,"completed_task_count":project.completed_task_count},
+        "components":[_component_state(component) for component in changed],
+        "deleted":deleted,
+    }
+
+
+PROGRESS_UPDATE_CHUNK_SIZE = 500
+
+def count_tasks(path,rows,completed,root_completed):
+    """
+    Only components with a parent are tasks, top level components have no toggle on the board and are
+    never counted.
+
+    :param path: Where the subtree's root is, or is going to be.
+    :param rows: How many rows are in the subtree, the root included.
+    :param completed: How many of them are completed.
+    :param root_completed: 1 if the root is completed, else 0.
+    :return: A (tasks,completed tasks) tuple for apply_progress_changes.
+    """
+    if path.count('/') == 1:
+        return rows - 1,completed - root_completed
+    return rows,completed
+
+def apply_progress_changes(changes):
+    """
+    Adds changes to the task counters of every component above the changed ones and of their projects.
+    Every counter is moved with an F() expression in the database, so concurrent changes can't overwrite
+    each other. Components that get the same change are updated with one query.
+
+    :param changes: A list of (project_id,path,total_change,completed_change) tuples, one per task or
+        subtree that was created, deleted, moved or had its completed field changed. Only tasks are counted,
+        see count_tasks.
+    """
+    components = {}
+    projects = {}
+    for project_id,path,total,completed in changes:
+        for pk in path.split('/')[:-2]:
+            counts = components.setdefault(int(pk),[0,0])
+            counts[0] += total
+            counts[1] += completed
+        counts = projects.setdefault(project_id,[0,0])
+        counts[0] += total
+        counts[1] += completed
+    for model,counters in ((ProjectComponent,components),(Project,projects)):
+        grouped = {}
+        for pk,(total,completed) in counters.items():
+            if total or completed:
+                grouped.setdefault((total,completed),[]).append(pk)
+        for (total,completed),ids in grouped.items():
+            changes = {
+                'task_count':F('task_count') + total,
+                'completed_task_count':F('completed_task_count') + completed,
+            }
+            if model is Project:
+                # both sides of the comparison are the values from before this update
+                changes['completed'] = Case(
+                    When(Q(task_count__gt=-total) & Q(completed_task_count=F('task_count') + (total - completed)),then=Value(True)),
+                    default=Value(False),output_field=models.BooleanField())
+            for i in range(0,len(ids),PROGRESS_UPDATE_CHUNK_SIZE):
+                model.objects.filter(pk__in=ids[i:i + PROGRESS_UPDATE_CHUNK_SIZE]).update(**changes)
+
+
+def rebuild_progress(project_ids=None):
+    """
+    Recounts the task counters of components and projects from scratch, for when they have drifted.
+
+    :param project_ids: Only rebuild these projects, None for every project.
+    :return: The number of components and projects whose counters were wrong.
+    """
+    projects = Project.objects.all() if project_ids is None else Project.objects.filter(pk__in=project_ids)
+    repaired = 0
+    for project in projects.iterator():
+        components = list(ProjectComponent.objects.filter(project_id=project.pk))
+        counts = {component.pk:[0,0] for component in components}
+        for component in components:
+            for pk in component.path.split('/')[:-2]:
+                if int(pk) in counts:
+                    counts[int(pk)][0] += 1
+                    counts[int(pk)][1] += int(component.completed)
+        wrong = [component for component in components
+                 if [component.task_count,component.completed_task_count] != counts[component.pk]]
+        for component in wrong:
+            component.task_count,component.completed_task_count = counts[component.pk]
+        ProjectComponent.objects.bulk_update(wrong,['task_count','completed_task_count'],batch_size=PROGRESS_UPDATE_CHUNK_SIZE)
+        tasks = [component for component in components if component.task_id]
+        total = len(tasks)
+        completed = sum(task.completed for task in tasks)
+        if (project.task_count,project.completed_task_count,project.completed) != (total,completed,bool(total) and total == completed):
+            Project.objects.filter(pk=project.pk).update(task_count=total,completed_task_count=completed,
+                                                         completed=bool(total) and total == completed)
+            wrong.append(project)
+        repaired += len(wrong)
+    return repaired
+
+
+PROJECT_PAGE_SIZE = 24
+# the order of every sort of the project list, the id makes the order unique for the cursor
+PROJECT_SORTS = {
+    'activity':('-last_activity','-id'),
+    'name':('name','id'),
+}
+
+def encode_project_cursor(project,sort):
+    value = project.last_activity.isoformat() if sort == 'activity' else project.name
+    return base64.urlsafe_b64encode(f"{value}|{project.id}".encode()).decode()
+
+def decode_project_cursor(cursor,sort):
+    """
+    :raises ValueError: If the cursor wasn't made by encode_project_cursor for this sort.
+    """
+    try:
+        value,pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|',1)
+    except (ValueError,UnicodeError):
+        raise ValueError("Invalid project cursor.")
+    if sort == 'activity':
+        value = parse_datetime(value)
+    if value is None or not pk.isdigit():
+        raise ValueError("Invalid project cursor.")
+    return value,int(pk)
+
+def get_project_page(projects,sort='activity',cursor=None,page_size=PROJECT_PAGE_SIZE):
+    """
+    Returns one page of projects. Pages are found by seeking past the last project of the previous page,
+    so a user in hundreds of projects gets every page for the same cost.
+
+    :param projects: A queryset of projects, e.g. the ones a user belongs to.
+    :param sort: One of PROJECT_SORTS, "activity" puts the most recently changed projects first.
+    :param cursor: The cursor of the previous page, None for the first page.
+    :return: A (list of projects,cursor of the next page or None) tuple.
+    :raises ValueError: For an unknown sort or an invalid cursor.
+    """
+    if sort not in PROJECT_SORTS:
+        raise ValueError(f"Projects can't be sorted by {sort!r}.")
+    if cursor:
+        value,pk = decode_project_cursor(cursor,sort)
+        if sort == 'activity':
+            projects = projects.filter(Q(last_activity__lt=value) | Q(last_activity=value,id__lt=pk))
+        else:
+            projects = projects.filter(Q(name__gt=value) | Q(name=value,id__gt=pk))
+    projects = list(projects.order_by(*PROJECT_SORTS[sort])[:page_size + 1])
+    next_cursor = encode_project_cursor(projects[page_size - 1],sort) if len(projects) > page_size else None
+    return projects[:page_size],next_cursor
+
+
+def get_project_component_tree(project):
+    """
+    Loads every component and task of a project in one query and links them together in memory.
+    Each component gets a `tasks` list holding its children, so templates and views never have to
+    call component.component.all() per component.
+
+    :param project: A project model object that has been queried.
+    :return: A list of the top level components of the project (task=None), ordered by creation.
     """
-    return [test.history.all() for test in project.projectcomponent_set.all()]
+    components = list(ProjectComponent.objects.filter(project_id=project.id).order_by('id'))
+    children = {}
+    for component in components:
+        children.setdefault(component.task_id,[]).append(component)
+    for component in components:
+        component.tasks = children.get(component.id,[])
+    return children.get(None,[])
 
 
@@ -0,0 +1,78 @@
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from .models import profile_cache_key
+
+
+"""
+Gives every request a `request.profile`, the Profile of the signed in user (None for anonymous users).
+
+ProfileBackend loads the user and their profile with one joined query when the session is read,
+so request.profile costs nothing extra. Sessions made by the plain ModelBackend before it was added
+still work, their profile is fetched the first time request.profile is used.
+
+With PROFILE_CACHE_TIMEOUT set the joined user and profile are also kept in the cache for that many seconds,
+saving the query on the following requests. Saving a User or Profile drops its cache entry.
+
+Requests answered outside of Django's middleware (assemble.realtime) get the same
+attributes from authenticate_session.
+"""
+
+
+class ProfileBackend(ModelBackend):
+
+    def get_user(self,user_id):
+        timeout = getattr(settings,'PROFILE_CACHE_TIMEOUT',0)
+        user = cache.get(profile_cache_key(user_id)) if timeout else None
+        if user is None:
+            try:
+                user = User._default_manager.select_related('profile').get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            if timeout:
+                cache.set(profile_cache_key(user_id),user,timeout)
+        return user if self.user_can_authenticate(user) else None
+
+
+def get_profile(request):
+    """
+    The profile of the user making the request, loaded at most once per request.
+    Views use this rather than request.profile so requests that didn't go through the middleware work too.
+
+    :return: A Profile, or None if nobody is signed in.
+    """
+    if not hasattr(request,'_cached_profile'):
+        user = request.user
+        request._cached_profile = user.profile if user.is_authenticated else None
+    return request._cached_profile
+
+
+def authenticate_session(request):
+    """
+    Sets request.session, request.user and request.profile from the session cookie, like the session,
+    authentication and profile middleware do. It reads the session, so run it in a thread under ASGI.
+
+    :return: The signed in user, or an AnonymousUser.
+    """
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    request.user = get_user(request)
+    request.profile = get_profile(request)
+    return request.user
+
+
+class ProfileMiddleware:
+    """
+    Sets request.profile, it has to come after AuthenticationMiddleware.
+    """
+
+    def __init__(self,get_response):
+        self.get_response = get_response
+
+    def __call__(self,request):
+        request.profile = SimpleLazyObject(lambda: get_profile(request))
+        return self.get_response(request)
@@ -0,0 +1,266 @@
+import asyncio
+import io
+import json
+import logging
+import select
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection,connections,transaction,close_old_connections
+from django.urls import resolve,Resolver404
+from django.utils.module_loading import import_string
+from .models import Project
+from .profiles import authenticate_session
+
+
+"""
+Live updates of project boards.
+
+An open board keeps a Server-Sent Events stream to /events/projects/<slug>/. The stream is served by
+events_application, which sits in front of Django in core/asgi.py, so a waiting board holds an open
+socket on the event loop instead of a worker thread. Under WSGI the URL is answered by a plain
+Django view with 204, which tells the browser to stop reconnecting, and boards simply don't update live.
+
+The AJAX task views call publish_tasks after they change tasks. A message is the list of the changed
+tasks in the same shape the task command endpoint returns them, so boards apply small deltas instead
+of refetching. Messages are sent once the transaction commits:
+
+    publish_tasks -> backend.publish -> (other processes) -> broker.deliver -> one queue per open stream
+
+The broker holds the streams of this process. The backend carries messages between processes and is
+chosen with REALTIME_BACKEND: LocalBackend hands them straight to the broker, which is all a single
+process needs, PostgresBackend sends them with NOTIFY and has a thread per process LISTEN for them.
+"""
+
+logger = logging.getLogger(__name__)
+
+# messages waiting for a slow stream before it is told to resync instead
+REALTIME_QUEUE_SIZE = 100
+# seconds between comments sent on an idle stream so proxies don't close it
+REALTIME_KEEPALIVE = 15
+RESYNC = json.dumps({"resync":True})
+
+
+class Subscription:
+
+    def __init__(self,broker,project_id):
+        self.broker = broker
+        self.project_id = project_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=REALTIME_QUEUE_SIZE)
+
+    def put(self,message):
+        # called from whichever thread published the message, the queue belongs to the stream's event loop
+        self.loop.call_soon_threadsafe(self._put,message)
+
+    def _put(self,message):
+        if self.queue.full():
+            # the board fell behind, the deltas it missed are dropped and it reloads instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = RESYNC
+        self.queue.put_nowait(message)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait,None)
+
+    async def get(self):
+        """
+        :return: The next message, or None once the stream is closed.
+        """
+        return await self.queue.get()
+
+
+class Broker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self,project_id):
+        """
+        Must be called from the event loop the messages will be read in.
+        """
+        subscription = Subscription(self,project_id)
+        with self._lock:
+            self._subscriptions.setdefault(project_id,set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self,subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.project_id,set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.project_id,None)
+
+    def subscriber_count(self,project_id):
+        with self._lock:
+            return len(self._subscriptions.get(project_id,()))
+
+    def deliver(self,project_id,message):
+        """
+        Hands a message to every stream of the project open in this process.
+
+        :param message: The message, already serialized.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(project_id,()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+
+broker = Broker()
+
+
+class LocalBackend:
+    """
+    Delivers messages to the streams of this process only, for a single process and for tests.
+    """
+
+    def start(self):
+        pass
+
+    def publish(self,project_id,message):
+        broker.deliver(project_id,message)
+
+
+class PostgresBackend:
+    """
+    Sends messages to every process with NOTIFY on one channel, a thread started with the first stream
+    of a process LISTENs on its own connection and delivers them to the local broker.
+    """
+    channel = 'assemble_realtime'
+    # NOTIFY payloads are limited to 8000 bytes, bigger messages make the boards resync
+    max_message_size = 7900
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen,name='realtime-listener',daemon=True)
+                self._thread.start()
+
+    def publish(self,project_id,message):
+        payload = f"{project_id}:{message}"
+        if len(payload.encode()) > self.max_message_size:
+            payload = f"{project_id}:{RESYNC}"
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s,%s)",[self.channel,payload])
+
+    def _listen(self):
+        import psycopg2
+        while True:
+            try:
+                listener = psycopg2.connect(**connections['default'].get_connection_params())
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                while True:
+                    if select.select([listener],[],[],REALTIME_KEEPALIVE) == ([],[],[]):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        project_id,message = listener.notifies.pop(0).payload.split(':',1)
+                        broker.deliver(int(project_id),message)
+            except Exception:
+                logger.exception("Lost the realtime listener connection, reconnecting.")
+                time.sleep(1)
+
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(settings,'REALTIME_BACKEND','assemble.realtime.LocalBackend'))()
+    return _backend
+
+
+def publish_tasks(project_id,tasks,origin=None):
+    """
+    Sends changed tasks to every board of the project once the current transaction commits.
+
+    :param project_id: The id of the project the tasks belong to.
+    :param tasks: A list of task states, see views._task_state.
+    :param origin: The id the board that made the change sent along, so it can skip its own changes.
+    """
+    if not tasks:
+        return
+    message = json.dumps({"tasks":tasks,"origin":origin})
+    transaction.on_commit(lambda: get_backend().publish(project_id,message))
+
+
+@sync_to_async
+def _authorize(scope,project_slug):
+    """
+    :return: The id of the project if the session in the request's cookies belongs to one of its members, otherwise None.
+    """
+    close_old_connections()
+    try:
+        user = authenticate_session(ASGIRequest(scope,io.BytesIO()))
+        if not user.is_authenticated:
+            return None
+        return Project.objects.filter(slug=project_slug,user__user=user).values_list('id',flat=True).first()
+    finally:
+        close_old_connections()
+
+
+async def _wait_for_disconnect(receive,subscription):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    subscription.close()
+
+
+async def stream_project_events(scope,receive,send,project_slug):
+    project_id = await _authorize(scope,project_slug)
+    if project_id is None:
+        await send({'type':'http.response.start','status':403,'headers':[(b'content-type',b'text/plain')]})
+        await send({'type':'http.response.body','body':b'Forbidden'})
+        return
+    await send({'type':'http.response.start','status':200,'headers':[
+        (b'content-type',b'text/event-stream'),
+        (b'cache-control',b'no-cache'),
+        # stops nginx from buffering the stream
+        (b'x-accel-buffering',b'no'),
+    ]})
+    subscription = broker.subscribe(project_id)
+    get_backend().start()
+    watcher = asyncio.ensure_future(_wait_for_disconnect(receive,subscription))
+    try:
+        await send({'type':'http.response.body','body':b'retry: 3000\n\n','more_body':True})
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.get(),REALTIME_KEEPALIVE)
+            except asyncio.TimeoutError:
+                chunk = b': keepalive\n\n'
+            else:
+                if message is None:
+                    break
+                chunk = f"data: {message}\n\n".encode()
+            await send({'type':'http.response.body','body':chunk,'more_body':True})
+    finally:
+        broker.unsubscribe(subscription)
+        watcher.cancel()
+
+
+def events_application(application):
+    """
+    Wraps the Django ASGI application and serves the project event streams itself.
+
+    :param application: The ASGI application every other request goes to.
+    """
+    async def app(scope,receive,send):
+        if scope['type'] == 'http' and scope['path'].startswith('/events/'):
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.url_name == 'project-events':
+                return await stream_project_events(scope,receive,send,match.kwargs['project_slug'])
+        return await application(scope,receive,send)
+    return app
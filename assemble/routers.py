@@ -0,0 +1,124 @@
+import contextvars
+import functools
+import random
+import time
+from django.conf import settings
+from django.db import connections
+
+
+"""
+Sends the reads of read-only views to a replica of the database.
+
+DATABASE_REPLICAS names the replica aliases in DATABASES, see DATABASE_REPLICA_URLS in core/settings.py.
+Without any, everything goes to default as before.
+
+Only the views wrapped in read_from_replica read from a replica, everything else, including the views that
+read before they write, management commands and background threads, uses default. Within those views:
+    - sessions are always read from default, a new session may not have reached the replica yet,
+    - reads inside a transaction stay on default with the writes they go with,
+    - a browser that wrote something in the last REPLICA_PIN_SECONDS reads from default, so users see their
+      own changes at once and never a board from before them. ReplicaPinMiddleware sets the pin cookie on
+      the response of every request that wrote.
+
+A replica that falls behind by more than REPLICA_PIN_SECONDS still shows other users' changes late, never
+the user's own.
+"""
+
+REPLICA_PIN_COOKIE = 'assemble_primary'
+
+
+class RoutingState:
+
+    def __init__(self,pinned=False):
+        # the browser wrote recently, or this request already did
+        self.pinned = pinned
+        self.wrote = False
+        self.use_replica = False
+
+
+_state = contextvars.ContextVar('assemble_routing_state',default=None)
+
+
+def get_replicas():
+    return getattr(settings,'DATABASE_REPLICAS',[])
+
+
+class ReplicaRouter:
+
+    def db_for_read(self,model,**hints):
+        state = _state.get()
+        replicas = get_replicas()
+        if (not replicas or state is None or not state.use_replica or state.pinned
+                or model._meta.app_label == 'sessions' or connections['default'].in_atomic_block):
+            return 'default'
+        return random.choice(replicas)
+
+    def db_for_write(self,model,**hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.pinned = True
+        return 'default'
+
+    def allow_relation(self,obj1,obj2,**hints):
+        # the replicas hold the same rows as default
+        return True
+
+    def allow_migrate(self,db,app_label,model_name=None,**hints):
+        # replicas get their tables from default, not from migrate
+        return db not in get_replicas()
+
+
+def _recently_wrote(request):
+    try:
+        return time.time() - float(request.COOKIES.get(REPLICA_PIN_COOKIE,0)) < settings.REPLICA_PIN_SECONDS
+    except ValueError:
+        return False
+
+
+def start_routing(request):
+    """
+    Starts keeping track of the request's writes, see finish_routing.
+
+    :return: A token for finish_routing.
+    """
+    return _state.set(RoutingState(pinned=_recently_wrote(request)))
+
+
+def finish_routing(token,response):
+    """
+    Pins the browser to default for a while if the request wrote anything.
+    """
+    state = _state.get()
+    _state.reset(token)
+    if state is not None and state.wrote and get_replicas():
+        response.set_cookie(REPLICA_PIN_COOKIE,str(time.time()),max_age=settings.REPLICA_PIN_SECONDS,
+                            httponly=True,samesite='Lax')
+    return response
+
+
+class ReplicaPinMiddleware:
+
+    def __init__(self,get_response):
+        self.get_response = get_response
+
+    def __call__(self,request):
+        token = start_routing(request)
+        return finish_routing(token,self.get_response(request))
+
+
+def read_from_replica(view):
+    """
+    Lets a view that doesn't write read from a replica.
+    """
+    @functools.wraps(view)
+    def wrapper(request,*args,**kwargs):
+        state = _state.get()
+        if state is None:
+            return view(request,*args,**kwargs)
+        state.use_replica = True
+        try:
+            return view(request,*args,**kwargs)
+        finally:
+            state.use_replica = False
+    return wrapper
@@ -0,0 +1,127 @@
+from django.db import connections,router
+from django.db.models import Count,Exists,OuterRef
+from .models import Profile,Project,ProjectComponent,FriendRequest,UsernameTrigram,trigrams
+from . import fulltext
+
+
+"""
+Searches behind the search box.
+
+Users
+    A query matches usernames that start with it (a range scan on Profile.search_name) and, from three
+    letters on, usernames sharing at least half of its trigrams (UsernameTrigram). Prefix matches come first
+    from shortest to longest, so an exact match leads, then trigram matches by how many trigrams they share.
+
+Projects, components and tasks
+    Go through the full-text index in assemble.fulltext, limited to the projects the user works on.
+    Every word has to match and the last one may be unfinished, results are ranked by relevance.
+    Only the newest fulltext.SEARCH_MAX_CANDIDATES matches are ranked, search_projects says when
+    older ones were left out so the page can ask for more words.
+"""
+
+USER_SEARCH_PAGE_SIZE = 10
+PROJECT_SEARCH_PAGE_SIZE = 20
+# how many matches of each kind are ranked, deeper pages of a typeahead are never looked at
+USER_SEARCH_MAX_MATCHES = 200
+
+FRIEND = 'friend'
+REQUEST_SENT = 'request sent'
+REQUEST_RECEIVED = 'request received'
+
+
+def _rank_usernames(query,exclude_id=None):
+    prefix = Profile.objects.filter(search_name__gte=query,search_name__lt=query + '\uffff')
+    if exclude_id is not None:
+        prefix = prefix.exclude(id=exclude_id)
+    scores = {}
+    for pk,name in prefix.order_by('search_name').values_list('id','search_name')[:USER_SEARCH_MAX_MATCHES]:
+        # the shortest prefix match is the exact match, if there is one
+        scores[pk] = (0,len(name),name)
+    grams = trigrams(query)
+    if grams:
+        matches = (UsernameTrigram.objects.filter(trigram__in=grams).values('profile')
+                   .annotate(hits=Count('id')).filter(hits__gte=(len(grams) + 1) // 2)
+                   .order_by('-hits','profile')[:USER_SEARCH_MAX_MATCHES])
+        for match in matches:
+            if match['profile'] not in scores and match['profile'] != exclude_id:
+                scores[match['profile']] = (1,-match['hits'],'')
+    return sorted(scores,key=lambda pk: scores[pk])
+
+
+def with_relationship_status(profiles,viewer):
+    """
+    Annotates a queryset of profiles with how they relate to the viewer, in the same query that loads them.
+
+    :param profiles: A queryset of Profiles.
+    :param viewer: The Profile of the user looking at them.
+    :return: The queryset with is_friend, request_sent and request_received annotations.
+    """
+    return profiles.annotate(
+        is_friend=Exists(Profile.friends.through.objects.filter(from_profile_id=viewer.pk,to_profile_id=OuterRef('pk'))),
+        request_sent=Exists(FriendRequest.objects.filter(from_user_id=viewer.user_id,to_user_id=OuterRef('user_id'))),
+        request_received=Exists(FriendRequest.objects.filter(from_user_id=OuterRef('user_id'),to_user_id=viewer.user_id)),
+    )
+
+
+def relationship_status(profile):
+    """
+    :param profile: A Profile annotated by with_relationship_status.
+    :return: FRIEND, REQUEST_SENT, REQUEST_RECEIVED or None.
+    """
+    if profile.is_friend:
+        return FRIEND
+    if profile.request_sent:
+        return REQUEST_SENT
+    if profile.request_received:
+        return REQUEST_RECEIVED
+    return None
+
+
+def search_users(query,viewer,page=1,page_size=USER_SEARCH_PAGE_SIZE):
+    """
+    :param query: What was typed into the search box.
+    :param viewer: The Profile of the user searching, they are left out of the results.
+    :param page: The page of results, starting at 1.
+    :return: A (list of Profiles with a `relationship` attribute,whether there is a next page) tuple.
+    """
+    query = query.strip().lower()
+    if not query or page < 1:
+        return [],False
+    ranked = _rank_usernames(query,viewer.pk)
+    ids = ranked[(page - 1) * page_size:page * page_size]
+    profiles = with_relationship_status(Profile.objects.filter(id__in=ids).select_related('user'),viewer).in_bulk()
+    results = []
+    for pk in ids:
+        profile = profiles[pk]
+        profile.relationship = relationship_status(profile)
+        results.append(profile)
+    return results,len(ranked) > page * page_size
+
+
+def search_projects(query,profile,page=1,page_size=PROJECT_SEARCH_PAGE_SIZE):
+    """
+    Ranks the newest fulltext.SEARCH_MAX_CANDIDATES matches only, a word found in more places than that
+    leaves the older ones out and truncated says so.
+
+    :param query: What was typed into the search box.
+    :param profile: The Profile of the user searching, only the projects they work on are searched.
+    :param page: The page of results, starting at 1.
+    :return: A (list of Projects and ProjectComponents with a `score` attribute,whether there is a next page,
+        truncated) tuple.
+    """
+    if page < 1:
+        return [],False,False
+    project_ids = Project.user.through.objects.filter(profile_id=profile.pk).values_list('project_id',flat=True)
+    # the index lives next to the tables, so it is read from wherever the projects are
+    matches,truncated = fulltext.search(query,project_ids,page_size + 1,(page - 1) * page_size,
+                                        using=connections[router.db_for_read(Project)])
+    projects = Project.objects.in_bulk([object_id for kind,object_id,_,_ in matches if kind == 'project'])
+    components = ProjectComponent.objects.select_related('project').in_bulk(
+        [object_id for kind,object_id,_,_ in matches if kind == 'component'])
+    results = []
+    for kind,object_id,_,score in matches[:page_size]:
+        result = (projects if kind == 'project' else components).get(object_id)
+        if result is not None:
+            result.score = score
+            results.append(result)
+    return results,len(matches) > page_size,truncated
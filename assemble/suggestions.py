@@ -0,0 +1,223 @@
+import heapq
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import m2m_changed,post_delete
+from .models import Profile,Project
+
+
+"""
+"People you may know" for the profile page.
+
+FriendGraph keeps the friends graph and project memberships in memory as sets of profile ids,
+built with two queries over the through tables. Candidates are the friends of a user's friends and
+the people they share projects with, ranked by mutual friends and then shared projects, so a
+suggestion only touches the user's own neighbourhood and never the database.
+
+The index is kept up to date by the m2m_changed receivers below as friends and project members are added
+and removed in this process, and rebuilt after SUGGESTION_INDEX_MAX_AGE seconds to pick up changes
+made by other processes. A stale index is rebuilt by one background thread while requests keep being
+answered from the old one, only the very first build (or one after invalidate) is waited for.
+"""
+
+SUGGESTION_COUNT = 10
+
+logger = logging.getLogger(__name__)
+
+
+class FriendGraph:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # held by whichever thread is building, so the through tables are only read by one at a time
+        self._build_lock = threading.Lock()
+        self._built = None
+        self._generation = 0
+        # changes made while a build reads the tables, replayed onto the new graph, None when not building
+        self._changes = None
+        self.friends = {}
+        self.projects = {}
+        self.members = {}
+
+    def _stale(self):
+        max_age = getattr(settings,'SUGGESTION_INDEX_MAX_AGE',300)
+        return self._built is None or time.monotonic() - self._built > max_age
+
+    def build(self):
+        """
+        Loads the whole graph from the friends and project member through tables.
+        """
+        with self._build_lock:
+            self._build()
+
+    def _read(self):
+        friends,projects,members = {},{},{}
+        for profile_id,friend_id in Profile.friends.through.objects.values_list('from_profile_id','to_profile_id').iterator():
+            friends.setdefault(profile_id,set()).add(friend_id)
+        for project_id,profile_id in Project.user.through.objects.values_list('project_id','profile_id').iterator():
+            projects.setdefault(profile_id,set()).add(project_id)
+            members.setdefault(project_id,set()).add(profile_id)
+        return friends,projects,members
+
+    def _build(self):
+        with self._lock:
+            generation = self._generation
+            self._changes = []
+        try:
+            friends,projects,members = self._read()
+        except Exception:
+            with self._lock:
+                self._changes = None
+            raise
+        with self._lock:
+            changes,self._changes = self._changes,None
+            self.friends,self.projects,self.members = friends,projects,members
+            # the rows read may or may not have included them, adding and removing again is harmless
+            for change,args in changes:
+                change(*args)
+            # invalidated while reading, the next suggestion builds again
+            self._built = time.monotonic() if generation == self._generation else None
+
+    def _build_in_background(self):
+        try:
+            self._build()
+        except Exception:
+            # the old graph keeps being used, the next suggestion tries again
+            logger.exception("Rebuilding the friend suggestion index failed.")
+        finally:
+            self._build_lock.release()
+            # the thread ends here, its connection would be left open otherwise
+            connection.close()
+
+    def _refresh(self):
+        """
+        Builds the graph if there is none, waiting for a build already running, or starts rebuilding a stale one
+        in a background thread unless one is already at it.
+        """
+        if self._built is None:
+            with self._build_lock:
+                if self._built is None:
+                    self._build()
+        elif self._build_lock.acquire(blocking=False):
+            if self._stale():
+                threading.Thread(target=self._build_in_background,daemon=True).start()
+            else:
+                self._build_lock.release()
+
+    def _record(self,change,*args):
+        if self._changes is not None:
+            self._changes.append((change,args))
+
+    def invalidate(self):
+        with self._lock:
+            self._built = None
+            self._generation += 1
+
+    def add_friends(self,profile_id,friend_ids):
+        with self._lock:
+            self._record(self.add_friends,profile_id,list(friend_ids))
+            for friend_id in friend_ids:
+                self.friends.setdefault(profile_id,set()).add(friend_id)
+                self.friends.setdefault(friend_id,set()).add(profile_id)
+
+    def remove_friends(self,profile_id,friend_ids):
+        with self._lock:
+            self._record(self.remove_friends,profile_id,list(friend_ids))
+            for friend_id in friend_ids:
+                self.friends.get(profile_id,set()).discard(friend_id)
+                self.friends.get(friend_id,set()).discard(profile_id)
+
+    def add_members(self,project_id,profile_ids):
+        with self._lock:
+            self._record(self.add_members,project_id,list(profile_ids))
+            for profile_id in profile_ids:
+                self.projects.setdefault(profile_id,set()).add(project_id)
+                self.members.setdefault(project_id,set()).add(profile_id)
+
+    def remove_members(self,project_id,profile_ids):
+        with self._lock:
+            self._record(self.remove_members,project_id,list(profile_ids))
+            for profile_id in profile_ids:
+                self.projects.get(profile_id,set()).discard(project_id)
+                self.members.get(project_id,set()).discard(profile_id)
+
+    def remove_project(self,project_id):
+        with self._lock:
+            # replayed as a whole, a build running now may have read members this graph doesn't have
+            self._record(self.remove_project,project_id)
+            for profile_id in self.members.pop(project_id,()):
+                self.projects.get(profile_id,set()).discard(project_id)
+
+    def suggest(self,profile_id,count=SUGGESTION_COUNT,exclude=()):
+        """
+        :param profile_id: The id of the profile to find people for.
+        :param count: How many suggestions to return at most.
+        :param exclude: Profile ids to leave out, e.g. people with a pending friend request.
+        :return: A list of (profile_id,mutual friends,shared projects) tuples, best first.
+        """
+        if self._stale():
+            self._refresh()
+        with self._lock:
+            friends = self.friends.get(profile_id,set())
+            mutual = {}
+            for friend_id in friends:
+                for candidate in self.friends.get(friend_id,()):
+                    mutual[candidate] = mutual.get(candidate,0) + 1
+            shared = {}
+            for project_id in self.projects.get(profile_id,()):
+                for candidate in self.members.get(project_id,()):
+                    shared[candidate] = shared.get(candidate,0) + 1
+            skip = friends | set(exclude) | {profile_id}
+        candidates = (candidate for candidate in mutual.keys() | shared.keys() if candidate not in skip)
+        best = heapq.nlargest(count,candidates,key=lambda candidate: (mutual.get(candidate,0),shared.get(candidate,0),-candidate))
+        return [(candidate,mutual.get(candidate,0),shared.get(candidate,0)) for candidate in best]
+
+
+graph = FriendGraph()
+
+def suggest_friends(profile,count=SUGGESTION_COUNT,exclude=()):
+    """
+    :param profile: The Profile to find people for.
+    :return: A list of Profiles with `mutual_friends` and `shared_projects` set, best first.
+    """
+    ranked = graph.suggest(profile.pk,count,exclude)
+    profiles = Profile.objects.select_related('user').in_bulk([profile_id for profile_id,_,_ in ranked])
+    suggestions = []
+    for profile_id,mutual,shared in ranked:
+        if profile_id in profiles:
+            suggestion = profiles[profile_id]
+            suggestion.mutual_friends,suggestion.shared_projects = mutual,shared
+            suggestions.append(suggestion)
+    return suggestions
+
+
+# applied even before the first build finishes, the build replays them onto what it read
+def friends_changed_receiver(sender,instance,action,reverse,pk_set,**kwargs):
+    if action == 'post_add':
+        graph.add_friends(instance.pk,pk_set)
+    elif action == 'post_remove':
+        graph.remove_friends(instance.pk,pk_set)
+    elif action == 'post_clear':
+        graph.invalidate()
+
+def members_changed_receiver(sender,instance,action,reverse,pk_set,**kwargs):
+    if action in ('post_add','post_remove'):
+        # reverse is True when the change was made from the profile's side, e.g. profile.project_set.add(project)
+        pairs = [(pk,instance.pk) for pk in pk_set] if reverse else [(instance.pk,pk) for pk in pk_set]
+        for project_id,profile_id in pairs:
+            if action == 'post_add':
+                graph.add_members(project_id,[profile_id])
+            else:
+                graph.remove_members(project_id,[profile_id])
+    elif action == 'post_clear':
+        graph.invalidate()
+
+def project_deleted_receiver(sender,instance,**kwargs):
+    # the member rows are deleted along with the project without an m2m_changed signal
+    graph.remove_project(instance.pk)
+
+m2m_changed.connect(friends_changed_receiver,sender=Profile.friends.through)
+m2m_changed.connect(members_changed_receiver,sender=Project.user.through)
+post_delete.connect(project_deleted_receiver,sender=Project)
@@ -0,0 +1,151 @@
+import json
+from unittest import mock
+from urllib.parse import urlencode
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.http import HttpRequest
+from django.test import TransactionTestCase,override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from assemble.models import *
+from assemble.async_views import async_application
+from assemble import history,async_views
+
+
+class AsyncAjaxViewsTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.bob = User.objects.create(username="bob").profile
+        self.project = Project.objects.create(name="board",description="",owner=self.bob)
+        self.project.user.add(self.bob)
+        self.component = ProjectComponent.objects.create(name="component",project=self.project)
+        self.task = ProjectComponent.objects.create(name="task",project=self.project,task=self.component)
+        self.django_application = get_asgi_application()
+        self.application = async_application(self.django_application)
+        self.client.force_login(self.bob.user)
+        request = HttpRequest()
+        self.csrf_token = get_token(request)
+        self.cookies = (f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}; "
+                        f"{settings.CSRF_COOKIE_NAME}={request.META['CSRF_COOKIE']}")
+
+    def call(self,path,query=None,data=None,csrf=True,cookies=None,application=None):
+        """
+        :return: A (status,decoded JSON body or None) tuple.
+        """
+        headers = [(b'host',b'localhost'),(b'cookie',(self.cookies if cookies is None else cookies).encode())]
+        body = b''
+        if data is not None:
+            body = urlencode(data).encode()
+            headers.append((b'content-type',b'application/x-www-form-urlencoded'))
+            if csrf:
+                headers.append((b'x-csrftoken',self.csrf_token.encode()))
+        scope = {'type':'http','method':'GET' if data is None else 'POST','path':path,'headers':headers,
+                 'query_string':urlencode(query or {}).encode(),'root_path':'','server':('localhost',80)}
+        sent = []
+
+        async def receive():
+            return {'type':'http.request','body':body,'more_body':False}
+
+        async def send(message):
+            sent.append(message)
+
+        async_to_sync(application or self.application)(scope,receive,send)
+        content = b''.join(message.get('body',b'') for message in sent[1:])
+        is_json = (b'content-type',b'application/json') in [(name.lower(),value) for name,value in sent[0]['headers']]
+        return sent[0]['status'],json.loads(content) if is_json else None
+
+    def test_toggle_and_history(self):
+        status,data = self.call(reverse('finish-task-ajax'),{'pk':self.task.pk})
+        self.assertEqual((status,data),(200,{'name':'task'}))
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.completed)
+        self.assertEqual(history.writer.pending(),0)
+        toggle = ProjectHistory.objects.get(component=self.task,status="updated to true")
+        self.assertEqual(toggle.user,self.bob.user.username)
+
+    def test_middleware_runs_and_history_waits_for_the_response(self):
+        pending = []
+        send_response = async_views._send_response
+
+        async def sending(response,send):
+            pending.append((response['X-Frame-Options'],history.writer.pending()))
+            await send_response(response,send)
+
+        with mock.patch('assemble.async_views._send_response',sending):
+            self.call(reverse('finish-task-ajax'),{'pk':self.task.pk})
+        # queued in sync mode too and written once the response has gone out
+        self.assertEqual(pending,[('DENY',1)])
+        self.assertEqual(history.writer.pending(),0)
+
+    def test_create_rename_and_delete(self):
+        status,data = self.call(reverse('create-task-ajax'),data={'pk':self.component.pk,'name':'new task'})
+        self.assertEqual(status,200)
+        new_task = ProjectComponent.objects.get(pk=data['id'])
+        self.assertEqual((new_task.task_id,new_task.name),(self.component.pk,'new task'))
+        status,data = self.call(reverse('edit-task-ajax'),data={'pk':new_task.pk,'name':'renamed'})
+        self.assertEqual((status,data),(200,{'name':'renamed'}))
+        status,_ = self.call(reverse('delete-task-ajax'),{'pk':new_task.pk})
+        self.assertEqual(status,200)
+        self.assertFalse(ProjectComponent.objects.filter(pk=new_task.pk).exists())
+
+    def test_project_detail_matches_sync_view(self):
+        path = reverse('project-detail-ajax',args=[self.project.slug])
+        self.assertEqual(self.call(path),self.call(path,application=self.django_application))
+        self.assertEqual(self.call(path)[1],[{"component":[{"name":"task","completed":False,"task":self.task.pk}]}])
+
+    def test_post_needs_csrf_token(self):
+        status,_ = self.call(reverse('edit-task-ajax'),data={'pk':self.task.pk,'name':'renamed'},csrf=False)
+        self.assertEqual(status,403)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name,"task")
+
+    def test_members_only(self):
+        status,_ = self.call(reverse('finish-task-ajax'),{'pk':self.task.pk},cookies='')
+        self.assertEqual(status,302)
+        mallory = User.objects.create(username="mallory")
+        self.client.force_login(mallory)
+        cookies = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        status,_ = self.call(reverse('finish-task-ajax'),{'pk':self.task.pk},cookies=cookies)
+        self.assertEqual(status,404)
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.completed)
+
+    def test_sync_views_under_asgi_write_history(self):
+        # request_finished is sent from the event loop under ASGI, the history flush must not use the database there
+        status,_ = self.call(reverse('finish-task-ajax'),{'pk':self.task.pk},application=self.django_application)
+        self.assertEqual(status,200)
+
+    def lifespan(self):
+        messages = iter([{'type':'lifespan.startup'},{'type':'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        async_to_sync(self.application)({'type':'lifespan'},receive,send)
+        return sent
+
+    @override_settings(HISTORY_WRITE_MODE='buffered',HISTORY_BUFFER_SIZE=100,HISTORY_FLUSH_INTERVAL=60)
+    def test_queued_history_is_written_on_shutdown(self):
+        history.record(self.project,"created","bob",previous_field="queued")
+        self.assertEqual(history.writer.pending(),1)
+        self.assertEqual(self.lifespan(),['lifespan.startup.complete','lifespan.shutdown.complete'])
+        self.assertEqual(history.writer.pending(),0)
+        self.assertTrue(ProjectHistory.objects.filter(previous_field="queued").exists())
+
+    def test_failed_flushes_are_logged(self):
+        async def finish_request():
+            history.flush_history_receiver(None)
+            await history.flush_history_on_shutdown()
+        with mock.patch.object(history.writer,'pending',side_effect=[1,0]),\
+                mock.patch.object(history.writer,'flush',side_effect=RuntimeError("database is gone")):
+            with self.assertLogs('assemble.history','ERROR'):
+                async_to_sync(finish_request)()
+        self.assertEqual(history._flushes,set())
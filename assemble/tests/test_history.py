@@ -0,0 +1,302 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.test import TestCase,TransactionTestCase,override_settings
+from django.core.management import call_command
+from django.utils import timezone
+from django.db import connection,transaction
+from django.contrib.auth.models import User
+from django.urls import reverse
+from assemble.models import *
+from assemble import history
+from core.test_runner import HistoryFlushingRunner
+from assemble.history import HistoryWriter,record,get_history_page,collapse_toggles,rollup_history,purge_deleted_project_history,\
+    TOGGLE_STATUSES
+
+
+class HistoryWriterTest(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create(username="bob")
+        bob = Profile.objects.get(user__username="bob")
+        self.project = Project.objects.create(name="test project",owner=bob)
+        # what the signals recorded while setting up
+        ProjectHistory.objects.all().delete()
+        self.writer = HistoryWriter()
+        # changes made in the buffered tests are queued on the shared writer too
+        self.addCleanup(history.writer.flush)
+
+    @override_settings(HISTORY_WRITE_MODE='sync')
+    def test_sync_mode_writes_straight_away(self):
+        self.writer.record(self.project,"created","bob",previous_field="task")
+        self.assertEqual(ProjectHistory.objects.count(),1)
+        self.assertEqual(self.writer.pending(),0)
+
+    @override_settings(HISTORY_WRITE_MODE='buffered',HISTORY_BUFFER_SIZE=100,HISTORY_FLUSH_INTERVAL=60)
+    def test_buffered_mode_writes_in_one_query(self):
+        for i in range(10):
+            self.writer.record(self.project,"created","bob",previous_field=f"task {i}")
+        self.assertEqual(ProjectHistory.objects.count(),0)
+        # project lookup, BEGIN, the bulk insert and moving the project's last_activity
+        with self.assertNumQueries(4):
+            self.assertEqual(self.writer.flush(),10)
+        self.assertEqual(ProjectHistory.objects.count(),10)
+
+    @override_settings(HISTORY_WRITE_MODE='buffered',HISTORY_BUFFER_SIZE=3,HISTORY_FLUSH_INTERVAL=60)
+    def test_buffer_size_threshold(self):
+        for i in range(3):
+            self.writer.record(self.project,"created","bob",previous_field=f"task {i}")
+        self.assertEqual(self.writer.pending(),0)
+        self.assertEqual(ProjectHistory.objects.count(),3)
+
+    @override_settings(HISTORY_WRITE_MODE='buffered',HISTORY_BUFFER_SIZE=100,HISTORY_FLUSH_INTERVAL=60)
+    def test_rolled_back_changes_are_not_recorded(self):
+        try:
+            with transaction.atomic():
+                self.writer.record(self.project,"created","bob",previous_field="task")
+                raise ValueError
+        except ValueError:
+            pass
+        with transaction.atomic():
+            self.writer.record(self.project,"created","bob",previous_field="kept")
+        self.assertEqual(self.writer.pending(),1)
+
+    @override_settings(HISTORY_WRITE_MODE='buffered',HISTORY_BUFFER_SIZE=100,HISTORY_FLUSH_INTERVAL=60)
+    def test_events_for_deleted_projects_are_dropped(self):
+        self.writer.record(self.project,"created","bob",previous_field="task")
+        self.project.delete()
+        self.assertEqual(self.writer.flush(),0)
+
+    @override_settings(HISTORY_WRITE_MODE='buffered',HISTORY_BUFFER_SIZE=100,HISTORY_FLUSH_INTERVAL=60)
+    def test_runner_flushes_before_dropping_the_test_database(self):
+        history.record(self.project,"created","bob",previous_field="task")
+        with mock.patch('django.test.runner.DiscoverRunner.teardown_databases') as teardown:
+            HistoryFlushingRunner().teardown_databases([])
+        teardown.assert_called_once_with([])
+        self.assertEqual(history.writer.pending(),0)
+        self.assertTrue(ProjectHistory.objects.filter(previous_field="task").exists())
+
+    def test_spilled_events_are_recovered(self):
+        spill_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree,spill_dir)
+        with self.settings(HISTORY_WRITE_MODE='spill',HISTORY_BUFFER_SIZE=100,HISTORY_FLUSH_INTERVAL=60,HISTORY_SPILL_DIR=spill_dir):
+            self.writer.record(self.project,"created","bob",previous_field="task")
+            self.assertTrue(os.path.getsize(self.writer.spill_path) > 0)
+            # a new writer in the same process stands in for a restarted worker
+            restarted = HistoryWriter()
+            self.assertEqual(restarted.flush(),1)
+            self.assertEqual(ProjectHistory.objects.get().previous_field,"task")
+            self.assertEqual(os.path.getsize(restarted.spill_path),0)
+
+
+class HistoryRetentionTest(TestCase):
+
+    def setUp(self):
+        User.objects.create(username="bob")
+        bob = Profile.objects.get(user__username="bob")
+        self.project = Project.objects.create(name="test project",owner=bob)
+        ProjectHistory.objects.all().delete()
+
+    def add(self,status,name,days_ago=0,user="bob",component=None):
+        return ProjectHistory.objects.create(project=self.project,status=status,previous_field=name,user=user,
+                                             date_changed=timezone.now() - datetime.timedelta(days=days_ago),
+                                             component=component)
+
+    def test_collapse_toggles_keeps_last_of_each_run(self):
+        self.add("updated to true","a")
+        self.add("updated to false","a")
+        self.add("updated to true","b")
+        last = self.add("updated to true","a")
+        edit = self.add("edited","a")
+        after_edit = self.add("updated to false","a")
+        self.assertEqual(collapse_toggles(chunk_size=1),2)
+        self.assertEqual(set(ProjectHistory.objects.filter(previous_field="a").values_list('id',flat=True)),
+                         {last.id,edit.id,after_edit.id})
+        self.assertEqual(ProjectHistory.objects.filter(previous_field="b").count(),1)
+
+    def test_collapse_toggles_tells_tasks_with_the_same_name_apart(self):
+        card = ProjectComponent.objects.create(name="card",project=self.project)
+        first = ProjectComponent.objects.create(name="same",project=self.project,task=card)
+        second = ProjectComponent.objects.create(name="same",project=self.project,task=card)
+        first_toggle = self.add("updated to true","same",component=first)
+        second_toggle = self.add("updated to true","same",component=second)
+        self.assertEqual(collapse_toggles(),0)
+        last = self.add("updated to false","same",component=first)
+        self.assertEqual(collapse_toggles(),1)
+        toggles = ProjectHistory.objects.filter(status__in=TOGGLE_STATUSES)
+        self.assertEqual(set(toggles.values_list('id',flat=True)),{second_toggle.id,last.id})
+
+    def test_rollup_history(self):
+        for i in range(3):
+            self.add("created",f"task {i}",days_ago=100)
+        self.add("edited","task 0",days_ago=100,user="alice")
+        recent = self.add("created","task 4",days_ago=1)
+        self.assertEqual(rollup_history(90),4)
+        summary = ProjectHistory.objects.get(status="summary")
+        self.assertEqual(summary.updated_field,"4")
+        self.assertEqual(summary.user,"alice, bob")
+        self.assertTrue(ProjectHistory.objects.filter(id=recent.id).exists())
+        # a later run merges new old rows into the existing summary
+        self.add("deleted","task 1",days_ago=100)
+        self.assertEqual(rollup_history(90),2)
+        self.assertEqual(ProjectHistory.objects.get(status="summary").updated_field,"5")
+        self.assertEqual(rollup_history(90),0)
+
+    def test_deleting_project_leaves_history_for_purge(self):
+        for i in range(5):
+            self.add("created",f"task {i}")
+        project_id = self.project.id
+        self.project.delete()
+        self.assertEqual(ProjectHistory.objects.filter(project_id=project_id).count(),5)
+        self.assertEqual(purge_deleted_project_history(chunk_size=2),5)
+        # the deletion itself is kept apart from the project's history
+        self.assertEqual(ProjectHistory.objects.get().status,"deleted")
+
+    def test_compact_history_command(self):
+        self.add("updated to true","a")
+        self.add("updated to false","a")
+        self.add("created","b",days_ago=100)
+        out = StringIO()
+        call_command('compact_history',stdout=out)
+        self.assertIn("Collapsed 1",out.getvalue())
+        self.assertIn("Rolled up 1",out.getvalue())
+
+
+@override_settings(HISTORY_WRITE_MODE='sync')
+class HistoryGranularityTest(TestCase):
+
+    def setUp(self):
+        User.objects.create(username="bob")
+        bob = Profile.objects.get(user__username="bob")
+        self.project = Project.objects.create(name="test project",owner=bob)
+        self.component = ProjectComponent.objects.create(name="Snake",project=self.project)
+        ProjectHistory.objects.all().delete()
+
+    def test_event_granularity(self):
+        record(self.project,"created","bob",previous_field="Snake",component=self.component)
+        entry = ProjectHistory.objects.get()
+        self.assertEqual(entry.component_id,self.component.id)
+        self.assertEqual(entry.snapshot,'')
+
+    @override_settings(HISTORY_GRANULARITY={'assemble.ProjectComponent':'row'})
+    def test_row_granularity_stores_snapshot(self):
+        record(self.project,"created","bob",previous_field="Snake",component=self.component)
+        row = json.loads(ProjectHistory.objects.get().snapshot)
+        self.assertEqual(row['name'],"Snake")
+        self.assertEqual(row['path'],self.component.path)
+
+    @override_settings(HISTORY_GRANULARITY={'assemble.ProjectComponent':'none'})
+    def test_untracked_model(self):
+        record(self.project,"created","bob",previous_field="Snake",component=self.component)
+        self.assertEqual(ProjectHistory.objects.count(),0)
+
+    def test_component_history(self):
+        other = ProjectComponent.objects.create(name="Food",project=self.project)
+        ProjectHistory.objects.filter(component=other).delete()
+        record(self.project,"created","bob",previous_field="Snake",component=self.component)
+        record(self.project,"created","bob",previous_field="Food",component=other)
+        record(self.project,"edited","bob",previous_field="Snake",updated_field="Python",component=self.component)
+        records,next_cursor = get_history_page(self.project.id,component_id=self.component.id)
+        self.assertEqual([entry.status for entry in records],["edited","created"])
+        with self.assertNumQueries(2):
+            histories = get_list_of_project_component_history_records(self.project)
+            self.assertEqual(sorted(len(entries) for entries in histories),[1,2])
+
+
+@override_settings(HISTORY_WRITE_MODE='sync')
+class HistoryCaptureTest(TestCase):
+
+    def setUp(self):
+        self.bob = User.objects.create(username="bob").profile
+        self.alice = User.objects.create(username="alice").profile
+
+    def statuses(self,**filters):
+        return list(ProjectHistory.objects.filter(**filters).order_by('id').values_list('status',flat=True))
+
+    def test_project_create_edit_and_delete(self):
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        project.name = "renamed"
+        project.save()
+        # saving without a change records nothing
+        Project.objects.get(pk=project.pk).save()
+        edit = ProjectHistory.objects.get(status="edited")
+        self.assertEqual((edit.field,edit.previous_field,edit.updated_field),("name","test project","renamed"))
+        self.assertEqual((edit.model,edit.object_id),("assemble.Project",project.pk))
+        project_id = project.pk
+        project.delete()
+        self.assertEqual(self.statuses(object_id=project_id,model="assemble.Project"),["created","edited","deleted"])
+        self.assertIsNone(ProjectHistory.objects.get(status="deleted").project_id)
+
+    def test_components_of_a_deleted_project_are_not_recorded_one_by_one(self):
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        component = ProjectComponent.objects.create(name="component",project=project)
+        ProjectComponent.objects.create(name="task",project=project,task=component)
+        project.delete()
+        self.assertEqual(self.statuses(model="assemble.ProjectComponent"),["created","created"])
+
+    def test_a_failed_project_delete_leaves_nothing_behind(self):
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        component = ProjectComponent.objects.create(name="component",project=project)
+        with mock.patch('django.db.models.sql.DeleteQuery.delete_batch',side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError),transaction.atomic():
+                project.delete()
+        self.assertEqual(deleting_projects(),frozenset())
+        component.delete()
+        self.assertEqual(self.statuses(model="assemble.ProjectComponent"),["created","deleted"])
+
+    def test_membership(self):
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        project.user.add(self.bob,self.alice)
+        self.alice.project_set.remove(project)
+        project.user.clear()
+        members = ProjectHistory.objects.filter(project=project,status__startswith="member").order_by('id')
+        self.assertEqual(sorted(members.values_list('status','previous_field')[:2]),
+                         [("member added","alice"),("member added","bob")])
+        self.assertEqual(list(members.values_list('status','previous_field')[2:]),
+                         [("member removed","alice"),("member removed","bob")])
+
+    def test_profile_changes(self):
+        self.bob.slug = "bobby"
+        self.bob.save()
+        self.bob.friends.add(self.alice)
+        self.assertEqual(self.statuses(model="assemble.Profile",object_id=self.bob.pk),
+                         ["created","edited","friend added"])
+        self.assertEqual(ProjectHistory.objects.get(status="friend added").updated_field,"alice")
+
+    def test_bulk_changes(self):
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        component = ProjectComponent.objects.create(name="component",project=project)
+        tasks = [ProjectComponent(name=f"task {i}",project=project,task=component) for i in range(3)]
+        bulk_create_components(tasks)
+        tasks = list(ProjectComponent.objects.filter(task=component))
+        tasks[0].completed = True
+        tasks[1].name = "renamed"
+        bulk_update_components(tasks,['name','completed'])
+        self.assertEqual(self.statuses(model="assemble.ProjectComponent"),
+                         ["created"] * 4 + ["updated to true","edited"])
+
+    def test_changes_are_put_on_the_signed_in_user(self):
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        project.user.add(self.bob)
+        component = ProjectComponent.objects.create(name="component",project=project)
+        self.client.force_login(self.bob.user)
+        self.client.post(reverse('edit-details',args=[component.pk]),{'name':"renamed"})
+        edit = ProjectHistory.objects.get(status="edited")
+        self.assertEqual((edit.user,edit.component_id),("bob",component.pk))
+
+    def test_admin_edits_are_recorded_once(self):
+        admin = User.objects.create_superuser("admin","admin@example.com","password")
+        project = Project.objects.create(name="test project",description="",owner=self.bob)
+        project.user.add(self.bob)
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:assemble_project_change',args=[project.pk]),{
+            'name':"renamed",'description':"a project",'user':[self.bob.pk],'owner':self.bob.pk,'slug':project.slug,
+        })
+        self.assertEqual(response.status_code,302)
+        self.assertEqual(self.statuses(project=project),["created","member added","edited","edited"])
+        self.assertEqual(set(ProjectHistory.objects.filter(status="edited").values_list('field','user')),
+                         {("name","admin"),("description","admin")})
@@ -0,0 +1,92 @@
+from django.test import TestCase,RequestFactory,override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from assemble.importers import *
+from assemble.models import *
+from assemble.views import ProjectImportView
+
+
+class ImportParserTest(TestCase):
+
+    def test_parse_outline(self):
+        items = parse_outline("Snake\n    Move the snake\n        Arrow keys\n    Grow\nFood\n\tPlace food\n")
+        self.assertEqual([item.name for item in items],["Snake","Move the snake","Arrow keys","Grow","Food","Place food"])
+        self.assertEqual([item.parent for item in items],[None,0,1,0,None,4])
+
+    def test_parse_markdown_checklist(self):
+        items = parse_outline("- Snake\n  - [x] Move the snake\n  - [ ] Grow\n")
+        self.assertEqual([(item.name,item.completed,item.parent) for item in items],
+                         [("Snake",False,None),("Move the snake",True,0),("Grow",False,0)])
+
+    def test_parse_csv(self):
+        items = parse_csv("component,task,done\nSnake,Move the snake,yes\nSnake,Grow,\nFood,,\n")
+        self.assertEqual([(item.name,item.completed,item.parent) for item in items],
+                         [("Snake",False,None),("Move the snake",True,0),("Grow",False,0),("Food",False,None)])
+
+    def test_parse_errors(self):
+        self.assertRaises(ValueError,parse_csv,"component,task\n,Orphan\n")
+        self.assertRaises(ValueError,parse_outline,"x" * 201)
+
+    def test_row_limit(self):
+        # blank and repeated lines make no items but still count
+        self.assertRaises(ImportTooLarge,parse_outline,"Snake\n" + "\n" * IMPORT_MAX_ROWS)
+        self.assertRaises(ImportTooLarge,parse_csv,"component\n" + "Snake\n" * IMPORT_MAX_ROWS)
+        self.assertEqual(len(parse_csv("component\n" + "Snake\n" * (IMPORT_MAX_ROWS - 1))),1)
+
+
+@override_settings(HISTORY_WRITE_MODE='sync')
+class ProjectImportViewTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = User.objects.create(username="bob")
+        bob = Profile.objects.get(user=self.user)
+        self.project = Project.objects.create(name="test project",description="this is for testing",owner=bob)
+        self.project.user.add(bob)
+        self.url = reverse('project-import',args=[self.project.slug])
+
+    def post(self,data):
+        request = self.factory.post(self.url,data)
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return ProjectImportView.as_view()(request,project_slug=self.project.slug)
+
+    def test_import_creates_tree(self):
+        response = self.post({'format':'outline','content':"Snake\n  Move\n    Arrow keys\nFood\n"})
+        self.assertEqual(response.status_code,302)
+        snake = ProjectComponent.objects.get(name="Snake")
+        self.assertEqual(snake.get_descendant_count(),2)
+        self.assertEqual(ProjectComponent.objects.get(name="Arrow keys").depth,2)
+        history = ProjectHistory.objects.get(project=self.project,status="imported")
+        self.assertEqual(history.previous_field,"4 components and tasks")
+        self.assertFalse(ProjectHistory.objects.filter(component__name="Snake").exists())
+
+    def test_import_query_count(self):
+        outline = "".join(f"Component {i}\n" + "".join(f"    Task {i}.{j}\n" for j in range(20)) for i in range(10))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post({'format':'outline','content':outline})
+        self.assertEqual(response.status_code,302)
+        self.assertEqual(ProjectComponent.objects.count(),210)
+        self.assertLess(len(queries),40)
+
+    def test_invalid_import(self):
+        response = self.post({'format':'csv','content':"component,task\n,Orphan\n"})
+        self.assertEqual(response.status_code,200)
+        self.assertEqual(ProjectComponent.objects.count(),0)
+
+    @override_settings(IMPORT_MAX_UPLOAD_SIZE=10)
+    def test_upload_too_large(self):
+        upload = SimpleUploadedFile("plan.txt",b"Snake\n  Move\n")
+        response = self.post({'format':'outline','file':upload})
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(ProjectComponent.objects.count(),0)
+
+    def test_too_many_rows(self):
+        response = self.post({'format':'outline','content':"Snake\n" * (IMPORT_MAX_ROWS + 1)})
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(ProjectComponent.objects.count(),0)
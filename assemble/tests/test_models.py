@@ -135,6 +135,260 @@ class ProjectComponentTestCase(TestCase):
 
 
 
+    def test_component_tree(self):
+        """
+        Testing that the tree loader attaches tasks to their components.
+        """
+        test_project = Project.objects.get(name="test1")
+        with self.assertNumQueries(1):
+            tree = get_project_component_tree(test_project)
+            self.assertEqual([component.name for component in tree],["test component"])
+            self.assertEqual([task.name for task in tree[0].tasks],["test task"])
+            self.assertEqual(tree[0].tasks[0].tasks,[])
+
+
+    def test_component_paths(self):
+        """
+        Testing that the materialized path follows the task foreign keys at any depth.
+        """
+        comp1 = ProjectComponent.objects.get(name="test component")
+        task = ProjectComponent.objects.get(name="test task")
+        subtask = ProjectComponent.objects.create(name="test subtask",task=task,project=task.project)
+        self.assertEqual(comp1.path,f"{comp1.id}/")
+        self.assertEqual(subtask.path,f"{comp1.id}/{task.id}/{subtask.id}/")
+        self.assertEqual(subtask.depth,2)
+        self.assertEqual(list(subtask.get_ancestors()),[comp1,task])
+        with self.assertNumQueries(1):
+            self.assertEqual(comp1.get_descendant_count(),2)
+
+    def test_move_subtree(self):
+        """
+        Testing that moving a component brings its whole subtree along in one UPDATE.
+        """
+        comp1 = ProjectComponent.objects.get(name="test component")
+        task = ProjectComponent.objects.get(name="test task")
+        subtask = ProjectComponent.objects.create(name="test subtask",task=task,project=task.project)
+        comp2 = ProjectComponent.objects.create(name="other component",project=task.project)
+        # savepoint, subtree count, the version bump, the members' versions and the read, the move,
+        # the counters above the old and new parent, release
+        with self.assertNumQueries(9):
+            task.move_to(comp2)
+        subtask.refresh_from_db()
+        task.refresh_from_db()
+        self.assertEqual(task.task,comp2)
+        self.assertEqual(subtask.path,f"{comp2.id}/{task.id}/{subtask.id}/")
+        self.assertEqual(comp1.get_descendant_count(),0)
+        self.assertRaises(ValueError,comp2.move_to,subtask)
+
+    def test_changing_parent_on_save_moves_subtree(self):
+        comp1 = ProjectComponent.objects.get(name="test component")
+        task = ProjectComponent.objects.get(name="test task")
+        subtask = ProjectComponent.objects.create(name="test subtask",task=task,project=task.project)
+        task.task = None
+        task.save()
+        subtask.refresh_from_db()
+        self.assertEqual(subtask.path,f"{task.id}/{subtask.id}/")
+        self.assertEqual(subtask.depth,1)
+
+    def test_delete_subtree(self):
+        comp1 = ProjectComponent.objects.get(name="test component")
+        task = ProjectComponent.objects.get(name="test task")
+        ProjectComponent.objects.create(name="test subtask",task=task,project=task.project)
+        comp1.delete()
+        self.assertEqual(ProjectComponent.objects.count(),0)
+
+
+class SlugAllocationTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create(username="bob")
+        self.bob = Profile.objects.get(user__username="bob")
+
+    def test_repeated_names_get_suffixes(self):
+        """
+        Testing that projects with the same name are given different slugs.
+        """
+        slugs = [Project.objects.create(name="Write tests",owner=self.bob).slug for i in range(3)]
+        self.assertEqual(slugs,["write-tests","write-tests--1","write-tests--2"])
+
+    def test_allocation_query_count_is_constant(self):
+        """
+        Testing that allocating a slug doesn't run a query per collision.
+        """
+        for i in range(20):
+            ProjectComponent.objects.create(name="Write tests",project=Project.objects.create(name="p",owner=self.bob))
+        # savepoint, counter lookup, counter update and savepoint release
+        with self.assertNumQueries(4):
+            slug = allocate_slug(ProjectComponent,"write-tests")
+        self.assertEqual(slug,"write-tests--20")
+
+    def test_existing_slugs_are_skipped(self):
+        """
+        Testing that slugs made before the counters existed are not handed out again.
+        """
+        Project.objects.create(name="legacy",slug="legacy-4",owner=self.bob)
+        self.assertEqual(allocate_slugs(Project,["legacy","legacy"]),["legacy--5","legacy--6"])
+
+    def test_suffixes_do_not_clash_with_other_names(self):
+        first = Project.objects.create(name="sprint",owner=self.bob)
+        second = Project.objects.create(name="sprint",owner=self.bob)
+        third = Project.objects.create(name="sprint 1",owner=self.bob)
+        self.assertEqual(len({first.slug,second.slug,third.slug}),3)
+
+
+class ProgressCounterTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create(username="bob")
+        bob = Profile.objects.get(user__username="bob")
+        self.project = Project.objects.create(name="test1",owner=bob)
+        self.component = ProjectComponent.objects.create(name="Snake",project=self.project)
+        self.task = ProjectComponent.objects.create(name="Move",task=self.component,project=self.project)
+        self.subtask = ProjectComponent.objects.create(name="Arrow keys",task=self.task,project=self.project)
+
+    def assertCounts(self,obj,total,completed):
+        obj.refresh_from_db()
+        self.assertEqual((obj.task_count,obj.completed_task_count),(total,completed))
+
+    def test_create_counts_up_the_tree(self):
+        self.assertCounts(self.component,2,0)
+        self.assertCounts(self.task,1,0)
+        self.assertCounts(self.subtask,0,0)
+        # the top level component isn't a task
+        self.assertCounts(self.project,2,0)
+
+    def test_toggle_and_project_completed(self):
+        self.subtask.completed = True
+        self.subtask.save()
+        self.assertCounts(self.component,2,1)
+        self.assertCounts(self.task,1,1)
+        for component in ProjectComponent.objects.exclude(pk=self.subtask.pk):
+            component.completed = True
+            component.save()
+        self.assertCounts(self.project,2,2)
+        self.assertTrue(self.project.completed)
+        self.subtask.completed = False
+        self.subtask.save()
+        self.assertCounts(self.project,2,1)
+        self.assertFalse(self.project.completed)
+
+    def test_finishing_every_task_completes_the_project(self):
+        # top level components have no toggle and stay uncompleted
+        for name in ("Eat","Grow"):
+            ProjectComponent.objects.create(name=name,task=self.component,project=self.project,completed=True)
+        for task in (self.task,self.subtask):
+            task.completed = True
+            task.save()
+        self.assertCounts(self.project,4,4)
+        self.assertTrue(self.project.completed)
+        self.assertFalse(ProjectComponent.objects.get(pk=self.component.pk).completed)
+
+    def test_delete_and_move(self):
+        other = ProjectComponent.objects.create(name="Food",project=self.project)
+        self.subtask.completed = True
+        self.subtask.save()
+        self.task.move_to(other)
+        self.assertCounts(self.component,0,0)
+        self.assertCounts(other,2,1)
+        self.task.delete()
+        self.assertCounts(other,0,0)
+        self.assertCounts(self.project,0,0)
+        # a top level component becomes a task under another one and stops being one on its own
+        self.component.completed = True
+        self.component.save()
+        self.assertCounts(self.project,0,0)
+        self.component.move_to(other)
+        self.assertCounts(self.project,1,1)
+        self.assertCounts(other,1,1)
+        self.component.move_to(None)
+        self.assertCounts(self.project,0,0)
+
+    def test_bulk_create(self):
+        parent = ProjectComponent(name="Food",project=self.project)
+        bulk_create_components([parent,ProjectComponent(name="Place",task=parent,project=self.project,completed=True),
+                                ProjectComponent(name="Eat",task=self.task,project=self.project)])
+        self.assertCounts(parent,1,1)
+        self.assertCounts(self.component,3,0)
+        self.assertCounts(self.project,4,1)
+
+    def test_saving_a_stale_project_keeps_the_counters(self):
+        # loaded before the task was finished, like an edit form opened earlier
+        stale = Project.objects.get(pk=self.project.pk)
+        self.subtask.completed = True
+        self.subtask.save()
+        stale.name = "renamed"
+        stale.save()
+        self.assertCounts(self.project,2,1)
+        self.assertEqual(self.project.name,"renamed")
+
+    def test_rebuild_progress(self):
+        ProjectComponent.objects.update(task_count=7)
+        Project.objects.update(task_count=0,completed=True)
+        self.assertEqual(rebuild_progress(),4)
+        self.assertCounts(self.component,2,0)
+        self.assertCounts(self.subtask,0,0)
+        self.assertCounts(self.project,2,0)
+        self.assertFalse(self.project.completed)
+        self.assertEqual(rebuild_progress(),0)
+
+
+class ProjectChangesTestCase(TestCase):
+
+    def setUp(self):
+        User.objects.create(username="bob")
+        bob = Profile.objects.get(user__username="bob")
+        self.project = Project.objects.create(name="test1",owner=bob)
+        self.component = ProjectComponent.objects.create(name="Snake",project=self.project)
+        self.task = ProjectComponent.objects.create(name="Move",task=self.component,project=self.project)
+
+    def changes(self,since):
+        self.project.refresh_from_db()
+        return get_project_changes(self.project,since)
+
+    def test_versions_go_up_with_every_change(self):
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.version,2)
+        self.task.completed = True
+        self.task.save()
+        self.assertEqual(self.changes(2)["version"],3)
+        self.assertEqual(self.task.version,3)
+
+    def test_only_changes_since_the_version(self):
+        since = self.changes(None)["version"]
+        self.task.name = "Turn"
+        self.task.save()
+        new_task = ProjectComponent.objects.create(name="Grow",task=self.component,project=self.project)
+        changes = self.changes(since)
+        self.assertFalse(changes["full"])
+        self.assertEqual([(c["id"],c["name"],c["parent"]) for c in changes["components"]],
+                         [(self.task.id,"Turn",self.component.id),(new_task.id,"Grow",self.component.id)])
+        self.assertEqual(changes["deleted"],[])
+        self.assertEqual(self.changes(changes["version"])["components"],[])
+
+    def test_deletes_and_moves(self):
+        subtask = ProjectComponent.objects.create(name="Arrow keys",task=self.task,project=self.project)
+        other = ProjectComponent.objects.create(name="Food",project=self.project)
+        since = self.changes(None)["version"]
+        self.task.move_to(other)
+        changes = self.changes(since)
+        self.assertEqual({c["id"]:c["parent"] for c in changes["components"]},{self.task.id:other.id,subtask.id:self.task.id})
+        self.task.delete()
+        changes = self.changes(since)
+        self.assertEqual(changes["components"],[])
+        self.assertEqual(sorted(changes["deleted"]),sorted([self.task.id,subtask.id]))
+
+    def test_full_snapshot_when_too_far_behind(self):
+        self.assertTrue(self.changes(None)["full"])
+        self.assertEqual(len(self.changes(None)["components"]),2)
+        Project.objects.filter(pk=self.project.pk).update(version=F('version') + CHANGES_MAX_VERSION_GAP)
+        changes = self.changes(1)
+        self.assertTrue(changes["full"])
+        self.assertEqual([c["id"] for c in changes["components"]],[self.component.id,self.task.id])
+        bulk_create_components([ProjectComponent(name=f"task {i}",project=self.project,task=self.component)
+                                for i in range(CHANGES_MAX_ROWS + 1)])
+        self.assertTrue(self.changes(self.changes(None)["version"] - 1)["full"])
+
+
 class ProjectHistoryTestCase(TestCase):
 
     def setUp(self):
@@ -0,0 +1,97 @@
+import threading
+import time
+from django.test import SimpleTestCase
+from assemble.backends.pool import ConnectionPool,PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+        self.working = True
+        self.dirty = False
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def make_pool(self,**kwargs):
+        self.opened = []
+
+        def connect():
+            connection = FakeConnection()
+            self.opened.append(connection)
+            return connection
+
+        def close(connection):
+            connection.closed = True
+
+        def reset(connection):
+            connection.dirty = False
+            return not connection.closed
+
+        return ConnectionPool(connect,lambda connection: connection.working,reset,close,**kwargs)
+
+    def test_connections_are_reused(self):
+        pool = self.make_pool()
+        connection = pool.checkout()
+        connection.dirty = True
+        pool.checkin(connection)
+        self.assertIs(pool.checkout(),connection)
+        self.assertFalse(connection.dirty)
+        self.assertEqual(len(self.opened),1)
+
+    def test_size_is_bounded(self):
+        pool = self.make_pool(max_size=2,timeout=0.05)
+        first,second = pool.checkout(),pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'],1)
+        self.assertEqual(len(self.opened),2)
+
+    def test_waiting_for_a_connection(self):
+        pool = self.make_pool(max_size=1,timeout=5)
+        connection = pool.checkout()
+        timer = threading.Timer(0.05,pool.checkin,[connection])
+        timer.start()
+        self.assertIs(pool.checkout(),connection)
+        timer.join()
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'],stats['waits']),(2,1))
+        self.assertGreater(stats['max_wait'],0.01)
+
+    def test_broken_connections_are_replaced(self):
+        pool = self.make_pool(check_idle=0)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        connection.working = False
+        replacement = pool.checkout()
+        self.assertIsNot(replacement,connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['failed_checks'],1)
+        self.assertEqual(pool.stats()['size'],1)
+
+    def test_old_connections_are_recycled(self):
+        pool = self.make_pool(max_lifetime=0.01)
+        connection = pool.checkout()
+        time.sleep(0.02)
+        pool.checkin(connection)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.checkout(),connection)
+        self.assertEqual(pool.stats()['recycled'],1)
+
+    def test_discarded_connections_free_their_slot(self):
+        pool = self.make_pool(max_size=1,timeout=0.05)
+        connection = pool.checkout()
+        pool.discard(connection)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.checkout(),connection)
+
+    def test_close_all(self):
+        pool = self.make_pool()
+        idle,busy = pool.checkout(),pool.checkout()
+        pool.checkin(idle)
+        pool.close_all()
+        self.assertTrue(idle.closed)
+        pool.checkin(busy)
+        self.assertTrue(busy.closed)
+        self.assertEqual(pool.stats()['size'],0)
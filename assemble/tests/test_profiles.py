@@ -0,0 +1,35 @@
+from django.test import TestCase,RequestFactory,override_settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from assemble.models import *
+from assemble.profiles import ProfileBackend,ProfileMiddleware,get_profile
+
+
+class ProfileResolutionTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username="bob")
+        self.factory = RequestFactory()
+        cache.clear()
+
+    def test_backend_loads_profile_with_user(self):
+        with self.assertNumQueries(1):
+            user = ProfileBackend().get_user(self.user.pk)
+            self.assertEqual(user.profile.user,user)
+
+    def test_profile_is_loaded_once_per_request(self):
+        request = self.factory.get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        ProfileMiddleware(lambda request: None)(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.profile.user.username,"bob")
+            self.assertIs(get_profile(request),get_profile(request))
+
+    @override_settings(PROFILE_CACHE_TIMEOUT=60)
+    def test_cached_profile_is_dropped_on_save(self):
+        ProfileBackend().get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            ProfileBackend().get_user(self.user.pk)
+        self.user.profile.save()
+        with self.assertNumQueries(1):
+            ProfileBackend().get_user(self.user.pk)
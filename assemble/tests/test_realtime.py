@@ -0,0 +1,102 @@
+import asyncio
+import json
+from asgiref.sync import async_to_sync,sync_to_async
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.test import TransactionTestCase,RequestFactory
+from django.contrib.auth.models import User
+from django.urls import reverse
+from assemble.models import *
+from assemble.realtime import broker,events_application,publish_tasks,REALTIME_QUEUE_SIZE,RESYNC
+from assemble.views import task_commands_ajax
+
+
+class ProjectEventsTest(TransactionTestCase):
+
+    def setUp(self):
+        self.bob = User.objects.create(username="bob").profile
+        self.project = Project.objects.create(name="board",description="",owner=self.bob)
+        self.project.user.add(self.bob)
+        self.component = ProjectComponent.objects.create(name="component",project=self.project)
+        self.url = reverse('project-events',args=[self.project.slug])
+        self.application = events_application(get_asgi_application())
+
+    def session_cookie(self,user):
+        self.client.force_login(user)
+        return f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}".encode()
+
+    def stream(self,cookie=b'',while_open=None):
+        """
+        Opens the event stream, calls while_open once it is open and disconnects after the first message.
+
+        :return: The ASGI messages that were sent.
+        """
+        sent = []
+        scope = {'type':'http','method':'GET','path':self.url,'query_string':b'','headers':[(b'cookie',cookie)]}
+
+        async def run():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type':'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if message.get('body',b'').startswith(b'retry'):
+                    await sync_to_async(while_open)()
+                elif message.get('body',b'').startswith(b'data'):
+                    disconnected.set()
+
+            await asyncio.wait_for(self.application(scope,receive,send),5)
+
+        async_to_sync(run)()
+        return sent
+
+    def messages(self,sent):
+        return [json.loads(message['body'][len(b'data: '):]) for message in sent if message.get('body',b'').startswith(b'data')]
+
+    def test_members_only(self):
+        sent = self.stream()
+        self.assertEqual(sent[0]['status'],403)
+        stranger = User.objects.create(username="mallory")
+        sent = self.stream(self.session_cookie(stranger))
+        self.assertEqual(sent[0]['status'],403)
+
+    def test_task_commands_are_pushed(self):
+        def change_tasks():
+            request = RequestFactory().post(reverse('task-commands-ajax',args=[self.project.slug]),
+                                            json.dumps({"operations":[{"op":"create","parent":self.component.id,"name":"new task"}]}),
+                                            content_type="application/json",HTTP_X_BOARD_CLIENT="other-board")
+            request.user = self.bob.user
+            task_commands_ajax(request,self.project.slug)
+
+        sent = self.stream(self.session_cookie(self.bob.user),change_tasks)
+        self.assertEqual(sent[0]['status'],200)
+        self.assertIn((b'content-type',b'text/event-stream'),sent[0]['headers'])
+        [message] = self.messages(sent)
+        self.assertEqual(message["origin"],"other-board")
+        self.assertEqual([(task["name"],task["parent"]) for task in message["tasks"]],[("new task",self.component.id)])
+        self.assertEqual(broker.subscriber_count(self.project.id),0)
+
+    def test_other_projects_are_not_pushed(self):
+        other = Project.objects.create(name="other",description="",owner=self.bob)
+
+        def publish():
+            publish_tasks(other.id,[{"id":1}])
+            publish_tasks(self.project.id,[{"id":2}])
+
+        sent = self.stream(self.session_cookie(self.bob.user),publish)
+        self.assertEqual([message["tasks"] for message in self.messages(sent)],[[{"id":2}]])
+
+    def test_slow_boards_resync(self):
+        def flood():
+            for i in range(REALTIME_QUEUE_SIZE + 1):
+                broker.deliver(self.project.id,json.dumps({"tasks":[{"id":i}]}))
+
+        sent = self.stream(self.session_cookie(self.bob.user),flood)
+        self.assertEqual(self.messages(sent),[json.loads(RESYNC)])
+
+    def test_no_stream_under_wsgi(self):
+        self.client.force_login(self.bob.user)
+        self.assertEqual(self.client.get(self.url).status_code,204)
@@ -0,0 +1,93 @@
+import random
+import time
+from unittest import mock
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpRequest,HttpResponse
+from django.test import SimpleTestCase,TransactionTestCase,override_settings
+from django.urls import reverse
+from assemble.models import Project,ProjectComponent
+from assemble.routers import ReplicaRouter,REPLICA_PIN_COOKIE,start_routing,finish_routing,_state
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'],REPLICA_PIN_SECONDS=15)
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def start(self,cookie=None):
+        request = HttpRequest()
+        if cookie is not None:
+            request.COOKIES[REPLICA_PIN_COOKIE] = cookie
+        token = start_routing(request)
+        self.addCleanup(_state.reset,token)
+        return _state.get()
+
+    def test_reads_outside_read_views_use_default(self):
+        self.assertEqual(self.router.db_for_read(Project),'default')
+        self.start()
+        self.assertEqual(self.router.db_for_read(Project),'default')
+
+    def test_read_views_use_a_replica(self):
+        self.start().use_replica = True
+        self.assertEqual(self.router.db_for_read(Project),'replica1')
+        # a session saved a moment ago may not have been copied yet
+        self.assertEqual(self.router.db_for_read(Session),'default')
+        with mock.patch.object(connections['default'],'in_atomic_block',True):
+            self.assertEqual(self.router.db_for_read(Project),'default')
+
+    def test_writes_pin_reads_to_default(self):
+        request = HttpRequest()
+        token = start_routing(request)
+        _state.get().use_replica = True
+        self.assertEqual(self.router.db_for_write(Project),'default')
+        self.assertEqual(self.router.db_for_read(Project),'default')
+        response = finish_routing(token,HttpResponse())
+        self.assertIsNone(_state.get())
+        self.assertIn(REPLICA_PIN_COOKIE,response.cookies)
+
+    def test_pin_cookie(self):
+        self.assertTrue(self.start(str(time.time())).pinned)
+        self.assertFalse(self.start(str(time.time() - 60)).pinned)
+        self.assertFalse(self.start('nonsense').pinned)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertTrue(self.router.allow_migrate('default','assemble'))
+        self.assertFalse(self.router.allow_migrate('replica1','assemble'))
+
+
+class ReplicaRoutingViewsTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.bob = User.objects.create(username="bob").profile
+        self.project = Project.objects.create(name="board",description="",owner=self.bob)
+        self.project.user.add(self.bob)
+        self.component = ProjectComponent.objects.create(name="component",project=self.project)
+        self.task = ProjectComponent.objects.create(name="task",project=self.project,task=self.component)
+        self.client.force_login(self.bob.user)
+        # default stands in for the replica, what matters is whether a read was sent to one. Set here rather
+        # than on the class so the tables are flushed after the test, replicas aren't
+        replicas = self.settings(DATABASE_REPLICAS=['default'])
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        patcher = mock.patch('assemble.routers.random.choice',wraps=random.choice)
+        self.choice = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_board_is_read_from_a_replica(self):
+        response = self.client.get(reverse('project-detail',args=[self.project.slug]))
+        self.assertEqual(response.status_code,200)
+        self.assertTrue(self.choice.called)
+        self.assertNotIn(REPLICA_PIN_COOKIE,response.cookies)
+
+    def test_own_changes_are_read_from_default(self):
+        response = self.client.get(reverse('finish-task-ajax'),{'pk':self.task.pk})
+        self.assertIn(REPLICA_PIN_COOKIE,response.cookies)
+        self.choice.reset_mock()
+        response = self.client.get(reverse('project-detail',args=[self.project.slug]))
+        self.assertEqual(response.status_code,200)
+        self.assertFalse(self.choice.called)
@@ -0,0 +1,129 @@
+from unittest import mock
+from django.test import TestCase,RequestFactory
+from django.contrib.auth.models import User
+from assemble.models import *
+from assemble.search import search_users,search_projects,FRIEND,REQUEST_SENT,REQUEST_RECEIVED
+from assemble.views import search_users_ajax,search_projects_view
+import json
+
+
+class UserSearchTest(TestCase):
+
+    def setUp(self):
+        names = ["bob","bobby","Bobcat","alice","jimbob","carol","dave"]
+        self.users = {name:User.objects.create(username=name) for name in names}
+        self.me = Profile.objects.get(user__username="carol")
+
+    def names(self,results):
+        return [profile.user.username for profile in results]
+
+    def test_prefix_matches_rank_first(self):
+        results,has_next = search_users("bob",self.me)
+        self.assertEqual(self.names(results),["bob","bobby","Bobcat","jimbob"])
+        self.assertFalse(has_next)
+
+    def test_trigram_matches_the_middle(self):
+        results,_ = search_users("mbo",self.me)
+        self.assertEqual(self.names(results),["jimbob"])
+
+    def test_renamed_users_are_reindexed(self):
+        user = self.users["dave"]
+        user.username = "bobsled"
+        user.save()
+        self.assertIn("bobsled",self.names(search_users("bobs",self.me)[0]))
+        self.assertEqual(search_users("dave",self.me)[0],[])
+
+    def test_pages(self):
+        first,has_next = search_users("bob",self.me,page_size=3)
+        second,_ = search_users("bob",self.me,page=2,page_size=3)
+        self.assertTrue(has_next)
+        self.assertEqual(self.names(first + second),["bob","bobby","Bobcat","jimbob"])
+
+    def test_relationship_status_in_one_query(self):
+        bob,bobby,bobcat = [Profile.objects.get(user__username=name) for name in ("bob","bobby","Bobcat")]
+        self.me.friends.add(bob)
+        FriendRequest.objects.create(from_user=self.me.user,to_user=bobby.user)
+        FriendRequest.objects.create(from_user=bobcat.user,to_user=self.me.user)
+        # prefix matches, trigram matches and the page of profiles with their status
+        with self.assertNumQueries(3):
+            results,_ = search_users("bob",self.me)
+            statuses = {profile.user.username:profile.relationship for profile in results}
+        self.assertEqual(statuses,{"bob":FRIEND,"bobby":REQUEST_SENT,"Bobcat":REQUEST_RECEIVED,"jimbob":None})
+
+    def test_search_users_ajax(self):
+        request = RequestFactory().get('/ajax/search-users/',{'q':'ali'})
+        request.user = self.me.user
+        data = json.loads(search_users_ajax(request).content)
+        self.assertEqual([result["username"] for result in data["results"]],["alice"])
+        self.assertIsNone(data["next"])
+
+
+class ProjectSearchTest(TestCase):
+
+    def setUp(self):
+        self.me = User.objects.create(username="carol").profile
+        self.other = User.objects.create(username="dave").profile
+        self.project = Project.objects.create(name="Garden shed",description="Build a shed for the bikes",owner=self.me)
+        self.project.user.add(self.me)
+        self.roof = ProjectComponent.objects.create(name="Roof",project=self.project)
+        self.shingles = ProjectComponent.objects.create(name="Nail the shingles",project=self.project,task=self.roof)
+        self.hidden = Project.objects.create(name="Secret shed",description="",owner=self.other)
+        self.hidden.user.add(self.other)
+
+    def found(self,query,**kwargs):
+        return [(type(result).__name__,result.pk) for result in search_projects(query,self.me,**kwargs)[0]]
+
+    def test_matches_projects_components_and_tasks(self):
+        self.assertEqual(self.found("shed"),[("Project",self.project.pk)])
+        self.assertEqual(self.found("bikes"),[("Project",self.project.pk)])
+        self.assertEqual(self.found("nail shin"),[("ProjectComponent",self.shingles.pk)])
+
+    def test_names_rank_above_descriptions(self):
+        ProjectComponent.objects.create(name="Bikes rack",project=self.project)
+        self.assertEqual([kind for kind,_ in self.found("bikes")],["ProjectComponent","Project"])
+
+    def test_only_searches_the_users_projects(self):
+        self.assertNotIn(("Project",self.hidden.pk),self.found("secret"))
+        self.hidden.user.add(self.me)
+        self.assertEqual(self.found("secret"),[("Project",self.hidden.pk)])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.roof.name = "Walls"
+        self.roof.save()
+        self.assertEqual(self.found("roof"),[])
+        self.assertEqual(self.found("walls"),[("ProjectComponent",self.roof.pk)])
+        bulk_create_components([ProjectComponent(name="Paint the walls",project=self.project)])
+        self.assertEqual(len(self.found("walls")),2)
+        self.roof.delete()
+        self.assertEqual(self.found("nail"),[])
+        self.project.delete()
+        self.assertEqual(self.found("walls"),[])
+
+    def test_pages(self):
+        bulk_create_components([ProjectComponent(name=f"Plank {i}",project=self.project) for i in range(5)])
+        first,has_next,truncated = search_projects("plank",self.me,page_size=3)
+        second,has_more,_ = search_projects("plank",self.me,page=2,page_size=3)
+        self.assertTrue(has_next)
+        self.assertFalse(has_more)
+        self.assertFalse(truncated)
+        self.assertEqual(len({result.pk for result in first + second}),5)
+
+    def test_truncated_results(self):
+        bulk_create_components([ProjectComponent(name=f"Plank {i}",project=self.project) for i in range(4)])
+        with mock.patch('assemble.fulltext.SEARCH_MAX_CANDIDATES',3):
+            results,has_next,truncated = search_projects("plank",self.me)
+            self.assertTrue(truncated)
+            self.assertFalse(has_next)
+            # the newest matches are the ones ranked
+            self.assertEqual({result.name for result in results},{"Plank 1","Plank 2","Plank 3"})
+            request = RequestFactory().get('/search/projects/',{'q':'plank'})
+            request.user = self.me.user
+            self.assertContains(search_projects_view(request),"Only the newest 3 matches are ranked")
+        self.assertFalse(search_projects("plank",self.me)[2])
+
+    def test_search_projects_view(self):
+        request = RequestFactory().get('/search/projects/',{'q':'roof'})
+        request.user = self.me.user
+        response = search_projects_view(request)
+        self.assertContains(response,"Roof")
+        self.assertContains(response,"Garden shed")
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import threading
+from unittest import mock
+from django.db import connections
+from django.test import SimpleTestCase
+from assemble.backends.sqlite_wal.base import DatabaseWrapper
+
+
+class SQLiteWALTest(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_dict = dict(connections['default'].settings_dict,NAME=os.path.join(directory.name,'db.sqlite3'),
+                                  OPTIONS={'timeout':30})
+        self.settings_dict['SQLITE'] = {}
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (value integer)")
+            cursor.execute("INSERT INTO counter VALUES (0)")
+        wrapper.close()
+
+    def wrapper(self):
+        return DatabaseWrapper(self.settings_dict,alias='wal-test')
+
+    def test_pragmas(self):
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0],'wal')
+            cursor.execute("PRAGMA synchronous")
+            # NORMAL
+            self.assertEqual(cursor.fetchone()[0],1)
+        wrapper.close()
+
+    def test_concurrent_transactions_take_turns(self):
+        # read then write is what fails straight away with "database is locked" when transactions start deferred
+        errors = []
+
+        def increment():
+            wrapper = self.wrapper()
+            try:
+                for _ in range(20):
+                    wrapper.ensure_connection()
+                    wrapper._start_transaction_under_autocommit()
+                    with wrapper.cursor() as cursor:
+                        cursor.execute("SELECT value FROM counter")
+                        value = cursor.fetchone()[0]
+                        cursor.execute("UPDATE counter SET value = %s",[value + 1])
+                    wrapper.commit()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                wrapper.close()
+
+        threads = [threading.Thread(target=increment) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors,[])
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT value FROM counter")
+            self.assertEqual(cursor.fetchone()[0],100)
+        wrapper.close()
+
+    def test_autocommit_writes_take_the_writer_lock(self):
+        # save(), QuerySet.update() and F() updates run outside of a transaction
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute("SELECT value FROM counter")
+            acquire = mock.patch.object(wrapper.writer_lock,'acquire',wraps=wrapper.writer_lock.acquire)
+            with acquire as acquired:
+                cursor.execute("SELECT value FROM counter")
+                self.assertEqual(acquired.call_count,0)
+                cursor.execute("UPDATE counter SET value = value + %s",[1])
+                cursor.executemany("INSERT INTO counter VALUES (%s)",[(1,),(2,)])
+                self.assertEqual(acquired.call_count,2)
+        self.assertFalse(wrapper.holds_writer_lock)
+        # and aren't asked for the lock again inside a transaction, which already holds it
+        wrapper._start_transaction_under_autocommit()
+        with wrapper.cursor() as cursor:
+            cursor.execute("UPDATE counter SET value = value + 1")
+        wrapper.commit()
+        self.assertFalse(wrapper.holds_writer_lock)
+        wrapper.close()
@@ -0,0 +1,79 @@
+import threading
+import time
+from unittest import mock
+from django.test import TestCase,override_settings
+from django.contrib.auth.models import User
+from assemble.models import *
+from assemble.suggestions import FriendGraph,graph,suggest_friends
+
+
+class FriendSuggestionTest(TestCase):
+
+    def setUp(self):
+        for name in ("bob","alice","carol","dave","erin"):
+            User.objects.create(username=name)
+        self.bob,self.alice,self.carol,self.dave,self.erin = [Profile.objects.get(user__username=name)
+                                                              for name in ("bob","alice","carol","dave","erin")]
+        self.bob.friends.add(self.alice,self.carol)
+        self.alice.friends.add(self.dave,self.erin)
+        self.carol.friends.add(self.dave)
+        project = Project.objects.create(name="shared",owner=self.bob)
+        project.user.add(self.bob,self.erin)
+        graph.invalidate()
+
+    def test_ranked_by_mutual_friends_then_projects(self):
+        suggestions = suggest_friends(self.bob)
+        self.assertEqual(suggestions,[self.dave,self.erin])
+        self.assertEqual((suggestions[0].mutual_friends,suggestions[1].shared_projects),(2,1))
+        self.assertEqual(suggest_friends(self.bob,exclude=[self.dave.pk]),[self.erin])
+
+    def test_index_follows_new_friendships(self):
+        suggest_friends(self.bob)
+        self.bob.friends.add(self.dave)
+        with self.assertNumQueries(1):
+            self.assertEqual(suggest_friends(self.bob),[self.erin])
+        self.assertIn(self.bob.pk,graph.friends[self.dave.pk])
+
+    def test_deleted_project_is_dropped_from_the_index(self):
+        self.assertEqual(suggest_friends(self.bob)[1].shared_projects,1)
+        Project.objects.get(name="shared").delete()
+        # still a friend of a friend
+        self.assertEqual(suggest_friends(self.bob)[1].shared_projects,0)
+        self.assertFalse(any(graph.projects.values()))
+
+    def test_large_neighbourhood(self):
+        index = FriendGraph()
+        index._built = time.monotonic()
+        index.add_friends(1,range(2,102))
+        for friend in range(2,102):
+            index.add_friends(friend,range(1000 + friend * 50,1000 + friend * 50 + 100))
+        suggestions = index.suggest(1)
+        self.assertEqual(len(suggestions),10)
+        self.assertEqual(suggestions[0][1],2)
+
+    @override_settings(SUGGESTION_INDEX_MAX_AGE=0)
+    def test_stale_index_is_rebuilt_once_in_the_background(self):
+        index = FriendGraph()
+        index.add_friends(1,[2])
+        index.add_friends(2,[3])
+        index._built = time.monotonic() - 1
+        started,release = threading.Event(),threading.Event()
+        readers = []
+
+        def read():
+            readers.append(threading.current_thread())
+            started.set()
+            release.wait(5)
+            return {2:{3},3:{2}},{},{}
+        with mock.patch.object(index,'_read',side_effect=read),mock.patch('assemble.suggestions.connection'):
+            for _ in range(3):
+                # answered from the old graph while the new one is read
+                self.assertEqual(index.suggest(1),[(3,1,0)])
+            started.wait(5)
+            # a friendship made in the meantime is kept
+            index.add_friends(1,[2])
+            release.set()
+            readers[0].join(5)
+        self.assertEqual(len(readers),1)
+        self.assertIsNot(readers[0],threading.current_thread())
+        self.assertEqual(index.friends[1],{2})
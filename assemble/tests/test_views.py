@@ -1,9 +1,16 @@
-from django.test import TestCase,Client,RequestFactory
+from django.test import TestCase,TransactionTestCase,Client,RequestFactory,override_settings
 from assemble.views import *
 from django.urls import reverse,resolve
 from assemble.models import *
 import json
+import datetime
+from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import cache
+from django.http import Http404
+from assemble.boards import board_cache_stats,reset_board_cache_stats
+from assemble import history
+from assemble.landing import LANDING_BOARD_KEY
 
 class TestUserAuthenticationViews(TestCase):
 
@@ -40,9 +47,69 @@ class TestUserAuthenticationViews(TestCase):
         user_count = User.objects.all().count()
         self.assertEquals(user_count,0)
 
+class TestLandingPage(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        demo = ProjectIndex.objects.create(id=1,name="demo",description="")
+        self.component = ProjectComponentIndex.objects.create(name="demo component",project=demo)
+        self.task = ProjectComponentIndex.objects.create(name="demo task",project=demo,task=self.component)
+        self.index_url = reverse('home')
+
+    def tearDown(self):
+        # the demo rows are rolled back, the board rendered from them mustn't outlive the test
+        cache.clear()
+
+    def test_board_served_without_queries(self):
+        self.client.get(self.index_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.index_url)
+        self.assertContains(response,"demo task")
+        self.assertContains(response,"Create an account to access Assemble")
+        self.assertIn('no-cache',response['Cache-Control'])
+
+    def test_page_rendered_for_the_visitor(self):
+        self.client.get(self.index_url)
+        response = self.client.get(self.index_url)
+        self.assertIn('messages',response.context)
+        self.client.force_login(User.objects.create(username="bob"))
+        response = self.client.get(self.index_url)
+        self.assertContains(response,"demo task")
+        self.assertContains(response,'name="csrfmiddlewaretoken"')
+
+    def test_demo_changes_show(self):
+        self.client.get(self.index_url)
+        self.task.name = "changed in admin"
+        self.task.save()
+        self.assertContains(self.client.get(self.index_url),"changed in admin")
+        self.task.delete()
+        self.assertNotContains(self.client.get(self.index_url),"changed in admin")
+
+    def test_signed_in_users_get_their_own_page(self):
+        user = User.objects.create(username="bob")
+        self.client.get(self.index_url)
+        self.client.force_login(user)
+        self.assertContains(self.client.get(self.index_url),"Welcome to Assemble")
+
+
+class TestLandingBoardRebuild(TransactionTestCase):
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_board_rendered_again_on_commit(self):
+        demo = ProjectIndex.objects.create(id=1,name="demo",description="")
+        component = ProjectComponentIndex.objects.create(name="demo component",project=demo)
+        ProjectComponentIndex.objects.create(name="changed in admin",project=demo,task=component)
+        # ready for the next visitor without anyone asking for it
+        self.assertIn("changed in admin",cache.get(LANDING_BOARD_KEY))
+
+
 class TestProjectViews(TestCase):
 
     def setUp(self):
+        # ids and versions start over after every test, boards cached by an earlier test would match them
+        cache.clear()
         self.client = Client()
         self.factory = RequestFactory()
         User.objects.create(username="bob")
@@ -94,6 +161,26 @@ class TestProjectViews(TestCase):
         self.assertEquals(len(queryset),1)
         self.assertEqual(total_queryset,2)
 
+    def test_project_list_pages_by_activity(self):
+        projects = [Project.objects.create(name=f"shared {i}",owner=self.bob2) for i in range(5)]
+        for project in projects:
+            project.user.add(self.bob)
+        Project.objects.filter(pk=projects[0].pk).update(last_activity=timezone.now() + datetime.timedelta(days=1))
+        request = self.factory.get(self.project_list_url)
+        request.user = self.bob.user
+        # profile join and page of projects, owners come with the page
+        with self.assertNumQueries(1):
+            page,cursor = get_project_page(ProjectList(request=request).get_queryset(),page_size=4)
+            self.assertEqual([project.owner.user.username for project in page],["bob2"] * 4)
+        self.assertEqual(page[0],projects[0])
+        rest,next_cursor = get_project_page(Project.objects.filter(user=self.bob),cursor=cursor,page_size=4)
+        self.assertEqual(len(rest),2)
+        self.assertIsNone(next_cursor)
+        self.assertEqual([project.owner.user.username for project in rest],["bob2","bob"])
+        names,_ = get_project_page(Project.objects.filter(user=self.bob),sort='name')
+        self.assertEqual([project.name for project in names],sorted(project.name for project in names))
+        self.assertRaises(ValueError,get_project_page,Project.objects.all(),cursor="not a cursor")
+
     def test_project_create_view_GET(self):
         request = self.factory.get(self.project_create_view_url)
         request.user = self.bob.user
@@ -174,6 +261,175 @@ class TestProjectViews(TestCase):
         response = history_view(request,1)
         self.assertEquals(response.status_code,200)
 
+    def test_history_pages(self):
+        ProjectHistory.objects.all().delete()
+        ProjectHistory.objects.bulk_create([
+            ProjectHistory(user="bob",previous_field=f"task {i}",status="created",project=self.test_project)
+            for i in range(120)
+        ])
+        url = reverse('project-history-ajax',args=[self.test_project.id])
+        names,cursor = [],None
+        while True:
+            request = self.factory.get(url,{'cursor':cursor} if cursor else {})
+            request.user = self.bob.user
+            data = json.loads(history_page_ajax(request,self.test_project.id).content)
+            names += [result["text"] for result in data["results"]]
+            cursor = data["next"]
+            if cursor is None:
+                break
+        self.assertEqual(len(names),120)
+        self.assertEqual(names[0],"task 119 was created by bob.")
+        self.assertEqual(len(set(names)),120)
+
+    def test_history_page_bad_cursor(self):
+        request = self.factory.get(reverse('project-history-ajax',args=[self.test_project.id]),{'cursor':'nope'})
+        request.user = self.bob.user
+        response = history_page_ajax(request,self.test_project.id)
+        self.assertEqual(response.status_code,400)
+
+
+    def test_project_detail_ajax_query_count(self):
+        component = ProjectComponent.objects.get(name="test component")
+        for i in range(5):
+            ProjectComponent.objects.create(name=f"task {i}",project=self.test_project,task=component)
+        request = self.factory.get(reverse('project-detail-ajax',args=[self.test_project.slug]))
+        request.user = self.bob.user
+        # project and the component tree, the profile came with the user
+        with self.assertNumQueries(2):
+            response = project_detail_ajax(request,self.test_project.slug)
+        data = json.loads(response.content)
+        self.assertEqual(len(data),1)
+        self.assertEqual(len(data[0]["test component"]),5)
+
+    def board(self):
+        request = self.factory.get(reverse('project-detail-ajax',args=[self.test_project.slug]))
+        request.user = self.bob.user
+        return json.loads(project_detail_ajax(request,self.test_project.slug).content)
+
+    def test_project_detail_ajax_cached_board(self):
+        component = ProjectComponent.objects.get(name="test component")
+        task = ProjectComponent.objects.create(name="task",project=self.test_project,task=component)
+        reset_board_cache_stats()
+        self.board()
+        request = self.factory.get(reverse('project-detail-ajax',args=[self.test_project.slug]))
+        request.user = self.bob.user
+        # only the project, the board comes from the cache
+        with self.assertNumQueries(1):
+            response = project_detail_ajax(request,self.test_project.slug)
+        self.assertEqual(json.loads(response.content),[{"test component":[{"name":"task","completed":False,"task":task.id}]}])
+        self.assertEqual(board_cache_stats(),{"hits":1,"misses":1,"hit_rate":0.5})
+
+    def test_cached_board_follows_changes(self):
+        component = ProjectComponent.objects.get(name="test component")
+        task = ProjectComponent.objects.create(name="task",project=self.test_project,task=component)
+        self.board()
+        task.completed = True
+        task.save()
+        self.assertEqual(self.board(),[{"test component":[{"name":"task","completed":True,"task":task.id}]}])
+        task.delete()
+        self.assertEqual(self.board(),[{"test component":[]}])
+
+    def test_project_and_member_changes_move_the_version(self):
+        version = Project.objects.get(pk=self.test_project.pk).version
+        self.test_project.name = "renamed"
+        self.test_project.save()
+        self.bob2.project_set.add(self.test_project)
+        self.test_project.user.remove(self.bob2)
+        self.assertEqual(Project.objects.get(pk=self.test_project.pk).version,version + 3)
+
+    def test_project_detail_view_query_count_does_not_grow(self):
+        for i in range(10):
+            component = ProjectComponent.objects.create(name=f"component {i}",project=self.test_project)
+            ProjectComponent.objects.create(name=f"task {i}",project=self.test_project,task=component)
+        request = self.factory.get(self.project_detail_url)
+        request.user = self.bob.user
+        with self.assertNumQueries(2):
+            response = project_detail_view(request,self.test_project.slug)
+        self.assertEqual(response.status_code,200)
+
+    def get_page(self,view,url,*args,etag=None):
+        request = self.factory.get(url,HTTP_IF_NONE_MATCH=etag) if etag else self.factory.get(url)
+        request.user = self.bob.user
+        return view(request,*args)
+
+    def test_project_detail_view_not_modified(self):
+        response = self.get_page(project_detail_view,self.project_detail_url,self.test_project.slug)
+        etag = response['ETag']
+        # the project is all that is looked up before the 304
+        with self.assertNumQueries(1):
+            response = self.get_page(project_detail_view,self.project_detail_url,self.test_project.slug,etag=etag)
+        self.assertEqual(response.status_code,304)
+        ProjectComponent.objects.create(name="new task",project=self.test_project,
+                                        task=ProjectComponent.objects.get(name="test component"))
+        response = self.get_page(project_detail_view,self.project_detail_url,self.test_project.slug,etag=etag)
+        self.assertEqual(response.status_code,200)
+        self.assertNotEqual(response['ETag'],etag)
+
+    def test_project_list_and_profile_not_modified(self):
+        for view,url in ((ProjectList.as_view(),self.project_list_url),(profile,reverse('profile'))):
+            etag = self.get_page(view,url)['ETag']
+            self.assertEqual(self.get_page(view,url,etag=etag).status_code,304)
+            self.test_project2.user.add(self.bob)
+            self.assertEqual(self.get_page(view,url,etag=etag).status_code,200)
+            self.test_project2.user.remove(self.bob)
+        # a change to one of the projects, or a friend request, changes the profile's pages too
+        etag = self.get_page(profile,reverse('profile'))['ETag']
+        self.test_project.name = "renamed"
+        self.test_project.save()
+        self.assertEqual(self.get_page(profile,reverse('profile'),etag=etag).status_code,200)
+        etag = self.get_page(profile,reverse('profile'))['ETag']
+        FriendRequest.objects.create(from_user=self.bob2.user,to_user=self.bob.user)
+        self.assertEqual(self.get_page(profile,reverse('profile'),etag=etag).status_code,200)
+        # the project list shows progress
+        etag = self.get_page(ProjectList.as_view(),self.project_list_url)['ETag']
+        ProjectComponent.objects.create(name="new task",project=self.test_project,
+                                        task=ProjectComponent.objects.get(name="test component"))
+        self.assertEqual(self.get_page(ProjectList.as_view(),self.project_list_url,etag=etag).status_code,200)
+
+    def test_saving_a_profile_keeps_the_version_moved_by_others(self):
+        stale = Profile.objects.get(pk=self.bob.pk)
+        self.bob.friends.add(self.bob2)
+        version = Profile.objects.get(pk=self.bob.pk).version
+        stale.save()
+        self.assertEqual(stale.version,version + 1)
+        self.assertEqual(Profile.objects.get(pk=self.bob.pk).version,version + 1)
+
+    def test_history_view_not_modified(self):
+        url = reverse('project-history',args=[self.test_project.id])
+        etag = self.get_page(history_view,url,self.test_project.id)['ETag']
+        self.assertEqual(self.get_page(history_view,url,self.test_project.id,etag=etag).status_code,304)
+        # history is written after the change that made it, on its own it still changes the page
+        history.record(self.test_project,"created","bob",previous_field="task")
+        self.assertEqual(self.get_page(history_view,url,self.test_project.id,etag=etag).status_code,200)
+
+    def test_history_view_members_only(self):
+        url = reverse('project-history',args=[self.test_project2.id])
+        self.assertFalse(self.test_project2.user.filter(pk=self.bob.pk).exists())
+        with self.assertRaises(Http404):
+            self.get_page(history_view,url,self.test_project2.id)
+
+    def render_board(self):
+        request = self.factory.get(self.project_detail_url)
+        request.user = self.bob.user
+        return project_detail_view(request,self.test_project.slug).content.decode()
+
+    def test_project_detail_view_only_renders_changed_cards(self):
+        first = ProjectComponent.objects.create(name="first",project=self.test_project)
+        first_task = ProjectComponent.objects.create(name="first task",project=self.test_project,task=first)
+        second = ProjectComponent.objects.create(name="second",project=self.test_project)
+        second_task = ProjectComponent.objects.create(name="second task",project=self.test_project,task=second)
+        self.render_board()
+        # an update that skips the versions isn't seen, the card comes from the cache
+        ProjectComponent.objects.filter(pk=first_task.pk).update(name="not rendered")
+        second_task.name = "renamed task"
+        second_task.save()
+        content = self.render_board()
+        self.assertIn("first task",content)
+        self.assertNotIn("not rendered",content)
+        self.assertIn("renamed task",content)
+        second_task.delete()
+        self.assertNotIn("renamed task",self.render_board())
+
 
 class TestProjectComponentTaskViews(TestCase):
 
@@ -245,6 +501,127 @@ class TestProjectComponentTaskViews(TestCase):
         total_components = ProjectComponent.objects.all().count()
         self.assertEqual(total_components,1)
 
+@override_settings(HISTORY_WRITE_MODE='sync')
+class TestTaskCommandViews(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        User.objects.create(username="bob")
+        self.bob = Profile.objects.get(id=1)
+        self.user = self.bob.user
+        self.test_project = Project.objects.create(
+            name="test project",
+            description="this is for testing",
+            owner=self.bob,
+        )
+        self.test_project.user.add(self.bob)
+        self.component = ProjectComponent.objects.create(name="test component",project=self.test_project)
+        self.task = ProjectComponent.objects.create(name="test task",project=self.test_project,task=self.component)
+        self.url = reverse('task-commands-ajax',args=[self.test_project.slug])
+
+    def send(self,operations):
+        request = self.factory.post(self.url,json.dumps({"operations":operations}),content_type="application/json")
+        request.user = self.user
+        return task_commands_ajax(request,self.test_project.slug)
+
+    def test_commands_are_applied_in_order(self):
+        ProjectHistory.objects.all().delete()
+        response = self.send([
+            {"op":"create","parent":self.component.id,"name":"new task","ref":"new-1"},
+            {"op":"toggle","id":"new-1"},
+            {"op":"rename","id":self.task.id,"name":"renamed task"},
+            {"op":"toggle","id":self.task.id},
+        ])
+        self.assertEqual(response.status_code,200)
+        tasks = json.loads(response.content)["tasks"]
+        self.assertEqual(tasks[0]["ref"],"new-1")
+        self.assertTrue(tasks[0]["completed"])
+        new_task = ProjectComponent.objects.get(id=tasks[0]["id"])
+        self.assertEqual(new_task.task,self.component)
+        self.assertEqual(new_task.path,f"{self.component.id}/{new_task.id}/")
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name,"renamed task")
+        self.assertTrue(self.task.completed)
+        # the new task is created completed, its toggle isn't a change of its own
+        statuses = ProjectHistory.objects.filter(project=self.test_project).order_by('id').values_list('status',flat=True)
+        self.assertEqual(list(statuses),["created","edited","updated to true"])
+
+    def test_delete_commands(self):
+        response = self.send([
+            {"op":"create","parent":self.component.id,"name":"short lived","ref":"new-1"},
+            {"op":"delete","id":"new-1"},
+            {"op":"delete","id":self.task.id},
+        ])
+        tasks = json.loads(response.content)["tasks"]
+        self.assertTrue(all(task["deleted"] for task in tasks))
+        self.assertEqual(list(ProjectComponent.objects.all()),[self.component])
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        operations = [{"op":"create","parent":self.component.id,"name":f"task {i}","ref":f"new-{i}"} for i in range(50)]
+        operations += [{"op":"toggle","id":self.task.id},{"op":"rename","id":self.task.id,"name":"renamed"}]
+        # the history of the created tasks and of the changed ones is written with one insert each,
+        # the members' versions move with the project's
+        with self.assertNumQueries(26):
+            response = self.send(operations)
+        self.assertEqual(response.status_code,200)
+        self.assertEqual(self.component.get_descendant_count(),51)
+
+    def test_commands_keep_progress_counters(self):
+        response = self.send([
+            {"op":"create","parent":self.task.id,"name":"subtask","ref":"new-1"},
+            {"op":"toggle","id":"new-1"},
+            {"op":"toggle","id":self.task.id},
+            {"op":"create","parent":self.component.id,"name":"doomed","ref":"new-2"},
+            {"op":"delete","id":"new-2"},
+        ])
+        self.assertEqual(response.status_code,200)
+        self.component.refresh_from_db()
+        self.assertEqual((self.component.task_count,self.component.completed_task_count),(2,2))
+        self.send([{"op":"delete","id":self.task.id}])
+        self.component.refresh_from_db()
+        self.test_project.refresh_from_db()
+        self.assertEqual((self.component.task_count,self.component.completed_task_count),(0,0))
+        self.assertEqual((self.test_project.task_count,self.test_project.completed_task_count),(0,0))
+
+    def test_invalid_command_changes_nothing(self):
+        response = self.send([
+            {"op":"rename","id":self.task.id,"name":"renamed"},
+            {"op":"toggle","id":9999},
+        ])
+        self.assertEqual(response.status_code,400)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.name,"test task")
+
+    def test_operations_that_are_not_objects_are_rejected(self):
+        for operations in ([1],["x"],[{"op":"toggle","id":self.task.id},None],"toggle",{"op":"toggle"},
+                           [{"id":self.task.id}],[{"op":["toggle"],"id":self.task.id}],[{"op":"toggle","id":[self.task.id]}],
+                           [{"op":"toggle","id":"²"}],[{"op":"rename","id":self.task.id,"name":{"x":1}}],
+                           [{"op":"create","parent":self.component.id,"name":"new","ref":["new-1"]}]):
+            response = self.send(operations)
+            self.assertEqual(response.status_code,400)
+        request = self.factory.post(self.url,b"\xff{",content_type="application/json")
+        request.user = self.user
+        self.assertEqual(task_commands_ajax(request,self.test_project.slug).status_code,400)
+        self.task.refresh_from_db()
+        self.assertFalse(self.task.completed)
+
+    def test_project_changes_since_a_batch(self):
+        self.test_project.refresh_from_db()
+        since = self.test_project.version
+        response = self.send([
+            {"op":"create","parent":self.component.id,"name":"new task","ref":"new-1"},
+            {"op":"delete","id":self.task.id},
+        ])
+        new_id = json.loads(response.content)["tasks"][0]["id"]
+        request = self.factory.get(reverse('project-changes-ajax',args=[self.test_project.slug]),{'since':since})
+        request.user = self.user
+        data = json.loads(project_changes_ajax(request,self.test_project.slug).content)
+        self.assertEqual(data["version"],since + 1)
+        self.assertFalse(data["full"])
+        self.assertEqual([(c["id"],c["name"]) for c in data["components"]],[(new_id,"new task")])
+        self.assertEqual(data["deleted"],[self.task.id])
+
+
 class TestUserInteractionViews(TestCase):
 
     def setUp(self):
@@ -25,6 +25,7 @@ urlpatterns = [
     path('project-list/delete-project/<pk>/',views.delete_project,name='delete-project'),
     path('project-list/edit-project/<pk>/',views.ProjectEditView.as_view(),name='edit-project'),
     path('project-list/project-detail/history/<pk>/',views.history_view,name='project-history'),
+    path('project-list/project-detail/history/ajax/<pk>/',views.history_page_ajax,name='project-history-ajax'),
 
     # displays the current project component and all project component tasks
     #path('project-component-detail/<project_component_slug>/',project_component_detail_view,name="project-component-detail"),
@@ -35,6 +36,7 @@ urlpatterns = [
     path('project-list/project-detail/project-component-create/<project_slug>/',views.ProjectComponentCreate.as_view(),
     name="project-component-create"),
     
+    path('project-list/project-detail/import/<project_slug>/',views.ProjectImportView.as_view(),name="project-import"),
     path('project-list/project-detail/edit-details/<pk>/',views.edit_component_or_task,name="edit-details"),
     path('finish-task/<pk>/',views.finish_task_detail,name="finish-task"),
     path('delete-task/<pk>/',views.delete_task,name="delete-task"),
@@ -44,6 +46,7 @@ urlpatterns = [
     ############################################
     path('profile/',views.profile,name='profile'),
     path('search/',views.search_user,name="search-user"),
+    path('search/projects/',views.search_projects_view,name="search-projects"),
     path('search/profile/<slug>/',views.profile_view,name="profile-view"),
 
     path('search/send-friend-request/<sent_to>/',views.send_friend_request,name="send-friend-request"),
@@ -57,4 +60,10 @@ urlpatterns = [
     path('ajax/edit-task/',views.edit_task_ajax,name="edit-task-ajax"),
     path('ajax/component-task-create/',views.add_task_ajax,name='create-task-ajax'),
     path('ajax/finish-task-test/',views.finish_task_ajax,name="finish-task-ajax"),
+    path('ajax/task-commands/<project_slug>/',views.task_commands_ajax,name="task-commands-ajax"),
+    path('ajax/project-changes/<project_slug>/',views.project_changes_ajax,name="project-changes-ajax"),
+    path('ajax/search-users/',views.search_users_ajax,name="search-users-ajax"),
+
+    # served by assemble.realtime.events_application under ASGI
+    path('events/projects/<project_slug>/',views.project_events,name="project-events"),
 ]
@@ -1,19 +1,33 @@
 from django.shortcuts import render,redirect,get_object_or_404
 from django.views.generic import ListView
-from django.views.generic.edit import CreateView,UpdateView,DeleteView
+from django.views.generic.edit import CreateView,UpdateView,DeleteView,FormView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
-from .models import Project,ProjectComponent,FriendRequest,Profile,ProjectHistory, ProjectComponentIndex,ProjectIndex
+from django.urls import reverse,reverse_lazy
+from .models import Project,ProjectComponent,FriendRequest,Profile,ProjectHistory,\
+    get_project_component_tree,bulk_create_components,bulk_update_components,get_project_page,PROJECT_SORTS,\
+    next_change_version,record_deletions,get_project_changes,count_tasks
+from django.conf import settings
 from django.contrib import messages
-from django.core.exceptions import ObjectDoesNotExist
 from django.http import HttpResponse,JsonResponse
 
 # django form for creating a user
 from .forms import UserCreationForm,ProjectCreateForm,ProjectEditForm,ComponentEditForm,\
-    UserFeedbackCreateForm,ProjectTaskCreateForm
+    UserFeedbackCreateForm,ProjectTaskCreateForm,ProjectImportForm
+from .importers import import_items
+from . import history,fulltext,realtime
+from .profiles import get_profile
+from .suggestions import suggest_friends
+from .boards import get_board_payload,set_card_versions
+from .landing import landing_page_response
+from .conditional import page_etag,get_profile_stamp,not_modified,with_validators
+from .search import search_users,search_projects,with_relationship_status
+from .routers import read_from_replica
 from django.contrib.auth.decorators import login_required
+from django.utils.decorators import method_decorator
 from django.contrib.auth import login,logout
+from django.db import transaction
 from django.db.models import Q
+from django.core.exceptions import NON_FIELD_ERRORS
 from django.contrib.auth.models import User
 import json
 # Create your views here.
@@ -34,13 +48,8 @@ def index(request):
     Returns:
         [HttpResponse] -- [Points our view to a template to be rendered with the appropriate request.]
     """
-    test_project = ProjectIndex.objects.get(id=1)
-    project_components = ProjectComponentIndex.objects.filter(project__id=1).filter(task=None)
-
-    context = {}
-    context['test_project'] = test_project
-    context['project_components'] = project_components
-    return render(request,'assemble/index.html',context)
+    # the demo board is rendered ahead of time, see assemble/landing.py
+    return landing_page_response(request)
 
 # sign up view
 def sign_up(request):
@@ -57,7 +66,7 @@ def sign_up(request):
     if request.method == 'POST':
         if form.is_valid():
             user= form.save()
-            login(request,user)
+            login(request,user,backend='assemble.profiles.ProfileBackend')
             return redirect('home')
     context['form'] = form
     return render(request,'registration/sign_up.html',context)
@@ -90,6 +99,7 @@ def log_out(request):
 ############################################
 
 # List view of all the projects for a user
+@method_decorator(read_from_replica,name='get')
 class ProjectList(LoginRequiredMixin,ListView):
     """
     A class based view responsible for querying a list of Projects from the database.
@@ -103,20 +113,43 @@ class ProjectList(LoginRequiredMixin,ListView):
         [project_list.html] -- [template that renders the list of projects for a user.]
     """
     model = Project
+    context_object_name = 'project_list'
 
-    # i think I can turn this into one line
-    # I'm using the request data to pull my user instance from it
-    # getting the profile with that user instance
-    # getting the projects associated with that profile
     def get_queryset(self):
         """
         Alter the get_queryset method to specify the queryset to return from the view set.
+        The owner and their user are joined in so the template doesn't query them per project.
 
         Returns:
             [Project model] -- [Returns a queryset of projects for the user signed in.]
         """
-        is_me = Profile.objects.get(user=self.request.user)
-        return Project.objects.filter(user=is_me)
+        return Project.objects.filter(user__user=self.request.user).select_related('owner__user')
+
+    def get(self,request,*args,**kwargs):
+        # a browser that already has this page of the list gets a 304 before the projects are queried
+        etag = page_etag(request,get_profile_stamp(get_profile(request)))
+        response = not_modified(request,etag) or super().get(request,*args,**kwargs)
+        return with_validators(response,etag)
+
+    def get_context_data(self,**kwargs):
+        """
+        Only one page of the projects is rendered. ?sort= picks "activity" (default) or "name",
+        ?cursor= picks the page after the one the cursor came from.
+
+        Returns:
+            [dictionary] -- [The context with the page of projects, the sort and the cursor of the next page.]
+        """
+        sort = self.request.GET.get('sort','activity')
+        if sort not in PROJECT_SORTS:
+            sort = 'activity'
+        try:
+            projects,next_cursor = get_project_page(self.object_list,sort,self.request.GET.get('cursor'))
+        except ValueError:
+            projects,next_cursor = get_project_page(self.object_list,sort)
+        context = super().get_context_data(object_list=projects,**kwargs)
+        context['sort'] = sort
+        context['next_cursor'] = next_cursor
+        return context
 
 
 # view to create more projects
@@ -145,7 +178,7 @@ class ProjectCreate(LoginRequiredMixin,CreateView):
             [kwargs:key word arguments] -- [Key word arguments to build the model form]
         """
         kwargs = super(ProjectCreate,self).get_form_kwargs()
-        kwargs['user'] = self.request.user
+        kwargs['profile'] = get_profile(self.request)
         return kwargs
 
     def form_valid(self,form):
@@ -160,7 +193,7 @@ class ProjectCreate(LoginRequiredMixin,CreateView):
         Returns:
             [http response] -- [If the form has no errors, redirects to another page.]
         """
-        is_me = Profile.objects.get(user=self.request.user)
+        is_me = get_profile(self.request)
         form.instance.owner=is_me
         super().form_valid(form)
         form.instance.user.add(is_me)
@@ -170,6 +203,7 @@ class ProjectCreate(LoginRequiredMixin,CreateView):
         return redirect('project-list')
 
 @login_required
+@read_from_replica
 def project_detail_view(request,project_slug):
     """
     The view for displaying the components of a specific project.
@@ -183,20 +217,28 @@ def project_detail_view(request,project_slug):
     """
 
     # get my profile
-    is_me = Profile.objects.get(user=request.user)
+    is_me = get_profile(request)
 
     # get the project with the project slug passed in from the button
     # maybe I can use project id instead?
     project = Project.objects.filter(user=is_me).get(slug=project_slug)
 
-    # get the components of the project
-    # task=None ensures that the component is not a task!
-    project_components = ProjectComponent.objects.filter(project__name=project).filter(task=None)
+    # a browser that already has this version of the board gets a 304, see assemble/conditional.py
+    etag = page_etag(request,project.version)
+    response = not_modified(request,etag)
+    if response is not None:
+        return with_validators(response,etag,project.last_activity)
+
+    # get the components of the project with their tasks attached
+    # the whole tree is loaded in one query instead of one query per component
+    project_components = get_project_component_tree(project)
+    set_card_versions(project_components)
     context = {
         'project':project,
         'project_components':project_components,
+        'board_cache_timeout':settings.BOARD_CACHE_TIMEOUT,
     }
-    return render(request,'assemble/project_detail.html',context)
+    return with_validators(render(request,'assemble/project_detail.html',context),etag,project.last_activity)
 
 
 @login_required
@@ -245,7 +287,7 @@ class ProjectEditView(LoginRequiredMixin,UpdateView):
             [key word arguments] -- [dictionary containing information for the form]
         """
         kwargs = super(ProjectEditView,self).get_form_kwargs()
-        kwargs['user'] = self.request.user
+        kwargs['profile'] = get_profile(self.request)
         return kwargs
 
     # saves the user editing the form into the project's user field.
@@ -259,7 +301,7 @@ class ProjectEditView(LoginRequiredMixin,UpdateView):
         Returns:
             [http response] -- [returns the user to the project-list view if the form is successfully saved.]
         """
-        is_me = Profile.objects.get(user=self.request.user)
+        is_me = get_profile(self.request)
         super().form_valid(form)
         form.instance.user.add(is_me)
         # needs to return a HttpResponse Object
@@ -267,14 +309,60 @@ class ProjectEditView(LoginRequiredMixin,UpdateView):
         # however when using a m2m relationship, the object needs to be saved FIRST, then relationships can be made.
         return redirect('project-list')
 
+@login_required
+@read_from_replica
 def history_view(request,pk):
-    project = Project.objects.get(id=pk)
-    render_list = ProjectHistory.objects.filter(project__id = pk).order_by('-date_changed')
+    """
+    Displays one page of a project's history, newest first.
+
+    Arguments:
+        request {dictionary} -- [GET, ?cursor= picks the page after the one the cursor came from, ?component= only returns that component's history]
+        pk {int} -- [Primary key of the project.]
+
+    Returns:
+        [http response] -- [The history page.]
+    """
+    # history may be written after the response, history_version moves when it is
+    project = get_object_or_404(Project.objects.filter(user__user=request.user),id=pk)
+    etag = page_etag(request,project.version,project.history_version)
+    response = not_modified(request,etag)
+    if response is not None:
+        return with_validators(response,etag,project.last_activity)
+    component = request.GET.get('component','')
+    component_id = int(component) if component.isdigit() else None
+    try:
+        render_list,next_cursor = history.get_history_page(project.id,request.GET.get('cursor'),component_id=component_id)
+    except ValueError:
+        render_list,next_cursor = history.get_history_page(project.id,component_id=component_id)
     context={
         'project':project,
-        'render_list':render_list
+        'render_list':render_list,
+        'next_cursor':next_cursor,
+        'component_id':component_id,
     }
-    return render(request,'assemble/history.html',context)
+    return with_validators(render(request,'assemble/history.html',context),etag,project.last_activity)
+
+@login_required
+@read_from_replica
+def history_page_ajax(request,pk):
+    """
+    JSON version of history_view for loading older pages without reloading.
+
+    Arguments:
+        request {dictionary} -- [GET, ?cursor= picks the page after the one the cursor came from, ?component= only returns that component's history]
+        pk {int} -- [Primary key of the project.]
+
+    Returns:
+        [http response] -- [JSON with the page of history and the cursor of the next page.]
+    """
+    project = get_object_or_404(Project.objects.filter(user__user=request.user),id=pk)
+    try:
+        component_id = int(request.GET['component']) if request.GET.get('component') else None
+        records,next_cursor = history.get_history_page(project.id,request.GET.get('cursor'),component_id=component_id)
+    except ValueError as error:
+        return JsonResponse({"error":str(error)},status=400)
+    results = [{"id":record.id,"text":record.list_string,"date_changed":record.date_changed} for record in records]
+    return JsonResponse({"results":results,"next":next_cursor})
 
 ############################################
 ### PROJECT COMPONENT/TASK VIEWS
@@ -311,7 +399,6 @@ class ProjectComponentCreate(LoginRequiredMixin,CreateView):
         project = Project.objects.get(slug=self.kwargs['project_slug'])
         form.instance.project = project
         super().form_valid(form)
-        ProjectHistory.objects.create(user=self.request.user.username,previous_field=form.instance.name,status="created",project=form.instance.project)
         messages.success(self.request,f"Added '{form.instance.name}' to {project.name}")
 
         # this takes the models get_absolute_url and redirects to the URL
@@ -329,6 +416,50 @@ class ProjectComponentCreate(LoginRequiredMixin,CreateView):
         context['project'] = project
         return context
 
+class ProjectImportView(LoginRequiredMixin,FormView):
+    """
+    Class based view that creates a whole tree of components and tasks from a pasted outline, checklist or CSV.
+
+    Arguments:
+        LoginRequiredMixin {class} -- [Class that requires our user to login to import.]
+        FormView {class} -- [Class that displays and validates the ProjectImportForm]
+
+    Returns:
+        [http response] -- [redirects the user to the project-detail page if the import worked.]
+    """
+    form_class = ProjectImportForm
+    template_name = "assemble/form_templates/import_project_form.html"
+
+    def dispatch(self,request,*args,**kwargs):
+        if request.user.is_authenticated:
+            self.project = get_object_or_404(Project.objects.filter(user__user=request.user),slug=kwargs['project_slug'])
+        return super().dispatch(request,*args,**kwargs)
+
+    def form_valid(self,form):
+        """
+        Creates every imported item with bulk inserts inside one transaction.
+
+        Arguments:
+            form {form} -- [ProjectImportForm with the parsed items in cleaned_data]
+
+        Returns:
+            [http response] -- [redirects the user to the project-detail page.]
+        """
+        with transaction.atomic():
+            components = import_items(self.project,form.cleaned_data['items'])
+        messages.success(self.request,f"Imported {len(components)} components and tasks into {self.project.name}")
+        return redirect(self.project)
+
+    def form_invalid(self,form):
+        # an upload over the limits is a bad request, mistakes in a plan are shown like any other form error
+        status = 400 if form.has_error(NON_FIELD_ERRORS,'too_large') else 200
+        return self.render_to_response(self.get_context_data(form=form),status=status)
+
+    def get_context_data(self,**kwargs):
+        context = super().get_context_data(**kwargs)
+        context['project'] = self.project
+        return context
+
 @login_required
 def finish_task_detail(request,pk):
     """
@@ -347,10 +478,6 @@ def finish_task_detail(request,pk):
         bf = task.completed
         task.completed = not bf
         task.save()
-        if task.completed == True:
-            ProjectHistory.objects.create(user=request.user.username,previous_field=task.name,updated_field=task.completed,status="updated to true",project=task.project)
-        else:
-            ProjectHistory.objects.create(user=request.user.username,previous_field=task.name,updated_field=task.completed,status="updated to false",project=task.project)
         messages.success(request,f"The task '{task}' completed status was changed to {task.completed}.")
         return redirect(task.project)
 
@@ -371,7 +498,6 @@ def delete_task(request,pk):
     task = get_object_or_404(ProjectComponent,id=pk)
     messages.success(request,f"Successfully deleted {task}")
     task.delete()
-    ProjectHistory.objects.create(user=request.user.username,previous_field=task.name,status="deleted",project=task.project)
     return redirect(task.project)
 
 @login_required
@@ -391,7 +517,6 @@ def edit_component_or_task(request,pk):
     # get the component id
     component = ProjectComponent.objects.get(id=pk)
     context['component'] = component
-    previous_name = component.name
     if request.method == "GET":
         form = ComponentEditForm(instance=component)
         context['form'] = form
@@ -400,8 +525,6 @@ def edit_component_or_task(request,pk):
         # maybe we can create the information here about edited
         form = ComponentEditForm(request.POST,instance=component)
         if form.is_valid():
-            # maybe create the instance here?
-            ProjectHistory.objects.create(user=request.user.username,previous_field=previous_name,updated_field=form.instance.name,status="edited",project=component.project)
             form.save()
             messages.success(request,f"Successfully edited '{component}'")
             return redirect('project-detail',project_slug =component.project.slug)
@@ -411,6 +534,7 @@ def edit_component_or_task(request,pk):
 ### USER INTERACTION VIEWS
 ############################################
 @login_required
+@read_from_replica
 def profile(request):
     """
     Loads the user profile containing current projects, friends and friend requests.
@@ -421,21 +545,28 @@ def profile(request):
     Returns:
         [dictionary] -- [key values pairs that determine the information displayed in the template profile.html]
     """
-    is_me = Profile.objects.get(user=request.user)
+    is_me = get_profile(request)
+    etag = page_etag(request,get_profile_stamp(is_me))
+    response = not_modified(request,etag)
+    if response is not None:
+        return with_validators(response,etag)
     # I think I can query this from my profile instance
     current_projects = Project.objects.filter(user=is_me)
 
     #queryset containing all friend request objects
     friend_requests = FriendRequest.objects.filter(Q(to_user__username=request.user.username) | Q(from_user__username=request.user.username))
+    # people with a pending request either way already know about each other
+    pending = Profile.objects.filter(Q(user__to_user__from_user=request.user) | Q(user__from_user__to_user=request.user))
     context={
         'current_projects':current_projects,
         'profile':is_me,
         'friend_requests':friend_requests,
-
+        'suggestions':suggest_friends(is_me,exclude=pending.values_list('id',flat=True)),
     }
-    return render(request,'assemble/profile.html',context)
+    return with_validators(render(request,'assemble/profile.html',context),etag)
 
 @login_required
+@read_from_replica
 def profile_view(request,slug):
     """
     View responsible for loading another user's profile after searching.
@@ -448,35 +579,21 @@ def profile_view(request,slug):
         [dictionary] -- [dictionary containing details about whether or not you're friend with the user or whether you already sent them a friend request.]
     """
     # using slugs because they are passed in, maybe use id instead?
-
-    p = Profile.objects.filter(slug=slug).first()
-    is_me = Profile.objects.get(user__username=request.user)
+    is_me = get_profile(request)
+    # the profile, its user and whether we're friends or have a pending request come back in one query
+    p = with_relationship_status(Profile.objects.filter(slug=slug).select_related('user'),is_me).first()
     search_query = p.user
-    # need to check if I already sent a friend request to this user
-    # query all the requests from_user== me then filter by to_user
-    try:
-        frequest = FriendRequest.objects.get(
-            to_user=search_query,
-            from_user=request.user,
-        )
-        sent_request = True
-    except ObjectDoesNotExist:
-        sent_request = False
-
-    try:
-        Profile.objects.filter(slug=slug).get(friends=is_me)
-        already_friends=True
-    except ObjectDoesNotExist:
-        already_friends=False
     context={
         'search_query':search_query,
-        'sent_request':sent_request,
-        'already_friends':already_friends
+        'sent_request':p.request_sent,
+        'received_request':p.request_received,
+        'already_friends':p.is_friend
     }
     return render(request,'assemble/profile_view.html',context)
 
 
 @login_required
+@read_from_replica
 def search_user(request):
     """
     View responsible for presenting user's from the search form.
@@ -487,18 +604,42 @@ def search_user(request):
     Returns:
         [http response] -- [If the user that was searched is you, redirects to your profile. Otherwise it returns the user being searched.]
     """
-    try:
-        filtered_user = Profile.objects.get(user__username=request.POST['username'])
-        if request.user.username == filtered_user.user.username:
-            return redirect('profile')
-    except ObjectDoesNotExist:
-        filtered_user = 0
+    if request.user.username == request.POST['username']:
+        return redirect('profile')
+    results,has_next = search_users(request.POST['username'],get_profile(request))
     context={
-        'filtered_user':filtered_user,
+        # 0 tells the template nothing was found
+        'filtered_user':results[0] if results else 0,
+        'results':results,
         'username':request.POST['username']
     }
     return render(request,'assemble/search_user.html',context)
 
+@login_required
+@read_from_replica
+def search_projects_view(request):
+    """
+    View responsible for full-text search across the user's projects, components and tasks.
+
+    Arguments:
+        request {[http response]} -- [GET with the words in q and the page in page]
+
+    Returns:
+        [http response] -- [The ranked results, a page at a time.]
+    """
+    query = request.GET.get('q','')
+    page = int(request.GET['page']) if request.GET.get('page','').isdigit() else 1
+    results,has_next,truncated = search_projects(query,get_profile(request),page)
+    context={
+        'query':query,
+        'results':results,
+        'page':page,
+        'has_next':has_next,
+        'truncated':truncated,
+        'max_candidates':fulltext.SEARCH_MAX_CANDIDATES,
+    }
+    return render(request,'assemble/search_projects.html',context)
+
 @login_required
 def send_friend_request(request,sent_to):
     """
@@ -539,17 +680,15 @@ def accept_friend_request(request,from_user):
     user = get_object_or_404(Profile,user__username=from_user)
 
     #get me from the db
-    is_me = Profile.objects.get(user__username=request.user.username)
+    is_me = get_profile(request)
 
     # add from_user to your friend list
+    # the suggestion index picks the new friendship up from the m2m_changed signal, see suggestions.py
     is_me.friends.add(user)
     # add your profile to their friend list
     user.friends.add(is_me)
     frequest = FriendRequest.objects.get(from_user=user.user,to_user=is_me.user)
 
-    # save
-    is_me.save()
-    user.save()
     # if succesful redirect to delete request
     messages.success(request,f"You and {user} are now friends! You can work on projects together.")
     return redirect('delete-friend-request',frequest.id)
@@ -596,11 +735,7 @@ def finish_task_ajax(request):
         bf = task.completed
         task.completed = not bf
         task.save()
-        # maybe turn this into a function?
-        if task.completed == True:
-            ProjectHistory.objects.create(user=request.user.username,previous_field=task.name,updated_field=task.completed,status="updated to true",project=task.project)
-        else:
-            ProjectHistory.objects.create(user=request.user.username,previous_field=task.name,updated_field=task.completed,status="updated to false",project=task.project)
+        realtime.publish_tasks(task.project_id,[_task_state(task)],_board_client(request))
         json_data = {'name':task.name}
         return JsonResponse(json_data,safe=False)
 
@@ -612,12 +747,10 @@ def edit_task_ajax(request):
         contents = request.POST.dict()
         pk = contents.pop('pk')
         component = ProjectComponent.objects.get(id=pk)
-        previous_name = component.name
         form = ComponentEditForm(contents,instance=component)
         if form.is_valid():
-            # maybe create the instance here?
-            ProjectHistory.objects.create(user=request.user.username,previous_field=previous_name,updated_field=form.instance.name,status="edited",project=component.project)
             form.save()
+            realtime.publish_tasks(component.project_id,[_task_state(component)],_board_client(request))
             json_data = {'name':form.instance.name}
             return JsonResponse(json_data,safe=False)
         
@@ -630,8 +763,9 @@ def delete_task_ajax(request):
         print(request.GET)
         pk = request.GET.get('pk')
         task = ProjectComponent.objects.get(id=pk)
+        state = _task_state(task,deleted=True)
         task.delete()
-        ProjectHistory.objects.create(user=request.user.username,previous_field=task.name,status="deleted",project=task.project)
+        realtime.publish_tasks(task.project_id,[state],_board_client(request))
         json_data = {'name':task.name}
         return JsonResponse(json_data,safe=False)
 
@@ -648,28 +782,258 @@ def add_task_ajax(request):
             new_task.task = component
             new_task.project= component.project
             new_task.save()
-            ProjectHistory.objects.create(user=request.user.username,previous_field=new_task.name,status="created",project=new_task.project)
+            realtime.publish_tasks(new_task.project_id,[_task_state(new_task)],_board_client(request))
             json_data = {"id":new_task.id,"name":new_task.name}
             return JsonResponse(json_data,safe=False)
             
         
 
 @login_required
+@read_from_replica
 def project_detail_ajax(request,project_slug):
     # get my profile
-    is_me = Profile.objects.get(user=request.user)
+    is_me = get_profile(request)
 
     # get the project with the project slug passed in from the button
     # maybe I can use project id instead?
     project = Project.objects.filter(user=is_me).get(slug=project_slug)
 
-    # get the components of the project
-    # task=None ensures that the component is not a task!
-    project_components = ProjectComponent.objects.filter(project__name=project).filter(task=None)
-    context = {
-        'project':project,
-        'project_components':project_components,
-    }
-    dict_of_components = [{component.name:[{"name":task.name,"completed":task.completed,"task":task.id} for task in component.component.all()]} for component in project_components]
+    # the components of the project with their tasks attached, cached until the project changes
+    return HttpResponse(get_board_payload(project),content_type='application/json')
+
+
+def _since_version(request):
+    since = request.GET.get('since','')
+    return int(since) if since.isdigit() else None
+
+@login_required
+@read_from_replica
+def project_changes_ajax(request,project_slug):
+    """
+    Lets a board catch up with what changed since the version it last saw instead of loading the whole project.
+
+    Arguments:
+        request {[http response]} -- [GET, ?since= is the version the board has, leave it out for everything]
+        project_slug {[slugfield]} -- [The slug of the project.]
+
+    Returns:
+        [http response] -- [JSON with the new version and the changed and deleted components and tasks, see get_project_changes.]
+    """
+    project = get_object_or_404(Project.objects.filter(user=get_profile(request)),slug=project_slug)
+    return JsonResponse(get_project_changes(project,_since_version(request)))
+
+
+class InvalidCommand(Exception):
+    pass
 
-    return JsonResponse(dict_of_components,safe=False)
+
+TASK_COMMAND_KEYS = {
+    "create":("parent","name","ref"),
+    "rename":("id","name"),
+    "toggle":("id",),
+    "delete":("id",),
+}
+
+def _is_task_key(value):
+    # a task id, or the ref of a task created earlier in the batch
+    return isinstance(value,str) or (isinstance(value,int) and not isinstance(value,bool))
+
+def _parse_task_commands(body):
+    """
+    Checks the shape of every operation before any of them is applied, see task_commands_ajax.
+
+    :return: The list of operations.
+    """
+    try:
+        contents = json.loads(body)
+    except ValueError:
+        raise InvalidCommand("Task commands have to be a JSON object with a list of operations.")
+    if not isinstance(contents,dict) or not isinstance(contents.get("operations"),list):
+        raise InvalidCommand("Task commands have to be a JSON object with a list of operations.")
+    operations = contents["operations"]
+    for operation in operations:
+        if not isinstance(operation,dict):
+            raise InvalidCommand("Operations have to be a list of JSON objects.")
+        op = operation.get("op")
+        if not isinstance(op,str) or op not in TASK_COMMAND_KEYS:
+            raise InvalidCommand(f"Unknown operation {op!r}.")
+        for key in TASK_COMMAND_KEYS[op]:
+            value = operation.get(key)
+            if key == "name" and not isinstance(value,str):
+                raise InvalidCommand(f"Invalid task name {value!r}.")
+            if key == "id" and not _is_task_key(value):
+                raise InvalidCommand(f"Task {value!r} does not exist.")
+            if key in ("parent","ref") and value is not None and not _is_task_key(value):
+                raise InvalidCommand(f"Invalid {key} {value!r}.")
+    return operations
+
+
+def _task_state(task,ref=None,deleted=False):
+    return {"id":task.pk,"ref":ref,"name":task.name,"completed":task.completed,"parent":task.task_id,"deleted":deleted}
+
+
+def _board_client(request):
+    # a random id each open board sends with its changes, it skips its own changes when they come back
+    return request.META.get('HTTP_X_BOARD_CLIENT')
+
+
+@login_required
+def project_events(request,project_slug):
+    """
+    The event stream of a project board is served by assemble.realtime under ASGI, this only answers when
+    the site runs under WSGI.
+
+    Arguments:
+        request {[http response]} -- [GET]
+        project_slug {[slugfield]} -- [The slug of the project.]
+
+    Returns:
+        [http response] -- [204, which tells the board's EventSource not to reconnect.]
+    """
+    return HttpResponse(status=204)
+
+
+@login_required
+@read_from_replica
+def search_users_ajax(request):
+    """
+    Typeahead for the user search box.
+
+    Arguments:
+        request {[http response]} -- [GET, ?q= is the text typed so far and ?page= the page of results]
+
+    Returns:
+        [http response] -- [JSON with the ranked matches, how they relate to the user searching and the next page if there is one.]
+    """
+    page = request.GET.get('page','1')
+    page = int(page) if page.isdigit() else 1
+    results,has_next = search_users(request.GET.get('q',''),get_profile(request),page)
+    results = [{
+        "username":profile.user.username,
+        "url":reverse('profile-view',args=[profile.slug]),
+        "relationship":profile.relationship,
+    } for profile in results]
+    return JsonResponse({"results":results,"next":page + 1 if has_next else None})
+
+
+@login_required
+def task_commands_ajax(request,project_slug):
+    """
+    Applies an ordered batch of task operations in one request and one transaction.
+    The body is JSON: {"operations":[...]} where each operation is one of
+        {"op":"create","parent":<id or ref>,"name":<name>,"ref":<client reference>}
+        {"op":"rename","id":<id or ref>,"name":<name>}
+        {"op":"toggle","id":<id or ref>}
+        {"op":"delete","id":<id or ref>}
+    A ref lets later operations in the same batch point at a task created earlier in it.
+
+    Arguments:
+        request {[http response]} -- [POST]
+        project_slug {[slugfield]} -- [The slug of the project the tasks belong to.]
+
+    Returns:
+        [http response] -- [JSON with the resulting state of every task that was touched, or an error with status 400.]
+    """
+    if request.method != 'POST':
+        return JsonResponse({"error":"Task commands have to be sent with POST."},status=405)
+    is_me = get_profile(request)
+    project = get_object_or_404(Project.objects.filter(user=is_me),slug=project_slug)
+    try:
+        tasks = _apply_task_commands(project,_parse_task_commands(request.body))
+    except InvalidCommand as error:
+        return JsonResponse({"error":str(error)},status=400)
+    # tasks created and deleted in the same batch never existed for anyone else
+    realtime.publish_tasks(project.id,[task for task in tasks if task["id"]],_board_client(request))
+    return JsonResponse({"tasks":tasks})
+
+
+def _apply_task_commands(project,operations):
+    # every existing task mentioned in the batch is loaded with one query
+    mentioned = set()
+    for operation in operations:
+        for key in ("id","parent"):
+            if str(operation.get(key,"")).isdecimal():
+                mentioned.add(int(operation[key]))
+    tasks = {task.pk:task for task in ProjectComponent.objects.filter(project=project,pk__in=mentioned)}
+    refs = {}
+    created,changed,deleted = [],{},{}
+    touched = {}
+
+    def is_deleted(task):
+        # tasks created in this batch are followed up to an existing parent, existing tasks are checked by path
+        while task.pk is None:
+            if id(task) in deleted:
+                return True
+            if task.task is None:
+                return False
+            task = task.task
+        return any(task.path.startswith(other.path) for other in deleted.values() if other.pk)
+
+    def find(key):
+        if key is None:
+            return None
+        task = refs.get(key) or tasks.get(int(key) if str(key).isdecimal() else None)
+        if task is None or is_deleted(task):
+            raise InvalidCommand(f"Task {key} does not exist.")
+        return task
+
+    for operation in operations:
+        op = operation["op"]
+        if op == "create":
+            form = ProjectTaskCreateForm({"name":operation.get("name")})
+            if not form.is_valid():
+                raise InvalidCommand(f"Invalid task name {operation.get('name')!r}.")
+            task = form.save(commit=False)
+            task.task = find(operation.get("parent"))
+            task.project = project
+            if operation.get("ref"):
+                refs[operation["ref"]] = task
+            created.append(task)
+            touched[id(task)] = (task,operation.get("ref"))
+        elif op in ("rename","toggle","delete"):
+            task = find(operation.get("id"))
+            touched.setdefault(id(task),(task,None))
+            if op == "rename":
+                form = ComponentEditForm({"name":operation.get("name")})
+                if not form.is_valid():
+                    raise InvalidCommand(f"Invalid task name {operation.get('name')!r}.")
+                task.name = form.cleaned_data["name"]
+                changed[id(task)] = task
+            elif op == "toggle":
+                task.completed = not task.completed
+                changed[id(task)] = task
+            else:
+                deleted[id(task)] = task
+        else:
+            raise InvalidCommand(f"Unknown operation {op!r}.")
+
+    with transaction.atomic():
+        version = next_change_version(project.id)
+        progress = []
+        existing_deleted = [task for task in deleted.values() if task.pk]
+        if existing_deleted:
+            subtrees = Q()
+            for task in existing_deleted:
+                subtrees |= Q(path__startswith=task.path)
+            doomed = ProjectComponent.objects.filter(subtrees)
+            rows = list(doomed.values_list('id','path','completed'))
+            for task in existing_deleted:
+                if not any(task.path != other.path and task.path.startswith(other.path) for other in existing_deleted):
+                    subtree = [completed for _,path,completed in rows if path.startswith(task.path)]
+                    # the stored value, a toggle earlier in the batch hasn't been saved
+                    root_completed = sum(completed for _,path,completed in rows if path == task.path)
+                    total,completed = count_tasks(task.path,len(subtree),sum(subtree),root_completed)
+                    progress.append((project.id,task.path,-total,-completed))
+            fulltext.remove_components([pk for pk,_,_ in rows])
+            record_deletions(project.id,[pk for pk,_,_ in rows],version)
+            doomed.delete()
+        created = [task for task in created if not is_deleted(task)]
+        changed = [task for task in changed.values() if task.pk and not is_deleted(task)]
+        progress += [(project.id,task.path,0,1 if task.completed else -1) for task in changed
+                     if task.completed != task._loaded_completed and task.task_id]
+        bulk_create_components(created,progress,version)
+        for task in changed:
+            task.version = version
+        bulk_update_components(changed,['name','completed','version'])
+        fulltext.index_components([task for task in changed if task.name != task._loaded_name])
+    return [_task_state(task,ref,is_deleted(task)) for task,ref in touched.values()]
@@ -13,4 +13,11 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# project boards keep an event stream open and call a few small JSON endpoints all the time,
+# those are served on the event loop without going through a sync Django view
+from assemble.async_views import async_application
+from assemble.realtime import events_application
+
+application = async_application(events_application(django_application))
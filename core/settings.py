@@ -14,7 +14,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
-from decouple import config
+from decouple import config,Csv
 from dj_database_url import parse as dburl
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,25 +41,52 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'assemble',
+    'assemble.apps.AssembleConfig',
     'crispy_forms',
-    'simple_history'
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # outside the session middleware so saving a session counts as a write, see assemble/routers.py
+    'assemble.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # puts history on the signed in user, see assemble/history.py
+    'assemble.history.HistoryUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'simple_history.middleware.HistoryRequestMiddleware'
+    'assemble.profiles.ProfileMiddleware',
 ]
 
+# ProfileBackend loads the profile together with the user, see assemble/profiles.py.
+# ModelBackend stays so sessions it made keep working.
+AUTHENTICATION_BACKENDS = [
+    'assemble.profiles.ProfileBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+# seconds the signed in user and their profile are cached between requests, 0 turns the cache off
+PROFILE_CACHE_TIMEOUT = config('PROFILE_CACHE_TIMEOUT',default=0,cast=int)
+# The cache behind the two settings above and below. With more than one process it should be shared,
+# e.g. CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache and CACHE_LOCATION=127.0.0.1:11211.
+CACHES = {
+    'default':{
+        'BACKEND':config('CACHE_BACKEND',default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION':config('CACHE_LOCATION',default=''),
+    }
+}
+# bytes a plan uploaded to the project import can have, see assemble/importers.py
+IMPORT_MAX_UPLOAD_SIZE = config('IMPORT_MAX_UPLOAD_SIZE',default=1024 * 1024,cast=int)
+# seconds a serialized project board and the rendered component cards are kept, 0 turns the caches off, see assemble/boards.py
+BOARD_CACHE_TIMEOUT = config('BOARD_CACHE_TIMEOUT',default=3600,cast=int)
+
 ROOT_URLCONF = 'core.urls'
 
+# flushes queued history before the test database goes, see core/test_runner.py
+TEST_RUNNER = 'core.test_runner.HistoryFlushingRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -86,7 +113,41 @@ default_dburl = 'sqlite:///' + os.path.join(BASE_DIR,'db.sqlite3')
 DATABASES = {
     'default': config('DATABASE_URL',default=default_dburl,cast=dburl)
 }
-
+# read replicas of default, comma separated database URLs. Read-only views read from them, see assemble/routers.py.
+# Locally a second SQLite file kept up to date by the sync_sqlite_replica command stands in for one.
+for i,url in enumerate(config('DATABASE_REPLICA_URLS',default='',cast=Csv())):
+    DATABASES[f'replica{i + 1}'] = dict(dburl(url),TEST={'MIRROR':'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['assemble.routers.ReplicaRouter']
+# seconds a browser reads from default after it changed something, longer than the replicas usually lag
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS',default=15,cast=int)
+# connections to Postgres one process keeps open and reuses between requests, 0 opens one per request,
+# see assemble/backends/pool.py
+DB_POOL_SIZE = config('DB_POOL_SIZE',default=10,cast=int)
+for database in DATABASES.values():
+    # dj_database_url still names the backend by the module Django 3.0 removed
+    if database['ENGINE'] in ('django.db.backends.postgresql','django.db.backends.postgresql_psycopg2'):
+        database['ENGINE'] = 'django.db.backends.postgresql'
+        if DB_POOL_SIZE:
+            database['ENGINE'] = 'assemble.backends.postgresql_pool'
+            database['CONN_MAX_AGE'] = 0
+            database['POOL'] = {
+                'MAX_SIZE':DB_POOL_SIZE,
+                'MAX_LIFETIME':config('DB_POOL_MAX_LIFETIME',default=3600,cast=int),
+                'TIMEOUT':config('DB_POOL_TIMEOUT',default=10.0,cast=float),
+                'CHECK_IDLE':config('DB_POOL_CHECK_IDLE',default=30.0,cast=float),
+            }
+    # SQLite with WAL and writers queued one at a time across the workers, see assemble/backends/sqlite_wal/base.py.
+    # Opt in with SQLITE_WAL=True on a server: WAL is written into the database file's header and leaves -wal and
+    # -shm files next to it, which the development database checked into the repository shouldn't get.
+    if database['ENGINE'] == 'django.db.backends.sqlite3' and config('SQLITE_WAL',default=False,cast=bool):
+        database['ENGINE'] = 'assemble.backends.sqlite_wal'
+        # seconds a write waits for the database before it fails with "database is locked"
+        database.setdefault('OPTIONS',{})['timeout'] = config('SQLITE_BUSY_TIMEOUT',default=30.0,cast=float)
+        database['SQLITE'] = {
+            'MMAP_SIZE':config('SQLITE_MMAP_SIZE',default=256 * 1024 * 1024,cast=int),
+            'CACHE_SIZE':config('SQLITE_CACHE_SIZE',default=64 * 1024,cast=int),
+        }
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -126,4 +187,27 @@ USE_TZ = True
 STATIC_ROOT = os.path.join(BASE_DIR,'staticfiles')
 STATIC_URL = '/static/'
 LOGIN_REDIRECT_URL = 'home'
+
+# How ProjectHistory rows are written, see assemble/history.py.
+# "sync" inserts each row in the request, "buffered" queues them and bulk inserts them after the response is sent,
+# "spill" does the same but also keeps the queued rows in HISTORY_SPILL_DIR until they are written.
+# Deployments opt into buffering, scripts, tests and the shell write straight away.
+HISTORY_WRITE_MODE = config('HISTORY_WRITE_MODE',default='sync')
+HISTORY_BUFFER_SIZE = config('HISTORY_BUFFER_SIZE',default=200,cast=int)
+HISTORY_FLUSH_INTERVAL = config('HISTORY_FLUSH_INTERVAL',default=5.0,cast=float)
+HISTORY_SPILL_DIR = config('HISTORY_SPILL_DIR',default=os.path.join(BASE_DIR,'history_spill'))
+# How much every change to a model is recorded with, by model label. Models that aren't listed get "event".
+# "event" stores what changed, "row" also stores a JSON snapshot of the whole row after the change, "none" records nothing.
+HISTORY_GRANULARITY = {
+    'assemble.Project':'event',
+    'assemble.ProjectComponent':'event',
+    'assemble.Profile':'event',
+}
+# entries older than this many days are rolled up into one summary per project and day by compact_history
+HISTORY_ROLLUP_AFTER_DAYS = config('HISTORY_ROLLUP_AFTER_DAYS',default=90,cast=int)
+# seconds before the in-memory friend suggestion index is rebuilt to pick up changes from other processes
+SUGGESTION_INDEX_MAX_AGE = config('SUGGESTION_INDEX_MAX_AGE',default=300,cast=int)
+# How live board updates reach the other processes, see assemble/realtime.py.
+# LocalBackend only reaches boards connected to the same process, PostgresBackend uses LISTEN/NOTIFY.
+REALTIME_BACKEND = config('REALTIME_BACKEND',default='assemble.realtime.LocalBackend')
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
@@ -0,0 +1,13 @@
+from django.test.runner import DiscoverRunner
+from assemble import history
+
+
+class HistoryFlushingRunner(DiscoverRunner):
+    """
+    Writes the history still queued by buffered tests into the test database before it is dropped.
+    Left for the flush at exit, it would go into the database the settings point at by then, the real one.
+    """
+
+    def teardown_databases(self,old_config,**kwargs):
+        history.flush()
+        super().teardown_databases(old_config,**kwargs)